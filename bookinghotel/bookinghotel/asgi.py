@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookinghotel.settings')
+os.environ.setdefault('SILK_MIDDLEWARE', '0')
 
 application = get_asgi_application()
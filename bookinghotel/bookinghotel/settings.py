@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainapp.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,9 +51,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
 ]
 
+# silk's middleware is sync-only: under ASGI it would push every async view back onto a thread
+if os.environ.get('SILK_MIDDLEWARE', '1') == '1':
+    MIDDLEWARE.append('silk.middleware.SilkyMiddleware')
+
 ROOT_URLCONF = 'bookinghotel.urls'
 
 AUTH_USER_MODEL = 'mainapp.User'
@@ -146,6 +150,13 @@ AWS_S3_SECURE_URLS = False
 AWS_S3_URL_PROTOCOL = "http:"
 AWS_S3_CUSTOM_DOMAIN = f"192.168.8.223:9000/{MINIO_BUCKET_NAME}"
 MEDIA_URL = f"http://{AWS_S3_CUSTOM_DOMAIN}/"
+# where browsers reach MinIO; presigned upload URLs are signed for this host
+MINIO_PUBLIC_ENDPOINT = os.getenv("MINIO_PUBLIC_ENDPOINT", f"http://{AWS_S3_CUSTOM_DOMAIN.split('/')[0]}")
+
+IMAGE_UPLOAD_URL_EXPIRY = 15 * 60
+# well inside the day after which the bucket expires unconfirmed uploads
+IMAGE_UPLOAD_CONFIRM_WINDOW = 60 * 60
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
 
 
 STORAGES = {
@@ -166,6 +177,14 @@ STORAGES = {
     },
 }
 
+# renditions of hotel and room images: name -> (width, height, crop); cropped variants are exactly
+# that size, the others keep the aspect ratio and fit inside it
+IMAGE_VARIANTS = {
+    'thumb': (320, 240, True),
+    'medium': (960, 720, False),
+    'large': (1920, 1440, False),
+}
+
 
 if DEBUG or 'test' in sys.argv:
     REST_FRAMEWORK = {
@@ -182,18 +201,38 @@ REST_FRAMEWORK = {
         # 'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'mainapp.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'mainapp.renderers.StreamingJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'mainapp.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'mainapp.pagination.IdCursorPagination',
+    'PAGE_SIZE': 50,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'mainapp.throttling.BurstRateThrottle',
+        'mainapp.throttling.SustainedRateThrottle',
     ],
+    # token buckets per user or client IP; views with a throttle_scope use "<scope>.burst" and "<scope>.sustained"
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '15/minute',
-        'user': '100/minute',
-        'burst': '10/minute',
-        'sustained': '100/hour'
+        'burst': '60/minute',
+        'sustained': '1000/hour',
+        'catalogue.burst': '120/minute',
+        'catalogue.sustained': '3000/hour',
+        'reserve.burst': '5/minute',
+        'reserve.sustained': '30/hour',
+        'register.burst': '3/minute',
+        'register.sustained': '10/hour',
     }
 }
 
+# where the throttles keep their buckets; mainapp.throttling.MemoryRateLimiter works without Redis
+RATE_LIMITER = 'mainapp.throttling.RedisRateLimiter'
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Hotel API',
     'DESCRIPTION': 'A simple Product & Order API that helps us learn Django REST Framework',
@@ -220,3 +259,46 @@ CACHES = {
 
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+CELERY_BEAT_SCHEDULE = {
+    'confirm-pending-bookings': {
+        'task': 'mainapp.tasks.confirm_pending_bookings',
+        'schedule': 10.0,
+    },
+    'expire-stale-bookings': {
+        'task': 'mainapp.tasks.expire_stale_bookings',
+        'schedule': 60.0,
+    },
+}
+
+# /metrics requires "Authorization: Bearer <token>"; without a token it is only served when DEBUG is on
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+def silk_intercept(request):
+    # imported per call: settings load before the apps, and mainapp.profiling pulls in storage and gprof2dot
+    from mainapp.profiling import should_profile
+
+    return should_profile(request)
+
+
+# Silk records only the requests mainapp.profiling.should_profile picks, each with its SQL and a cProfile run
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+# regexes searched in the request path, e.g. PROFILING_PATHS=^/api/search/,^/api/hotels/
+PROFILING_PATHS = [pattern for pattern in os.getenv('PROFILING_PATHS', '').split(',') if pattern]
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_RESULT_PATH = os.getenv('PROFILING_RESULT_PATH', BASE_DIR / 'profiles')
+
+SILKY_INTERCEPT_FUNC = silk_intercept
+SILKY_PYTHON_PROFILER = True
+SILKY_PYTHON_PROFILER_BINARY = True
+SILKY_PYTHON_PROFILER_EXTENDED_FILE_NAME = True
+SILKY_STORAGE_CLASS = 'mainapp.profiling.ProfileStorage'
+SILKY_AUTHENTICATION = True
+SILKY_AUTHORISATION = True
+SILKY_MAX_RECORDED_REQUESTS = 10 ** 3
+
+# reservations wait this long before the batch confirmer picks them up
+BOOKING_CONFIRMATION_DELAY = timedelta(seconds=30)
+BOOKING_CONFIRMATION_BATCH_SIZE = 500
+# pending bookings older than this get a last confirmation attempt, then are cancelled
+BOOKING_PENDING_MAX_AGE = timedelta(minutes=15)
@@ -0,0 +1,65 @@
+"""
+Self-contained settings for load tests and benchmarks: no Postgres, Redis or MinIO needed.
+
+    python manage.py loadtest --settings=bookinghotel.settings_bench
+
+Set BENCH_POSTGRES_DB (plus the usual POSTGRES_* variables) to measure against a local
+Postgres instead of SQLite.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, MIDDLEWARE, REST_FRAMEWORK
+
+LOADTEST_PROFILE = True
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+if os.getenv('BENCH_POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('BENCH_POSTGRES_DB'),
+            'USER': os.getenv('POSTGRES_USER'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('BENCH_SQLITE_PATH', BASE_DIR / 'bench.sqlite3'),
+            # concurrent clients write too; wait for the lock instead of failing
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.InMemoryStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+CELERY_TASK_ALWAYS_EAGER = True
+
+# even sampled, silk's bookkeeping and the profiler would skew the numbers
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if not middleware.startswith('silk.')]
+
+# throttling would turn most requests into 429s
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=[])
+RATE_LIMITER = 'mainapp.throttling.MemoryRateLimiter'
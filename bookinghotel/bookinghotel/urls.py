@@ -3,11 +3,17 @@ from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from mainapp.views import metrics_view, upload_stand_in_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('',include('mainapp.urls')),
     # api
     path('api/', include('mainapp.api_urls')),
+    # prometheus
+    path('metrics', metrics_view, name='metrics'),
+    # presigned upload target when the default storage is not S3
+    path('upload-stand-in/<str:token>/', upload_stand_in_view, name='image-upload-stand-in'),
     # silk
     path('silk/', include('silk.urls', namespace='silk')),
     # swagger
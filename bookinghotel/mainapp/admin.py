@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import User,City,Hotel,Room,Booking,Review
+from .models import User,City,Hotel,Room,RoomNight,Booking,Review
 
 admin.site.register(User)
 admin.site.register(City)
 admin.site.register(Hotel)
 admin.site.register(Room)
+admin.site.register(RoomNight)
 admin.site.register(Booking)
 admin.site.register(Review)
\ No newline at end of file
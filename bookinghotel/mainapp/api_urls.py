@@ -4,7 +4,10 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from .api_views import CityViewSet, HotelViewSet, RoomViewSet, HotelListByCityAPIView, RoomListByHotelAPIView, \
     ReviewListCreateAPIView, ReviewDeleteAPIView, UserProfileAPIView, UserReviewListAPIView, UserReviewDeleteAPIView, \
-    RoomReserveAPIView, UserBookingListAPIView, CancelBookingAPIView, UserBookingDetailAPIView, RegisterAPIView
+    RoomReserveAPIView, UserBookingListAPIView, CancelBookingAPIView, UserBookingDetailAPIView, RegisterAPIView, \
+    HotelSearchAPIView, ExportAPIView, ImageUploadAPIView, ImageUploadConfirmAPIView
+from .async_views import AsyncHotelListView, AsyncHotelDetailView, AsyncRoomListByHotelView, AsyncReviewListView, \
+    AsyncHotelSearchView
 
 router = DefaultRouter()
 router.register(r'cities', CityViewSet, basename='city')
@@ -15,6 +18,7 @@ urlpatterns = [
     # api
     path('', include(router.urls)),
     path('cities/<int:city_id>/hotels/', HotelListByCityAPIView.as_view(), name='hotels-by-city'),
+    path('search/', HotelSearchAPIView.as_view(), name='hotel-search'),
     path('hotels/<int:hotel_id>/rooms/', RoomListByHotelAPIView.as_view(), name='rooms-by-hotel'),
     path('hotels/<int:hotel_id>/reviews/', ReviewListCreateAPIView.as_view(), name='hotel-reviews-list-create'),
     path('hotels/<int:hotel_id>/reviews/<int:pk>/', ReviewDeleteAPIView.as_view(), name='review-delete'),
@@ -25,6 +29,15 @@ urlpatterns = [
     path('user/reserves/', UserBookingListAPIView.as_view(), name='user-reserves'),
     path('user/reserves/<int:pk>/', UserBookingDetailAPIView.as_view(), name='user-booking-detail'),
     path('user/reserves/<int:booking_id>/cancel/', CancelBookingAPIView.as_view(), name='cancel-booking'),
+    path('admin/exports/<str:kind>/', ExportAPIView.as_view(), name='admin-export'),
+    path('uploads/confirm/', ImageUploadConfirmAPIView.as_view(), name='image-upload-confirm'),
+    path('uploads/<str:target>/<int:pk>/', ImageUploadAPIView.as_view(), name='image-upload'),
+    # async read path, served by the ASGI workers
+    path('async/hotels/', AsyncHotelListView.as_view(), name='async-hotel-list'),
+    path('async/hotels/<int:pk>/', AsyncHotelDetailView.as_view(), name='async-hotel-detail'),
+    path('async/hotels/<int:hotel_id>/rooms/', AsyncRoomListByHotelView.as_view(), name='async-rooms-by-hotel'),
+    path('async/hotels/<int:hotel_id>/reviews/', AsyncReviewListView.as_view(), name='async-hotel-reviews'),
+    path('async/search/', AsyncHotelSearchView.as_view(), name='async-hotel-search'),
     path('auth/register/', RegisterAPIView.as_view(), name='register'),
     path('auth/login/', TokenObtainPairView.as_view(), name='login'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
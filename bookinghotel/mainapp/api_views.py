@@ -1,23 +1,36 @@
-from django.db.models import Avg
+from django.conf import settings
+from django.http import StreamingHttpResponse, Http404
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import extend_schema
-from rest_framework import viewsets, permissions, status, generics
+from rest_framework import viewsets, permissions, status, generics, serializers
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.core.cache import cache
-from .tasks import confirm_booking
-
-from .models import City, Hotel, Room, Review, Booking, User
+from .caching import CachedListMixin, CachedRetrieveMixin
+from .exports import EXPORTS, stream_export
+from .pagination import NewestFirstCursorPagination, CheapestFirstCursorPagination, RankedPagination, \
+    ReviewCursorPagination
+from .renderers import StreamingListMixin
+from .rows import BookingRows, HotelRows, RoomRows, RowsReadMixin
+from .search import search_hotels
+from .uploads import UPLOAD_TARGETS, attach, attached_name, image_storage, issue
+
+from .models import City, Hotel, Room, Review, Booking, User, RATINGS, rating_count_field
 from .serializers import CitySerializer, HotelSerializer, RoomSerializer, ReviewSerializer, UserSerializer, \
-    BookingSerializer, RoomReserveSerializer, RegisterSerializer
+    BookingSerializer, RoomReserveSerializer, RegisterSerializer, AvailabilitySearchSerializer, \
+    HotelSearchResultSerializer, HotelTextSearchSerializer, ExportQuerySerializer, ImageUploadSerializer, \
+    ImageUploadConfirmSerializer, ReviewListQuerySerializer
 
 
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(CachedRetrieveMixin, viewsets.ModelViewSet):
     queryset = City.objects.all()
     serializer_class = CitySerializer
+    throttle_scope = 'catalogue'
+    detail_cache_name = "city"
     http_method_names = ['get', 'post', 'put', 'delete']
 
     def get_permissions(self):
@@ -28,63 +41,164 @@ class CityViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class HotelViewSet(viewsets.ModelViewSet):
-    queryset = Hotel.objects.all()
+class HotelViewSet(StreamingListMixin, RowsReadMixin, CachedListMixin, CachedRetrieveMixin, viewsets.ModelViewSet):
+    queryset = Hotel.objects.select_related('city')
     serializer_class = HotelSerializer
+    throttle_scope = 'catalogue'
+    rows_class = HotelRows
+    cache_name = "hotels_list"
+    cache_namespaces = ('hotels', 'cities')
+    detail_cache_name = "hotel"
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['id', 'rating_avg']
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search']:
             return [AllowAny()]
         return [IsAdminUser()]
 
-    def list(self, request, *args, **kwargs):
-        cache_key = "hotels_list"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return Response(cached_data)
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        min_rating = self.request.query_params.get('min_rating')
+        if self.action == 'list' and min_rating:
+            min_rating = serializers.FloatField(min_value=0, max_value=5).run_validation(min_rating)
+            queryset = queryset.filter(rating_avg__gte=min_rating)
+        return queryset
 
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        data = serializer.data
+    @extend_schema(
+        parameters=[HotelTextSearchSerializer],
+        description="Full-text search over hotel name, city, address and description, best matches first."
+    )
+    # /api/search/ already owns "hotel-search"
+    @action(detail=False, methods=['get'], url_name='text-search')
+    def search(self, request):
+        params = HotelTextSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
 
-        cache.set(cache_key, data, timeout=300)
+        queryset = search_hotels(self.get_queryset(), params.validated_data['q'])
+        paginator = RankedPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-        return Response(data)
+    def get_object_cache_namespaces(self, row):
+        return [f"hotel:{row['id']}", f"city:{row['city_id']}"]
 
 
-class RoomViewSet(viewsets.ModelViewSet):
-    queryset = Room.objects.all()
+class RoomViewSet(StreamingListMixin, RowsReadMixin, CachedListMixin, CachedRetrieveMixin, viewsets.ModelViewSet):
+    queryset = Room.objects.select_related('hotel__city')
     serializer_class = RoomSerializer
+    throttle_scope = 'catalogue'
+    rows_class = RoomRows
+    cache_name = "rooms_list"
+    cache_namespaces = ('rooms', 'hotels', 'cities')
+    detail_cache_name = "room"
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [AllowAny()]
         return [IsAdminUser()]
 
+    def get_object_cache_namespaces(self, row):
+        namespaces = [f"room:{row['id']}", f"hotel:{row['hotel_id']}"]
+        if 'hotel__city_id' in row:
+            # the expanded hotel embeds its city
+            namespaces.append(f"city:{row['hotel__city_id']}")
+        return namespaces
 
-class HotelListByCityAPIView(generics.ListAPIView):
+
+class HotelListByCityAPIView(StreamingListMixin, RowsReadMixin, CachedListMixin, generics.ListAPIView):
     serializer_class = HotelSerializer
+    throttle_scope = 'catalogue'
+    rows_class = HotelRows
+    cache_name = "hotels_by_city"
+
+    def get_cache_namespaces(self):
+        return [f"city:{self.kwargs['city_id']}:hotels"]
 
     def get_queryset(self):
-        return Hotel.objects.filter(city_id=self.kwargs['city_id'])
+        return Hotel.objects.select_related('city').filter(city_id=self.kwargs['city_id'])
 
 
-class RoomListByHotelAPIView(generics.ListAPIView):
+class RoomListByHotelAPIView(StreamingListMixin, RowsReadMixin, CachedListMixin, generics.ListAPIView):
     serializer_class = RoomSerializer
+    throttle_scope = 'catalogue'
+    rows_class = RoomRows
+    cache_name = "rooms_by_hotel"
+
+    def get_cache_namespaces(self):
+        return [f"hotel:{self.kwargs['hotel_id']}:rooms", 'cities']
 
     def get_queryset(self):
         hotel_id = self.kwargs['hotel_id']
-        return Room.objects.filter(hotel_id=hotel_id)
+        return Room.objects.select_related('hotel__city').filter(hotel_id=hotel_id)
+
+
+class HotelSearchAPIView(StreamingListMixin, generics.ListAPIView):
+    serializer_class = HotelSearchResultSerializer
+    throttle_scope = 'catalogue'
+    permission_classes = [AllowAny]
+    pagination_class = CheapestFirstCursorPagination
+
+    @extend_schema(
+        parameters=[AvailabilitySearchSerializer],
+        description="Hotels with a room free for every night of the stay, with the cheapest matching room."
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        params = AvailabilitySearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        return available_hotels(params.validated_data)
+
+
+def available_hotels(data):
+    room_filters = {}
+    if 'room_type' in data:
+        room_filters['room_type'] = data['room_type']
+    if 'min_price' in data:
+        room_filters['price_per_night__gte'] = data['min_price']
+    if 'max_price' in data:
+        room_filters['price_per_night__lte'] = data['max_price']
+
+    queryset = Hotel.objects.select_related('city').with_cheapest_available_room(
+        data['check_in'], data['check_out'], **room_filters
+    )
+    if 'city' in data:
+        queryset = queryset.filter(city_id=data['city'])
+    return queryset
+
+
+RATING_SUMMARY_FIELDS = ('rating_avg', 'rating_count', *(rating_count_field(rating) for rating in RATINGS))
+
+
+def rating_summary(row):
+    """Average, count and per-star histogram of a hotel's reviews from a RATING_SUMMARY_FIELDS row."""
+    row = row or {}
+    return {
+        'average_rating': row.get('rating_avg', 0),
+        'review_count': row.get('rating_count', 0),
+        'rating_histogram': {str(rating): row.get(rating_count_field(rating), 0) for rating in RATINGS},
+    }
 
 
 class ReviewListCreateAPIView(generics.ListCreateAPIView):
     serializer_class = ReviewSerializer
+    throttle_scope = 'catalogue'
     permission_classes = [permissions.AllowAny]
+    pagination_class = ReviewCursorPagination
+
+    @extend_schema(
+        parameters=[ReviewListQuerySerializer],
+        description="A page of the hotel's reviews, newest or highest rated first, with the summary of all of them."
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
         hotel_id = self.kwargs['hotel_id']
-        return Review.objects.filter(hotel_id=hotel_id)
+        return Review.objects.select_related('user').filter(hotel_id=hotel_id)
 
     def perform_create(self, serializer):
         hotel_id = self.kwargs['hotel_id']
@@ -92,19 +206,24 @@ class ReviewListCreateAPIView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user, hotel=hotel)
 
     def list(self, request, *args, **kwargs):
+        ReviewListQuerySerializer(data=request.query_params).is_valid(raise_exception=True)
         queryset = self.get_queryset()
-        reviews = queryset.all()
-        average_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-        serializer = self.get_serializer(reviews, many=True)
+        # one row of counters kept up to date by the review signals, however many reviews there are
+        hotel = Hotel.objects.filter(id=self.kwargs['hotel_id']).values(*RATING_SUMMARY_FIELDS).first()
+        summary = rating_summary(hotel)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
 
         return Response({
-            'average_rating': average_rating,
+            **summary,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
             'reviews': serializer.data
         })
 
 
 class ReviewDeleteAPIView(generics.DestroyAPIView):
-    queryset = Review.objects.all()
+    queryset = Review.objects.select_related('user')
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAdminUser]
 
@@ -120,13 +239,14 @@ class UserProfileAPIView(generics.RetrieveAPIView):
 class UserReviewListAPIView(generics.ListAPIView):
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
-        return Review.objects.filter(user=self.request.user)
+        return Review.objects.select_related('user').filter(user=self.request.user)
 
 
 class UserReviewDeleteAPIView(generics.RetrieveDestroyAPIView):
-    queryset = Review.objects.all()
+    queryset = Review.objects.select_related('user')
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -138,21 +258,16 @@ class UserReviewDeleteAPIView(generics.RetrieveDestroyAPIView):
 
 class RoomReserveAPIView(GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'reserve'
     serializer_class = RoomReserveSerializer
 
     @extend_schema(
         request=RoomReserveSerializer,
         responses=BookingSerializer,
-        description="Reserve a room if it is available. Returns created booking."
+        description="Reserve a room if it is available for every night of the stay. Returns created booking."
     )
     def post(self, request, room_id):
-        room = get_object_or_404(Room, id=room_id)
-
-        if not room.is_available:
-            return Response(
-                {"detail": "This room is not available for reservation."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        room = get_object_or_404(Room.objects.select_related('hotel__city'), id=room_id)
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -160,6 +275,12 @@ class RoomReserveAPIView(GenericAPIView):
         check_in = serializer.validated_data['check_in']
         check_out = serializer.validated_data['check_out']
 
+        if not room.is_available_for(check_in, check_out):
+            return Response(
+                {"detail": "This room is not available for reservation."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         booking = Booking.objects.create(
             user=request.user,
             room=room,
@@ -167,24 +288,27 @@ class RoomReserveAPIView(GenericAPIView):
             check_out=check_out,
             status=Booking.BookingStatus.PENDING
         )
-        confirm_booking.apply_async((booking.id,), countdown=30)
-        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+        return Response(BookingSerializer(booking, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
 
 
-class UserBookingListAPIView(generics.ListAPIView):
+class UserBookingListAPIView(StreamingListMixin, RowsReadMixin, generics.ListAPIView):
     serializer_class = BookingSerializer
+    rows_class = BookingRows
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NewestFirstCursorPagination
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user).order_by('-created_at')
+        return Booking.objects.select_related('room__hotel__city').filter(user=self.request.user)
 
 
-class UserBookingDetailAPIView(generics.RetrieveAPIView):
+class UserBookingDetailAPIView(RowsReadMixin, generics.RetrieveAPIView):
     serializer_class = BookingSerializer
+    rows_class = BookingRows
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.select_related('room__hotel__city').filter(user=self.request.user)
 
 
 class CancelBookingAPIView(APIView):
@@ -192,7 +316,7 @@ class CancelBookingAPIView(APIView):
 
     @extend_schema(responses=BookingSerializer)
     def patch(self, request, booking_id):
-        booking = get_object_or_404(Booking, id=booking_id)
+        booking = get_object_or_404(Booking.objects.select_related('room'), id=booking_id)
 
         if booking.user != request.user:
             return Response(
@@ -200,19 +324,12 @@ class CancelBookingAPIView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        if booking.status == Booking.BookingStatus.CANCELLED:
+        if not booking.cancel():
             return Response(
                 {"detail": "Booking is already cancelled."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if booking.status == Booking.BookingStatus.CONFIRMED:
-            booking.room.stock += 1
-            booking.room.save()
-
-        booking.status = Booking.BookingStatus.CANCELLED
-        booking.save()
-
         return Response(
             {"detail": "Booking cancelled successfully."},
             status=status.HTTP_200_OK
@@ -223,4 +340,85 @@ class CancelBookingAPIView(APIView):
 class RegisterAPIView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
-    permission_classes = [AllowAny]
\ No newline at end of file
+    throttle_scope = 'register'
+    permission_classes = [AllowAny]
+
+
+class ExportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    content_types = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+    @extend_schema(
+        parameters=[ExportQuerySerializer],
+        description="Stream every booking (with total price) or review as CSV or NDJSON, for finance and BI."
+    )
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            raise Http404
+        params = ExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        output = params.validated_data['output']
+
+        response = StreamingHttpResponse(
+            stream_export(kind, output, params.validated_data.get('since'), params.validated_data.get('until')),
+            content_type=self.content_types[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{output}"'
+        return response
+
+
+class ImageUploadAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        request=ImageUploadSerializer,
+        description="Issue a presigned PUT URL for a new hotel or room image. Send the file to it with the "
+                    "returned headers, then POST the upload_token to the confirm endpoint."
+    )
+    def post(self, request, target, pk):
+        if target not in UPLOAD_TARGETS:
+            raise Http404
+        get_object_or_404(UPLOAD_TARGETS[target].objects.only('id'), pk=pk)
+        serializer = ImageUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(issue(request, target, pk, serializer.validated_data['content_type']),
+                        status=status.HTTP_201_CREATED)
+
+
+class ImageUploadConfirmAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    targets = {
+        'hotels': (Hotel.objects.select_related('city'), HotelSerializer),
+        'rooms': (Room.objects.select_related('hotel__city'), RoomSerializer),
+    }
+
+    @extend_schema(
+        request=ImageUploadConfirmSerializer,
+        description="Attach a finished direct upload to its hotel or room; renditions follow in the background."
+    )
+    def post(self, request):
+        serializer = ImageUploadConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['upload_token']
+        queryset, serializer_class = self.targets[upload['target']]
+        instance = get_object_or_404(queryset, pk=upload['pk'])
+
+        storage, key = image_storage(upload['target']), upload['key']
+        if instance.image.name == attached_name(key):
+            # confirmed already
+            return Response(serializer_class(instance, context={'request': request}).data)
+        if not storage.exists(key):
+            return Response(
+                {"detail": "Nothing has been uploaded for this token yet."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if storage.size(key) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            storage.delete(key)
+            return Response(
+                {"detail": f"Images are limited to {settings.IMAGE_UPLOAD_MAX_BYTES} bytes."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        instance.image = attach(storage, key)
+        instance.save(update_fields=['image', 'image_variants'])
+        return Response(serializer_class(instance, context={'request': request}).data)
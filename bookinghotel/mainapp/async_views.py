@@ -0,0 +1,157 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.shortcuts import aget_object_or_404
+from django.views import View
+from rest_framework import serializers
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import metrics
+from .api_views import RATING_SUMMARY_FIELDS, available_hotels, rating_summary
+from .caching import CACHE_TTL, anamespace_versions, aversioned_key, detail_cache_entry, detail_cache_key, \
+    etag_matches
+from .fieldsets import cache_suffix
+from .models import Hotel, Room, Review
+from .pagination import AsyncIdCursorPagination, AsyncCheapestFirstCursorPagination, AsyncReviewCursorPagination
+from .renderers import FastJSONRenderer
+from .rows import HotelRows, RoomRows
+from .serializers import ReviewSerializer, AvailabilitySearchSerializer, HotelSearchResultSerializer, \
+    ReviewListQuerySerializer
+
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncAPIView(View):
+    """Read-only async endpoint returning the same JSON bodies as its DRF counterpart."""
+    http_method_names = ['get', 'options']
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'catalogue'
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.request = request = Request(
+            request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+        )
+        try:
+            await self.check_throttles(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except (Http404, PermissionDenied, APIException) as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc):
+        """The DRF exception handler's response, JSON rendered, so errors match the sync views'."""
+        context = {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': self.request}
+        response = api_settings.EXCEPTION_HANDLER(exc, context)
+        if response is None:
+            raise exc
+        result = json_response(response.data, status=response.status_code)
+        for header, value in response.items():
+            if header.lower() != 'content-type':
+                result[header] = value
+        return result
+
+    async def check_throttles(self, request):
+        for throttle in (throttle_class() for throttle_class in self.throttle_classes):
+            # authenticating the user and the rate limiter calls are sync
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                raise Throttled(throttle.wait())
+
+    async def cached(self, name, namespaces, build):
+        cache_key = await aversioned_key(name, namespaces, self.request.query_params.urlencode())
+        data = await cache.aget(cache_key)
+        metrics.record_cache(name, data is not None)
+        if data is None:
+            data = await build()
+            await cache.aset(cache_key, data, timeout=CACHE_TTL)
+        return data
+
+    async def paginate(self, queryset, serializer_class):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, self.request, view=self)
+        data = serializer_class(page, many=True, context={'request': self.request}).data
+        return paginator.get_paginated_response(data).data
+
+
+class AsyncHotelListView(AsyncAPIView):
+    pagination_class = AsyncIdCursorPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['id', 'rating_avg']
+
+    async def get(self, request):
+        queryset = Hotel.objects.select_related('city')
+        min_rating = request.query_params.get('min_rating')
+        if min_rating:
+            min_rating = serializers.FloatField(min_value=0, max_value=5).run_validation(min_rating)
+            queryset = queryset.filter(rating_avg__gte=min_rating)
+
+        rows = HotelRows(context={'request': request}).rows(queryset)
+        data = await self.cached("async_hotels_list", ('hotels', 'cities'), lambda: self.paginate(rows, HotelRows))
+        return json_response(data)
+
+
+class AsyncHotelDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        # shares entries and ETags with HotelViewSet.retrieve
+        cache_key = detail_cache_key("hotel", 'json', pk, cache_suffix(request))
+        entry = await cache.aget(cache_key)
+
+        stale = entry is None or await anamespace_versions(entry['namespaces']) != entry['versions']
+        metrics.record_cache("hotel_detail", not stale)
+        if stale:
+            rows = HotelRows(context={'request': request})
+            hotel = await aget_object_or_404(rows.rows(Hotel.objects.all()), pk=pk)
+            namespaces = [f"hotel:{hotel['id']}", f"city:{hotel['city_id']}"]
+            versions = await anamespace_versions(namespaces)
+            data = HotelRows(hotel, context={'request': request}).data
+            entry = detail_cache_entry(namespaces, versions, data, 'json')
+            await cache.aset(cache_key, entry, timeout=CACHE_TTL)
+
+        if etag_matches(request, entry['etag']):
+            response = HttpResponseNotModified()
+        else:
+            response = json_response(entry['data'])
+        response['ETag'] = entry['etag']
+        return response
+
+
+class AsyncRoomListByHotelView(AsyncAPIView):
+    pagination_class = AsyncIdCursorPagination
+
+    async def get(self, request, hotel_id):
+        rows = RoomRows(context={'request': request}).rows(Room.objects.filter(hotel_id=hotel_id))
+        data = await self.cached(
+            "async_rooms_by_hotel", [f"hotel:{hotel_id}:rooms", 'cities'], lambda: self.paginate(rows, RoomRows),
+        )
+        return json_response(data)
+
+
+class AsyncReviewListView(AsyncAPIView):
+    pagination_class = AsyncReviewCursorPagination
+
+    async def get(self, request, hotel_id):
+        ReviewListQuerySerializer(data=request.query_params).is_valid(raise_exception=True)
+        summary = rating_summary(await Hotel.objects.filter(id=hotel_id).values(*RATING_SUMMARY_FIELDS).afirst())
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(
+            Review.objects.select_related('user').filter(hotel_id=hotel_id), request, view=self
+        )
+        return json_response({
+            **summary,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'reviews': ReviewSerializer(page, many=True, context={'request': request}).data,
+        })
+
+
+class AsyncHotelSearchView(AsyncAPIView):
+    pagination_class = AsyncCheapestFirstCursorPagination
+
+    async def get(self, request):
+        params = AvailabilitySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return json_response(await self.paginate(available_hotels(params.validated_data), HotelSearchResultSerializer))
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics
+from .fieldsets import cache_suffix
+
+CACHE_TTL = 60 * 60 * 24
+
+
+def _version_key(namespace):
+    return f"cache_version:{namespace}"
+
+
+def namespace_versions(namespaces):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # a fresh start value so an evicted version never matches old entries
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def anamespace_versions(namespaces):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(namespaces):
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_namespaces(*namespaces):
+    """Invalidates the namespaces now and, inside a transaction, again once it commits.
+
+    A reader between the two bumps still sees the old rows and may cache them under the new
+    versions; the second bump retires those entries, so a committed write always invalidates.
+    """
+    _bump(namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(namespaces))
+
+
+def versioned_key(name, namespaces, suffix=''):
+    versions = '.'.join(str(version) for version in namespace_versions(namespaces))
+    return f"{name}:{versions}:{suffix}"
+
+
+async def aversioned_key(name, namespaces, suffix=''):
+    versions = '.'.join(str(version) for version in await anamespace_versions(namespaces))
+    return f"{name}:{versions}:{suffix}"
+
+
+def detail_cache_key(name, renderer_format, lookup, selection=''):
+    return f"{name}_detail:{renderer_format}:{lookup}:{selection}"
+
+
+def detail_cache_entry(namespaces, versions, data, renderer_format):
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    digest = hashlib.sha256(f"{renderer_format}:{body}".encode()).hexdigest()
+    return {'namespaces': namespaces, 'versions': versions, 'etag': f'"{digest}"', 'data': data}
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    return bool(if_none_match) and bool({etag, '*'} & set(parse_etags(if_none_match)))
+
+
+class CachedListMixin:
+    cache_name = None
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return self.cache_namespaces
+
+    def list(self, request, *args, **kwargs):
+        cache_key = versioned_key(self.cache_name, self.get_cache_namespaces(), request.query_params.urlencode())
+        cached_data = cache.get(cache_key)
+        metrics.record_cache(self.cache_name, cached_data is not None)
+
+        if cached_data is not None:
+            return Response(cached_data)
+
+        data = super().list(request, *args, **kwargs).data
+
+        cache.set(cache_key, data, timeout=CACHE_TTL)
+
+        return Response(data)
+
+
+class CachedRetrieveMixin:
+    """Serves retrieve from a cached body keyed by the url, revalidated against the
+    versions of every namespace the object was built from, with a strong ETag."""
+    detail_cache_name = None
+
+    def get_object_cache_namespaces(self, instance):
+        return [f"{self.detail_cache_name}:{instance.pk}"]
+
+    def _build_cache_entry(self, request):
+        instance = self.get_object()
+        namespaces = self.get_object_cache_namespaces(instance)
+        versions = namespace_versions(namespaces)
+        return detail_cache_entry(namespaces, versions, self.get_serializer(instance).data,
+                                  request.accepted_renderer.format)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        cache_key = detail_cache_key(self.detail_cache_name, request.accepted_renderer.format, lookup,
+                                     cache_suffix(request))
+        entry = cache.get(cache_key)
+
+        stale = entry is None or namespace_versions(entry['namespaces']) != entry['versions']
+        metrics.record_cache(f"{self.detail_cache_name}_detail", not stale)
+        if stale:
+            entry = self._build_cache_entry(request)
+            cache.set(cache_key, entry, timeout=CACHE_TTL)
+
+        headers = {'ETag': entry['etag']}
+        if etag_matches(request, entry['etag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry['data'], headers=headers)
@@ -0,0 +1,84 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DecimalField, ExpressionWrapper, F
+
+from .models import Booking, Review, NightsBetween
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_LINES_PER_CHUNK = 500
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+
+def booking_rows():
+    queryset = Booking.objects.annotate(
+        nights=NightsBetween(),
+        total_price=ExpressionWrapper(
+            F('room__price_per_night') * NightsBetween(),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+    columns = [
+        'id', 'user_id', 'user__username', 'room_id', 'room__hotel_id', 'room__room_type',
+        'room__price_per_night', 'check_in', 'check_out', 'nights', 'total_price', 'status', 'created_at',
+    ]
+    return queryset, columns
+
+
+def review_rows():
+    columns = ['id', 'hotel_id', 'hotel__name', 'user_id', 'user__username', 'rating', 'comment', 'created_at']
+    return Review.objects.all(), columns
+
+
+EXPORTS = {
+    'bookings': booking_rows,
+    'reviews': review_rows,
+}
+
+
+# a spreadsheet evaluates a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    # user-entered text such as a username or review comment must open as text, not run as a formula
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _lines(rows, names, file_format):
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow([_csv_cell(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_export(kind, file_format, since=None, until=None):
+    """Yields the export as text chunks, reading rows through a server-side cursor."""
+    queryset, columns = EXPORTS[kind]()
+    if since:
+        queryset = queryset.filter(created_at__date__gte=since)
+    if until:
+        queryset = queryset.filter(created_at__date__lt=until)
+    rows = queryset.order_by('id').values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    names = [column.replace('__', '_') for column in columns]
+
+    buffer = []
+    for line in _lines(rows, names, file_format):
+        buffer.append(line)
+        if len(buffer) >= EXPORT_LINES_PER_CHUNK:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,32 @@
+"""``?fields=`` and ``?expand=`` handling shared by the model serializers and the row serializers.
+
+Relations are returned as ids unless expanded, e.g. ``?expand=hotel.city`` embeds the hotel and its
+city; ``?fields=id,name`` limits the top-level keys of each object.
+"""
+
+
+def _split(value):
+    return frozenset(part.strip() for part in value.split(',') if part.strip())
+
+
+def selection(request):
+    """The (fields, expand) a request asks for; fields is None when every field is wanted."""
+    if request is None:
+        return None, frozenset()
+    fields = request.GET.get('fields')
+    return (_split(fields) if fields else None), _split(request.GET.get('expand', ''))
+
+
+def child_expand(expand, name):
+    prefix = f'{name}.'
+    return frozenset(path.removeprefix(prefix) for path in expand if path.startswith(prefix))
+
+
+def is_expanded(expand, name):
+    return name in expand or bool(child_expand(expand, name))
+
+
+def cache_suffix(request):
+    """Tells apart cached bodies of the same object built for different selections."""
+    fields, expand = selection(request)
+    return f"{','.join(sorted(fields)) if fields is not None else '*'}:{','.join(sorted(expand))}"
@@ -0,0 +1,75 @@
+"""Fixed-size JPEG and WebP renditions of uploaded hotel and room images.
+
+Renditions are stored next to the original through the image field's storage, e.g.
+``hotels/lobby.jpg`` gets ``hotels/lobby_thumb.webp``, and their storage names are kept in the
+model's ``image_variants`` so serializers can link them without touching the storage. They are
+deleted once the image they were rendered from is replaced or its row is deleted.
+"""
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, variant, extension):
+    stem, _ = posixpath.splitext(name)
+    return f'{stem}_{variant}.{extension}'
+
+
+def _open(field_file):
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    # phone cameras store rotation in EXIF, which WebP and the thumbnails would otherwise lose
+    image = ImageOps.exif_transpose(image)
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _encode(image, pil_format, options):
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def render_variants(field_file):
+    """Writes every ``IMAGE_VARIANTS`` rendition of the image and returns their sizes and storage names."""
+    image = _open(field_file)
+    storage = field_file.storage
+    variants = {}
+    for variant, (width, height, crop) in settings.IMAGE_VARIANTS.items():
+        if crop:
+            rendition = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            rendition = image.copy()
+            rendition.thumbnail((width, height), Image.Resampling.LANCZOS)
+        variants[variant] = {'width': rendition.width, 'height': rendition.height}
+        for key, (pil_format, extension, options) in VARIANT_FORMATS.items():
+            name = variant_name(field_file.name, variant, extension)
+            variants[variant][key] = storage.save(name, _encode(rendition, pil_format, options))
+    return variants
+
+
+def delete_variants(storage, variants):
+    """Deletes the rendition files listed in an ``image_variants`` value."""
+    for rendition in variants.values():
+        for key in VARIANT_FORMATS:
+            if rendition.get(key):
+                storage.delete(rendition[key])
+
+
+def variant_urls(storage, variants):
+    """The ``image_variants`` of a model with storage names replaced by URLs."""
+    return {
+        variant: {key: storage.url(value) if key in VARIANT_FORMATS else value for key, value in rendition.items()}
+        for variant, rendition in variants.items()
+    }
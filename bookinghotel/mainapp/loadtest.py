@@ -0,0 +1,339 @@
+"""Seeds a realistic catalogue and drives every API endpoint with concurrent clients.
+
+Used by the ``loadtest`` management command under ``bookinghotel.settings_bench``.
+"""
+import itertools
+import random
+import re
+import statistics
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import connection, connections
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import api_urls, uploads
+from .models import City, Hotel, Room, RoomNight, Booking, Review, User
+from .search import reindex_all_hotels
+
+LOADTEST_PASSWORD = 'loadtest-pass'
+STAY_START = date(2031, 1, 1)
+
+Scenario = namedtuple('Scenario', 'method auth kwargs data weight consumes', defaults=(None, None, 1.0, None))
+
+
+def get(auth='anon', kwargs=None, data=None, weight=1.0):
+    return Scenario('get', auth, kwargs, data, weight)
+
+
+SCENARIOS = {
+    'api-root': get(),
+    'city-list': get(),
+    'city-detail': get(kwargs=lambda pools: {'pk': pools.pick('cities')}),
+    'hotel-list': get(data=lambda pools: {'ordering': '-rating_avg'}),
+    'hotel-detail': get(kwargs=lambda pools: {'pk': pools.pick('hotels')}),
+    'hotel-text-search': get(data=lambda pools: {'q': 'hotel'}),
+    'hotel-search': get(data=lambda pools: pools.stay()),
+    'room-list': get(),
+    'room-detail': get(kwargs=lambda pools: {'pk': pools.pick('rooms')}),
+    'hotels-by-city': get(kwargs=lambda pools: {'city_id': pools.pick('cities')}),
+    'rooms-by-hotel': get(kwargs=lambda pools: {'hotel_id': pools.pick('hotels')}),
+    'hotel-reviews-list-create': get(kwargs=lambda pools: {'hotel_id': pools.pick('hotels')}),
+    'review-delete': Scenario('delete', 'admin', lambda pools: {'hotel_id': 0, 'pk': pools.take('reviews')},
+                              consumes='reviews'),
+    'user-profile': get('user'),
+    'user-reviews': get('user'),
+    'user-review-delete': get('user', kwargs=lambda pools: {'pk': pools.pick('own_reviews')}),
+    'room-reserve': Scenario('post', 'user', lambda pools: {'room_id': pools.pick('rooms')},
+                             lambda pools: pools.stay()),
+    'user-reserves': get('user'),
+    'user-booking-detail': get('user', kwargs=lambda pools: {'pk': pools.pick('own_bookings')}),
+    'cancel-booking': Scenario('patch', 'user', lambda pools: {'booking_id': pools.take('cancellable')},
+                               consumes='cancellable'),
+    'admin-export': get('admin', kwargs=lambda pools: {'kind': 'reviews'}, weight=0.05),
+    'image-upload': Scenario('post', 'admin', lambda pools: {'target': 'hotels', 'pk': pools.pick('hotels')},
+                             lambda pools: {'content_type': 'image/jpeg'}, weight=0.05),
+    'image-upload-confirm': Scenario('post', 'admin', None, lambda pools: pools.uploaded_image(), weight=0.05),
+    'register': Scenario('post', 'anon', None, lambda pools: pools.signup(), weight=0.1),
+    'login': Scenario('post', 'anon', None, lambda pools: {
+        'username': pools.username(), 'password': LOADTEST_PASSWORD,
+    }, weight=0.1),
+    'token_refresh': Scenario('post', 'anon', None, lambda pools: {'refresh': pools.refresh_token}),
+    'async-hotel-list': get(),
+    'async-hotel-detail': get(kwargs=lambda pools: {'pk': pools.pick('hotels')}),
+    'async-rooms-by-hotel': get(kwargs=lambda pools: {'hotel_id': pools.pick('hotels')}),
+    'async-hotel-reviews': get(kwargs=lambda pools: {'hotel_id': pools.pick('hotels')}),
+    'async-hotel-search': get(data=lambda pools: pools.stay()),
+}
+
+
+def api_endpoints(patterns=api_urls.urlpatterns, prefix='/api/'):
+    """Yields (name, route) for every named API url, e.g. ('city-detail', '/api/cities/{pk}/'),
+    skipping the router's format-suffix variants."""
+    for pattern in patterns:
+        route = prefix + _route(pattern.pattern.regex.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from api_endpoints(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern) and pattern.name and 'format' not in pattern.pattern.regex.groupindex:
+            yield pattern.name, route
+
+
+def _route(regex):
+    regex = re.sub(r'^\^|\\Z$|\$$', '', regex)
+    return re.sub(r'\(\?P<(\w+)>[^)]*\)', r'{\1}', regex)
+
+
+class Pools:
+    """Ids the scenarios draw from; take() consumes, so destructive scenarios never repeat a target."""
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.ids = {}
+        self.usernames = []
+        self.refresh_token = None
+        self.users = {}
+
+    def load(self):
+        self.users = {
+            'admin': User.objects.filter(is_superuser=True).order_by('id').first(),
+            'user': User.objects.filter(is_superuser=False, username__startswith='loaduser').order_by('id').first(),
+        }
+        user = self.users['user']
+        self.ids = {
+            'cities': list(City.objects.values_list('id', flat=True)),
+            'hotels': list(Hotel.objects.values_list('id', flat=True)),
+            'rooms': list(Room.objects.filter(stock__gt=0).values_list('id', flat=True)),
+            'reviews': list(Review.objects.exclude(user=user).values_list('id', flat=True)),
+            'own_reviews': list(Review.objects.filter(user=user).values_list('id', flat=True)),
+            'own_bookings': list(Booking.objects.filter(user=user).values_list('id', flat=True)),
+            'cancellable': list(
+                Booking.objects.filter(user=user).exclude(status=Booking.BookingStatus.CANCELLED)
+                .values_list('id', flat=True)
+            ),
+        }
+        self.usernames = list(
+            User.objects.filter(username__startswith='loaduser').values_list('username', flat=True)[:100]
+        )
+        self.refresh_token = str(RefreshToken.for_user(user))
+        self.random.shuffle(self.ids['reviews'])
+        self.random.shuffle(self.ids['cancellable'])
+
+    def pick(self, pool):
+        with self.lock:
+            return self.random.choice(self.ids[pool])
+
+    def take(self, pool):
+        with self.lock:
+            return self.ids[pool].pop()
+
+    def signup(self):
+        with self.lock:
+            username = f"signup{next(self.counter)}_{self.random.randrange(10 ** 9)}"
+        return {
+            'username': username, 'email': f"{username}@example.com",
+            'password': LOADTEST_PASSWORD, 'password_confirm': LOADTEST_PASSWORD,
+        }
+
+    def username(self):
+        with self.lock:
+            return self.random.choice(self.usernames)
+
+    def uploaded_image(self):
+        """Issues an upload for a random hotel and puts a small JPEG under its key, as a client would."""
+        upload = uploads.issue(RequestFactory().post('/'), 'hotels', self.pick('hotels'), 'image/jpeg')
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), 'teal').save(buffer, 'JPEG')
+        uploads.image_storage('hotels').save(upload['key'], ContentFile(buffer.getvalue()))
+        return {'upload_token': upload['upload_token']}
+
+    def stay(self):
+        with self.lock:
+            check_in = STAY_START + timedelta(days=self.random.randrange(365))
+            nights = self.random.randint(1, 5)
+        return {'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=nights)).isoformat()}
+
+
+def seed(hotels=2000, rooms_per_hotel=4, users=200, bookings=20000, reviews=20000, hotels_per_city=50,
+         batch=2000, stdout=None):
+    """Bulk-loads a catalogue; skips anything already at the requested size so reruns are cheap."""
+    write = stdout.write if stdout else (lambda message: None)
+    rng = random.Random(42)
+    password = make_password(LOADTEST_PASSWORD)
+
+    if not User.objects.filter(is_superuser=True).exists():
+        User.objects.create_superuser('loadadmin', 'loadadmin@example.com', LOADTEST_PASSWORD)
+    existing = User.objects.filter(username__startswith='loaduser').count()
+    User.objects.bulk_create([
+        User(username=f'loaduser{i}', email=f'loaduser{i}@example.com', password=password)
+        for i in range(existing, users)
+    ], batch_size=batch)
+
+    existing = Hotel.objects.count()
+    for start in range(existing, hotels, batch):
+        numbers = range(start, min(start + batch, hotels))
+        city_names = {f"City {number // hotels_per_city}" for number in numbers}
+        cities = dict(City.objects.filter(name__in=city_names).values_list('name', 'id'))
+        for city in City.objects.bulk_create([City(name=name) for name in city_names - cities.keys()]):
+            cities[city.name] = city.id
+        created = Hotel.objects.bulk_create([
+            Hotel(
+                name=f"Hotel {number}",
+                description=rng.choice(["Quiet rooms near the old town", "Rooftop pool and spa",
+                                        "Family friendly, free parking", "Business hotel by the station"]),
+                city_id=cities[f"City {number // hotels_per_city}"],
+                address=f"{number} Main Street",
+            )
+            for number in numbers
+        ])
+        Room.objects.bulk_create([
+            Room(
+                hotel=hotel,
+                room_type=Room.RoomChoices.values[(hotel.id + i) % len(Room.RoomChoices.values)],
+                price_per_night=Decimal(40 + rng.randrange(260)),
+                stock=1 + rng.randrange(4),
+            )
+            for hotel in created
+            for i in range(rooms_per_hotel)
+        ])
+        write(f"seeded {numbers.stop} hotels")
+    if Hotel.objects.count() > existing:
+        reindex_all_hotels()
+
+    user_ids = list(User.objects.filter(username__startswith='loaduser').values_list('id', flat=True))
+    hotel_ids = list(Hotel.objects.values_list('id', flat=True))
+    rooms = list(Room.objects.values_list('id', flat=True))
+
+    existing = Booking.objects.count()
+    for start in range(existing, bookings, batch):
+        created = []
+        for number in range(start, min(start + batch, bookings)):
+            # each room's stays follow each other, so no night is ever oversold
+            room_id = rooms[number % len(rooms)]
+            check_in = date(2024, 1, 1) + timedelta(days=3 * (number // len(rooms)))
+            created.append(Booking(
+                user_id=user_ids[number % len(user_ids)], room_id=room_id, check_in=check_in,
+                check_out=check_in + timedelta(days=2), status=Booking.BookingStatus.CONFIRMED,
+            ))
+        Booking.objects.bulk_create(created)
+        RoomNight.objects.bulk_create([
+            RoomNight(room_id=booking.room_id, date=booking.check_in + timedelta(days=night), booked=1)
+            for booking in created
+            for night in range(2)
+        ], ignore_conflicts=True)
+        write(f"seeded {start + len(created)} bookings")
+
+    existing = Review.objects.count()
+    for start in range(existing, reviews, batch):
+        Review.objects.bulk_create([
+            Review(
+                user_id=user_ids[number % len(user_ids)], hotel_id=rng.choice(hotel_ids),
+                rating=rng.randint(1, 5), comment="Seeded review",
+            )
+            for number in range(start, min(start + batch, reviews))
+        ])
+        write(f"seeded {min(start + batch, reviews)} reviews")
+    if Review.objects.count() > existing:
+        Hotel.objects.all().rebuild_ratings()
+
+
+Result = namedtuple('Result', 'name route requests errors p50 p95 p99 rps queries')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_endpoint(name, route, scenario, pools, requests, concurrency):
+    total = max(1, int(requests * scenario.weight))
+    if scenario.consumes:
+        total = min(total, len(pools.ids[scenario.consumes]))
+    samples, errors = [], []
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def client_loop():
+        client = APIClient(raise_request_exception=False)
+        user = pools.users.get(scenario.auth)
+        if user is not None:
+            client.force_authenticate(user=user)
+        try:
+            while next(counter) < total:
+                kwargs = scenario.kwargs(pools) if scenario.kwargs else {}
+                data = scenario.data(pools) if scenario.data else None
+                path = route.format(**kwargs)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    if scenario.method == 'get':
+                        response = client.get(path, data)
+                    else:
+                        response = getattr(client, scenario.method)(path, data, format='json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    elapsed = time.perf_counter() - started
+                with lock:
+                    samples.append((elapsed, len(queries)))
+                    if response.status_code >= 400:
+                        errors.append((path, response.status_code))
+        finally:
+            if concurrency > 1:
+                connections.close_all()
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(client_loop) for _ in range(concurrency)]:
+                future.result()
+    else:
+        client_loop()
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed * 1000 for elapsed, _ in samples] or [0.0]
+    return Result(
+        name=name,
+        route=route,
+        requests=len(samples),
+        errors=errors,
+        p50=statistics.median(latencies),
+        p95=percentile(latencies, 0.95),
+        p99=percentile(latencies, 0.99),
+        rps=len(samples) / wall,
+        queries=max((count for _, count in samples), default=0),
+    )
+
+
+def run(pools, requests=200, concurrency=8, only=None):
+    results = []
+    for name, route in api_endpoints():
+        if only and not re.search(only, name):
+            continue
+        results.append(run_endpoint(name, route, SCENARIOS[name], pools, requests, concurrency))
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Endpoints whose p95 grew by more than ``threshold`` or that run more queries than the baseline."""
+    found = []
+    for result in results:
+        before = baseline.get(result.route)
+        if before is None:
+            continue
+        if result.p95 > before['p95'] * (1 + threshold):
+            found.append(f"{result.route}: p95 {before['p95']:.1f}ms -> {result.p95:.1f}ms")
+        if result.queries > before['queries']:
+            found.append(f"{result.route}: {before['queries']} -> {result.queries} queries per request")
+    return found
@@ -0,0 +1,82 @@
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import F
+
+from mainapp.models import Booking, City, Hotel, Room, RoomNight, User
+
+
+class Command(BaseCommand):
+    help = ("Confirm pending bookings of a few rooms from concurrent threads and report confirmations per second. "
+            "Writes to the configured database and deletes what it created.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,4,8', help="Comma separated thread counts to measure at.")
+        parser.add_argument('--bookings', type=int, default=400, help="Pending bookings confirmed per run.")
+        parser.add_argument('--rooms', type=int, default=4)
+        parser.add_argument('--stock', type=int, default=50)
+        parser.add_argument('--attempts', type=int, default=20,
+                            help="Tries per booking when the database reports a lock conflict.")
+
+    def handle(self, *args, **options):
+        city = City.objects.create(name="Benchmark confirmations")
+        name = f'benchmark-confirm-{time.time_ns()}'
+        user = User.objects.create_user(username=name, password=None, email=f'{name}@example.com')
+        try:
+            hotel = Hotel.objects.create(name="Benchmark", description="Benchmark hotel", city=city, address="1 St")
+            rooms = Room.objects.bulk_create([
+                Room(hotel=hotel, room_type=Room.RoomChoices.DOUBLE, price_per_night=100, stock=options['stock'])
+                for _ in range(options['rooms'])
+            ])
+            for workers in sorted(int(count) for count in options['workers'].split(',')):
+                self.run(workers, user, rooms, options)
+        finally:
+            city.delete()
+            user.delete()
+
+    def run(self, workers, user, rooms, options):
+        check_in = date(2030, 5, 1)
+        bookings = Booking.objects.bulk_create([
+            Booking(user=user, room=rooms[i % len(rooms)], check_in=check_in + timedelta(days=i % 3),
+                    check_out=check_in + timedelta(days=3 + i % 3))
+            for i in range(options['bookings'])
+        ])
+        ids = [booking.id for booking in bookings]
+        results, failures = [], []
+
+        def confirm(share):
+            try:
+                for booking_id in share:
+                    for _ in range(options['attempts']):
+                        try:
+                            results.append(Booking.objects.select_related('room').get(id=booking_id).confirm())
+                            break
+                        except OperationalError:
+                            # SQLite reports a locked database where Postgres would wait for the row lock
+                            time.sleep(0.005)
+                    else:
+                        failures.append(booking_id)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=confirm, args=(ids[i::workers],)) for i in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        oversold = RoomNight.objects.filter(room__in=rooms, booked__gt=F('room__stock')).count()
+        if failures or oversold:
+            raise CommandError(f"workers={workers}: {len(failures)} bookings never confirmed, "
+                               f"{oversold} nights oversold")
+        self.stdout.write(
+            f"workers={workers:>3} confirmed={sum(results):>5} sold_out={len(results) - sum(results):>5} "
+            f"confirmations/s={len(results) / elapsed:10.1f}"
+        )
+        Booking.objects.filter(id__in=ids).delete()
+        RoomNight.objects.filter(room__in=rooms).delete()
@@ -0,0 +1,61 @@
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from mainapp.models import Hotel, Room
+from mainapp.pagination import STREAM_CHUNK_SIZE
+from mainapp.renderers import FastJSONRenderer, StreamingJSONRenderer, orjson
+from mainapp.rows import HotelRows, RoomRows
+
+from .benchmark_serializers import Command as SerializerBenchmark
+
+
+class Command(SerializerBenchmark):
+    help = ("Seed hotels and rooms inside a rolled back transaction and time DRF's JSONRenderer against the "
+            "orjson renderer on hotel and room list payloads, and reading and rendering the page whole "
+            "against streaming it from a server-side cursor.")
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        context = {'request': Request(APIRequestFactory().get('/api/hotels/'))}
+        with transaction.atomic():
+            self.seed(count)
+            payloads = []
+            for name, queryset, rows_class in [
+                ('hotels', Hotel.objects.order_by('id'), HotelRows),
+                ('rooms', Room.objects.order_by('id'), RoomRows),
+            ]:
+                rows = rows_class(context=context)
+                queryset = rows.rows(queryset[:count])
+                results = rows_class(queryset, many=True, context=context).data
+                # the whole page read and rendered, against the same rows streamed as they are read
+                whole_ms = self.time(lambda: self.whole(queryset, rows), options['repeat'])
+                stream_ms = self.time(lambda: b''.join(self.stream(queryset, rows)), options['repeat'])
+                first_ms = self.time(lambda: self.first_results(self.stream(queryset, rows)), options['repeat'])
+                payloads.append((name, results, whole_ms, stream_ms, first_ms))
+            transaction.set_rollback(True)
+
+        if orjson is None:
+            self.stderr.write("orjson is not installed; the fast renderer falls back to the stdlib one.")
+        self.stdout.write(f"{'payload':<10}{'objects':>9}{'KiB':>8}{'stdlib ms':>11}{'fast ms':>9}{'speedup':>9}"
+                          f"{'read+render ms':>16}{'stream ms':>11}{'first chunk ms':>16}")
+        for name, results, whole_ms, stream_ms, first_ms in payloads:
+            page = {'next': None, 'previous': None, 'results': results}
+            size = len(JSONRenderer().render(page)) / 1024
+            stdlib_ms = self.time(lambda: JSONRenderer().render(page), options['repeat'])
+            fast_ms = self.time(lambda: FastJSONRenderer().render(page), options['repeat'])
+            self.stdout.write(f"{name:<10}{count:>9}{size:>8.0f}{stdlib_ms:>11.2f}{fast_ms:>9.2f}"
+                              f"{stdlib_ms / fast_ms:>8.1f}x{whole_ms:>16.2f}{stream_ms:>11.2f}{first_ms:>16.3f}")
+
+    def whole(self, queryset, rows):
+        return FastJSONRenderer().render({'results': [rows.to_representation(row) for row in queryset.all()]})
+
+    def stream(self, queryset, rows):
+        items = map(rows.to_representation, queryset.iterator(chunk_size=STREAM_CHUNK_SIZE))
+        return StreamingJSONRenderer().stream(items, lambda: {'next': None, 'previous': None})
+
+    def first_results(self, chunks):
+        # the opening brace, then the first encoded rows
+        next(chunks)
+        next(chunks)
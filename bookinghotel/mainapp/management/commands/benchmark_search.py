@@ -0,0 +1,89 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mainapp.models import City, Hotel, Room, RoomNight
+from mainapp.serializers import HotelSearchResultSerializer
+
+
+class Command(BaseCommand):
+    help = "Seed growing catalogues inside a rolled back transaction and time the availability search."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000,100000',
+                            help="Comma separated hotel counts to measure at.")
+        parser.add_argument('--hotels-per-city', type=int, default=100)
+        parser.add_argument('--rooms-per-hotel', type=int, default=4)
+        parser.add_argument('--booked-nights', type=int, default=10,
+                            help="Booked nights seeded per room.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        scales = sorted(int(scale) for scale in options['scales'].split(','))
+        check_in = date(2030, 5, 12)
+        check_out = check_in + timedelta(days=3)
+
+        with transaction.atomic():
+            seeded = 0
+            for scale in scales:
+                self.seed(seeded, scale, options)
+                seeded = scale
+
+                queryset = Hotel.objects.select_related('city').filter(
+                    city__name='City 0'
+                ).with_cheapest_available_room(
+                    check_in, check_out, room_type=Room.RoomChoices.DOUBLE, price_per_night__lte=Decimal('100')
+                ).order_by('cheapest_price', 'id')
+
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    results = HotelSearchResultSerializer(queryset, many=True).data
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                self.stdout.write(
+                    f"hotels={scale:>9} results={len(results):>4} "
+                    f"p50={statistics.median(timings):8.2f}ms max={max(timings):8.2f}ms"
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, start, stop, options):
+        hotels_per_city = options['hotels_per_city']
+        room_types = Room.RoomChoices.values
+        base_day = date(2030, 5, 1)
+        batch = 1000
+
+        for offset in range(start, stop, batch):
+            numbers = range(offset, min(offset + batch, stop))
+            cities = {}
+            for city_number in {number // hotels_per_city for number in numbers}:
+                cities[city_number], _ = City.objects.get_or_create(name=f"City {city_number}")
+
+            hotels = Hotel.objects.bulk_create([
+                Hotel(
+                    name=f"Hotel {number}",
+                    description="Benchmark hotel",
+                    city=cities[number // hotels_per_city],
+                    address=f"{number} Benchmark St",
+                )
+                for number in numbers
+            ])
+            rooms = Room.objects.bulk_create([
+                Room(
+                    hotel=hotel,
+                    room_type=room_types[(hotel.id + i) % len(room_types)],
+                    price_per_night=Decimal(50 + (hotel.id * 7 + i * 13) % 150),
+                    stock=1 + i % 3,
+                )
+                for hotel in hotels
+                for i in range(options['rooms_per_hotel'])
+            ])
+            RoomNight.objects.bulk_create([
+                RoomNight(room=room, date=base_day + timedelta(days=(room.id + n) % 30), booked=room.stock)
+                for room in rooms
+                for n in range(options['booked_nights'])
+            ], ignore_conflicts=True)
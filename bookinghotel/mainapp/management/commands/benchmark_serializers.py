@@ -0,0 +1,78 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from mainapp.models import Booking, City, Hotel, Room
+from mainapp.rows import BookingRows, HotelRows, RoomRows
+from mainapp.serializers import BookingSerializer, HotelSerializer, RoomSerializer
+
+
+class Command(BaseCommand):
+    help = ("Seed hotels, rooms and bookings inside a rolled back transaction and time the model serializers "
+            "against the row serializers of the list endpoints, queries included.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Objects serialized per run.")
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        context = {'request': Request(APIRequestFactory().get('/api/hotels/'))}
+        with transaction.atomic():
+            user = self.seed(count)
+            cases = [
+                ('hotels', Hotel.objects.select_related('city').order_by('id')[:count], HotelSerializer, HotelRows),
+                ('rooms', Room.objects.select_related('hotel__city').order_by('id')[:count], RoomSerializer,
+                 RoomRows),
+                ('bookings', Booking.objects.select_related('room__hotel__city').filter(user=user)
+                 .order_by('-created_at', '-id')[:count], BookingSerializer, BookingRows),
+            ]
+            self.stdout.write(f"{'payload':<10}{'objects':>9}{'serializer ms':>15}{'rows ms':>10}{'speedup':>9}")
+            for name, queryset, serializer_class, rows_class in cases:
+                model_ms = self.time(lambda: serializer_class(queryset.all(), many=True, context=context).data,
+                                     options['repeat'])
+                rows_ms = self.time(lambda: rows_class(rows_class(context=context).rows(queryset.all()),
+                                                       many=True, context=context).data, options['repeat'])
+                self.stdout.write(f"{name:<10}{count:>9}{model_ms:>15.2f}{rows_ms:>10.2f}"
+                                  f"{model_ms / rows_ms:>8.1f}x")
+            transaction.set_rollback(True)
+
+    def time(self, build, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            build()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def seed(self, count):
+        user = get_user_model().objects.create_user(username='benchmark-serializers', password='unused')
+        cities = City.objects.bulk_create([City(name=f"Benchmark City {i}") for i in range(max(1, count // 50))])
+        hotels = Hotel.objects.bulk_create([
+            Hotel(
+                name=f"Hotel {i}", description="Benchmark hotel", city=cities[i % len(cities)],
+                address=f"{i} Benchmark St", rating_sum=4 * i, rating_count=i, rating_avg=4.0,
+                # every other hotel has a rendered image, so both branches are timed
+                image=f"hotels/{i}.jpg" if i % 2 else None,
+                image_variants={'thumb': {'width': 320, 'height': 240, 'webp': f"hotels/{i}_thumb.webp",
+                                          'jpeg': f"hotels/{i}_thumb.jpg"}} if i % 2 else {},
+            )
+            for i in range(count)
+        ])
+        rooms = Room.objects.bulk_create([
+            Room(hotel=hotel, room_type=Room.RoomChoices.DOUBLE, price_per_night=Decimal('99.50'), stock=2)
+            for hotel in hotels
+        ])
+        Booking.objects.bulk_create([
+            Booking(user=user, room=room, check_in=date(2030, 1, 1) + timedelta(days=i % 300),
+                    check_out=date(2030, 1, 3) + timedelta(days=i % 300))
+            for i, room in enumerate(rooms)
+        ])
+        return user
@@ -0,0 +1,115 @@
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.models import Hotel
+
+SERVERS = {
+    'wsgi': ['-m', 'gunicorn', 'bookinghotel.wsgi:application'],
+    'asgi': ['-m', 'gunicorn', 'bookinghotel.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+class Command(BaseCommand):
+    help = ("Start the WSGI and the ASGI server with the same worker count against the current database "
+            "and compare requests per second on the catalogue read endpoints. Pass --settings to run both "
+            "servers under another settings module, e.g. bookinghotel.settings_bench to avoid throttling.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32, help="Client connections per endpoint run.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per endpoint and server.")
+        parser.add_argument('--port', type=int, default=8700)
+
+    def handle(self, *args, **options):
+        hotel_id = Hotel.objects.order_by('id').values_list('id', flat=True).first()
+        if hotel_id is None:
+            raise CommandError("Seed some hotels first, e.g. with import_catalog.")
+        search = urlencode({'check_in': '2030-05-12', 'check_out': '2030-05-15'})
+        endpoints = [
+            ('hotel list', '/api/hotels/', '/api/async/hotels/'),
+            ('hotel detail', f'/api/hotels/{hotel_id}/', f'/api/async/hotels/{hotel_id}/'),
+            ('rooms by hotel', f'/api/hotels/{hotel_id}/rooms/', f'/api/async/hotels/{hotel_id}/rooms/'),
+            ('reviews', f'/api/hotels/{hotel_id}/reviews/', f'/api/async/hotels/{hotel_id}/reviews/'),
+            ('availability', f'/api/search/?{search}', f'/api/async/search/?{search}'),
+        ]
+        host = next((name for name in settings.ALLOWED_HOSTS if '*' not in name), 'localhost').lstrip('.')
+
+        results = {}
+        for offset, (server, command) in enumerate(SERVERS.items()):
+            port = options['port'] + offset
+            process = self.start(command, port, options['workers'])
+            try:
+                for name, sync_path, async_path in endpoints:
+                    path = async_path if server == 'asgi' else sync_path
+                    results[name, server] = self.load(port, host, path, options)
+            finally:
+                process.terminate()
+                process.wait()
+
+        self.stdout.write(f"{'endpoint':<16}{'wsgi rps':>12}{'asgi rps':>12}{'ratio':>8}  statuses")
+        for name, _, _ in endpoints:
+            (wsgi_rps, wsgi_codes), (asgi_rps, asgi_codes) = results[name, 'wsgi'], results[name, 'asgi']
+            ratio = asgi_rps / wsgi_rps if wsgi_rps else 0
+            self.stdout.write(
+                f"{name:<16}{wsgi_rps:>12.1f}{asgi_rps:>12.1f}{ratio:>7.2f}x  "
+                f"wsgi={dict(wsgi_codes)} asgi={dict(asgi_codes)}"
+            )
+
+    def start(self, command, port, workers):
+        # the same middleware on both sides, so only the server model differs
+        env = dict(os.environ, SILK_MIDDLEWARE='0', DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        process = subprocess.Popen(
+            [sys.executable, *command, '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                http.client.HTTPConnection('127.0.0.1', port, timeout=1).connect()
+                return process
+            except OSError:
+                if process.poll() is not None:
+                    break
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f"{' '.join(command)} did not start on port {port}.")
+
+    def load(self, port, host, path, options):
+        statuses = Counter()
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options['duration']
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            seen = Counter()
+            while time.monotonic() < stop_at:
+                try:
+                    connection.request('GET', path, headers={'Host': host})
+                    response = connection.getresponse()
+                    response.read()
+                    seen[response.status] += 1
+                except (OSError, http.client.HTTPException):
+                    seen['error'] += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.close()
+            with lock:
+                statuses.update(seen)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            for _ in range(options['concurrency']):
+                pool.submit(client)
+        elapsed = time.monotonic() - started
+        return statuses.get(200, 0) / elapsed, statuses
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.exports import EXPORTS, EXPORT_FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream every booking (with total price) or review to stdout or a file as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--output', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--file', help="Write here instead of stdout.")
+        parser.add_argument('--since', help="Only rows created on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--until', help="Only rows created before this date (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        chunks = stream_export(options['kind'], options['output'], options['since'], options['until'])
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as target:
+                target.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
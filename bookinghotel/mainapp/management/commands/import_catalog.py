@@ -0,0 +1,198 @@
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mainapp.caching import bump_namespaces
+from mainapp.models import City, Hotel, Room, Booking, ImportCheckpoint
+from mainapp.search import index_hotels
+
+User = get_user_model()
+
+
+def read_rows(path, file_format):
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            for row in csv.DictReader(source):
+                # short rows come back with None for the missing columns
+                yield {key: value for key, value in row.items() if key is not None and value is not None}
+        else:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = ("Stream hotels, rooms or bookings from a CSV or JSONL file into the database in batches. "
+            "Hotels: name, description, city, address. "
+            "Rooms: hotel_id, or hotel and city, room_type, price_per_night, stock. "
+            "Bookings: username, room_id, check_in, check_out, status; confirmed bookings that no longer fit "
+            "their room are skipped and reported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['hotels', 'rooms', 'bookings'])
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true',
+                            help="Skip the rows committed by a previous run of the same file.")
+
+    def handle(self, *args, **options):
+        path = Path(options['path']).resolve()
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+        file_format = options['format'] or ('jsonl' if path.suffix in ('.jsonl', '.ndjson') else 'csv')
+        import_batch = getattr(self, f"import_{options['kind']}")
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=f"{options['kind']}:{path}")
+        skip = checkpoint.rows_done if options['resume'] else 0
+
+        rows = read_rows(path, file_format)
+        for _ in islice(rows, skip):
+            pass
+
+        done, started = skip, time.perf_counter()
+        self.rejected = []
+        while batch := list(islice(rows, options['batch_size'])):
+            self.touched_cities, self.touched_hotels = set(), set()
+            self.first_row = done + 1
+            with transaction.atomic():
+                try:
+                    import_batch(batch)
+                except (KeyError, ValueError, InvalidOperation) as exc:
+                    raise CommandError(f"Bad row between rows {done + 1} and {done + len(batch)}: {exc!r}")
+                done += len(batch)
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(rows_done=done)
+                # per batch, so the batches committed before a failing one are not left cached stale
+                self.invalidate_caches()
+            rate = (done - skip) / (time.perf_counter() - started)
+            self.stdout.write(f"{options['kind']}: {done} rows ({rate:.0f} rows/s)")
+
+        if self.rejected:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {len(self.rejected)} confirmed bookings their rooms had no stock left for, "
+                f"rows {', '.join(map(str, self.rejected))}."
+            ))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {done - skip} {options['kind']} in {elapsed:.1f}s "
+            f"({(done - skip) / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+
+    def resolve_cities(self, names):
+        cities = dict(City.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = [City(name=name) for name in set(names) - cities.keys()]
+        for city in City.objects.bulk_create(missing):
+            cities[city.name] = city.id
+        return cities
+
+    def import_hotels(self, batch):
+        cities = self.resolve_cities({row['city'] for row in batch})
+        hotels = Hotel.objects.bulk_create([
+            Hotel(
+                name=row['name'],
+                description=row.get('description', ''),
+                city_id=cities[row['city']],
+                address=row['address'],
+            )
+            for row in batch
+        ])
+        index_hotels(hotel.id for hotel in hotels)
+        self.touched_cities.update(cities.values())
+
+    def resolve_hotels(self, batch):
+        """Hotel id per row: its hotel_id, or the one hotel of that name in that city."""
+        pairs = {(row['hotel'], row['city']) for row in batch if not row.get('hotel_id')}
+        named = Counter()
+        hotels = {}
+        if pairs:
+            for name, city, hotel_id in Hotel.objects.filter(
+                name__in={name for name, _ in pairs}, city__name__in={city for _, city in pairs}
+            ).values_list('name', 'city__name', 'id'):
+                named[(name, city)] += 1
+                hotels[(name, city)] = hotel_id
+        given = {int(row['hotel_id']) for row in batch if row.get('hotel_id')}
+        unknown = given - set(Hotel.objects.filter(id__in=given).values_list('id', flat=True))
+        if unknown:
+            raise ValueError(f"unknown hotel_id {min(unknown)}")
+
+        hotel_ids = []
+        for row in batch:
+            if row.get('hotel_id'):
+                hotel_ids.append(int(row['hotel_id']))
+                continue
+            pair = (row['hotel'], row['city'])
+            if named[pair] > 1:
+                raise ValueError(f"{named[pair]} hotels are named {row['hotel']!r} in {row['city']!r}; "
+                                 f"give their hotel_id")
+            hotel_ids.append(hotels[pair])
+        return hotel_ids
+
+    def import_rooms(self, batch):
+        rooms = []
+        for row, hotel_id in zip(batch, self.resolve_hotels(batch)):
+            if row['room_type'] not in Room.RoomChoices.values:
+                raise ValueError(f"unknown room_type {row['room_type']!r}")
+            rooms.append(Room(
+                hotel_id=hotel_id,
+                room_type=row['room_type'],
+                price_per_night=Decimal(str(row['price_per_night'])),
+                stock=int(row.get('stock') or 0),
+            ))
+        Room.objects.bulk_create(rooms)
+        self.touched_hotels.update(room.hotel_id for room in rooms)
+
+    def import_bookings(self, batch):
+        users = dict(User.objects.filter(username__in={row['username'] for row in batch}).values_list('username', 'id'))
+        rooms = Room.objects.in_bulk({int(row['room_id']) for row in batch})
+        bookings = []
+        for row in batch:
+            booking = Booking(
+                user_id=users[row['username']],
+                room_id=int(row['room_id']),
+                check_in=date.fromisoformat(row['check_in']),
+                check_out=date.fromisoformat(row['check_out']),
+                status=row.get('status') or Booking.BookingStatus.PENDING,
+            )
+            if booking.room_id not in rooms:
+                raise ValueError(f"unknown room_id {booking.room_id}")
+            if booking.status not in Booking.BookingStatus.values:
+                raise ValueError(f"unknown status {booking.status!r}")
+            if booking.check_in >= booking.check_out:
+                raise ValueError("check_out must be after check_in")
+            bookings.append(booking)
+        Booking.objects.bulk_create(bookings)
+
+        # imported confirmed stays claim their nights like confirm_pending_bookings, in file order,
+        # and the ones that no longer fit are left out rather than overselling the room
+        confirmed = defaultdict(list)
+        for booking in bookings:
+            if booking.status == Booking.BookingStatus.CONFIRMED:
+                confirmed[booking.room_id].append(booking)
+        accepted = set()
+        for room_id, stays in confirmed.items():
+            accepted.update(booking.pk for booking in rooms[room_id].reserve_stays(stays))
+        rejected = [
+            (row, booking.pk) for row, booking in enumerate(bookings, self.first_row)
+            if booking.status == Booking.BookingStatus.CONFIRMED and booking.pk not in accepted
+        ]
+        if rejected:
+            Booking.objects.filter(pk__in=[pk for _, pk in rejected]).delete()
+            self.rejected += [row for row, _ in rejected]
+
+    def invalidate_caches(self):
+        # bulk_create skips the model signals that normally bump these
+        bump_namespaces(
+            'cities', 'hotels', 'rooms',
+            *(f'city:{city_id}:hotels' for city_id in self.touched_cities),
+            *(f'hotel:{hotel_id}:rooms' for hotel_id in self.touched_hotels),
+        )
@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.loadtest import SCENARIOS, Pools, api_endpoints, regressions, run, seed
+
+
+class Command(BaseCommand):
+    help = ("Seed a realistic catalogue and drive every API endpoint with concurrent clients, reporting "
+            "p50/p95/p99 latency, throughput and queries per request. Runs only under a load-test settings "
+            "profile, e.g. --settings=bookinghotel.settings_bench, because it writes to the database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotels', type=int, default=2000)
+        parser.add_argument('--rooms-per-hotel', type=int, default=4)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--only', help="Regex on url names, e.g. 'hotel|async'.")
+        parser.add_argument('--save-baseline', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Fail if a result regressed against this JSON file.")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed relative p95 growth over the baseline.")
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'LOADTEST_PROFILE', False):
+            raise CommandError("Refusing to run outside a load-test profile; pass "
+                               "--settings=bookinghotel.settings_bench.")
+        missing = {name for name, _ in api_endpoints()} - SCENARIOS.keys()
+        if missing:
+            raise CommandError(f"No load-test scenario for: {', '.join(sorted(missing))}.")
+
+        call_command('migrate', verbosity=0)
+        seed(options['hotels'], options['rooms_per_hotel'], options['users'], options['bookings'],
+             options['reviews'], stdout=self.stdout)
+        pools = Pools()
+        pools.load()
+
+        results = run(pools, options['requests'], options['concurrency'], options['only'])
+
+        self.stdout.write(f"{'endpoint':<48}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                          f"{'rps':>9}{'queries':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result.route:<48}{result.requests:>6}{len(result.errors):>5}{result.p50:>9.1f}"
+                f"{result.p95:>9.1f}{result.p99:>9.1f}{result.rps:>9.1f}{result.queries:>9}"
+            )
+        failed = [f"{result.route}: {len(result.errors)} error responses, e.g. {result.errors[0]}"
+                  for result in results if result.errors]
+
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps({
+                result.route: {'p50': result.p50, 'p95': result.p95, 'p99': result.p99,
+                               'rps': result.rps, 'queries': result.queries}
+                for result in results
+            }, indent=2))
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+            failed += regressions(results, baseline, options['threshold'])
+
+        if failed:
+            raise CommandError("Load test failed:\n" + "\n".join(failed))
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} endpoints within budget."))
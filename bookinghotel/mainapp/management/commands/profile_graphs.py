@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from silk.models import Request
+
+from mainapp.profiling import write_call_graph
+
+
+class Command(BaseCommand):
+    help = ("Render the cProfile dumps of the requests Silk profiled as Graphviz call graphs next to "
+            "the dumps, e.g. dot -Tsvg profiles/<name>.dot -o graph.svg. The Silk UI draws the same "
+            "graphs under /silk/.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Regex on the request path, e.g. '^/api/search/'.")
+        parser.add_argument('--cutoff', type=float, default=0.5,
+                            help="Hide functions below this percentage of the total time.")
+        parser.add_argument('--force', action='store_true', help="Overwrite graphs that already exist.")
+
+    def handle(self, *args, **options):
+        requests = Request.objects.exclude(prof_file='').order_by('start_time')
+        if options['path']:
+            requests = requests.filter(path__regex=options['path'])
+        written = 0
+        for request in requests.iterator():
+            prof_path = Path(request.prof_file.path)
+            if not options['force'] and prof_path.with_suffix('.dot').exists():
+                continue
+            dot_path = write_call_graph(prof_path, options['cutoff'])
+            self.stdout.write(f"{request.method} {request.path} -> {dot_path}")
+            written += 1
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} call graphs."))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mainapp.profiling import HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = ("Print a signed header value that makes Silk profile the requests carrying it, "
+            "e.g. curl -H 'X-Profile: <token>' ...")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--label', default='manual', help="Free text kept in the token, e.g. your name.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{HEADER}: {make_token(options['label'])}")
+        self.stderr.write(f"Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.models import Hotel
+from mainapp.signals import bump_hotel
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating sum, count and average of every hotel from its reviews."
+
+    def handle(self, *args, **options):
+        updated = Hotel.objects.all().rebuild_ratings()
+        for hotel_id, city_id in Hotel.objects.values_list('id', 'city_id').iterator(chunk_size=2000):
+            bump_hotel(hotel_id, city_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} hotels."))
@@ -0,0 +1,200 @@
+"""Lightweight process metrics rendered in the Prometheus text format.
+
+Requests, query counts and cache lookups are aggregated in memory per worker; every worker
+periodically publishes a cumulative snapshot to the cache, and ``/metrics`` sums the snapshots of
+the workers seen within ``WORKER_TTL``. Workers are tracked by last flush time, in a Redis sorted
+set when the cache is django-redis, so ones that exited drop out like a restarted process.
+``observe()`` keeps shared count/sum pairs for processes without a request cycle, such as the
+Celery workers.
+"""
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+
+from django.core.cache import cache
+
+METRIC_PREFIX = 'metric'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 10
+SNAPSHOT_TTL = 60 * 60 * 24
+# a worker that has not flushed for this long is treated as gone
+WORKER_TTL = 60 * 60
+WORKERS_KEY = f'{METRIC_PREFIX}:workers'
+
+HELP = {
+    'http_requests_total': ('counter', "Requests served, by view, method and status."),
+    'http_request_duration_seconds': ('histogram', "Request latency, by view and method."),
+    'db_queries_total': ('counter', "Database queries run while serving requests, by view."),
+    'db_query_duration_seconds_total': ('counter', "Time spent in database queries, by view."),
+    'cache_requests_total': ('counter', "Response cache lookups, by cache name and result."),
+    'throttle_rejections_total': ('counter', "Requests rejected by a throttle, by scope."),
+}
+
+
+def _key(name, field):
+    return f'{METRIC_PREFIX}:{name}:{field}'
+
+
+def _incr(key, delta):
+    # add() is a no-op when the counter exists, so concurrent first writers cannot reset it
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def observe(name, *values):
+    """Adds integer observations to a shared count/sum pair, visible to every process using the cache."""
+    if values:
+        _incr(_key(name, 'count'), len(values))
+        _incr(_key(name, 'sum'), sum(values))
+
+
+def snapshot(*names):
+    keys = [_key(name, field) for name in names for field in ('count', 'sum')]
+    stored = cache.get_many(keys)
+    result = {}
+    for name in names:
+        count = stored.get(_key(name, 'count'), 0)
+        total = stored.get(_key(name, 'sum'), 0)
+        result[name] = {'count': count, 'sum': total, 'mean': total / count if count else 0}
+    return result
+
+
+@lru_cache
+def _redis():
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def touch_worker(worker):
+    """Records that ``worker`` just published its snapshot."""
+    redis = _redis()
+    if redis is not None:
+        redis.zadd(WORKERS_KEY, {worker: time.time()})
+        return
+    # a lost race only drops the entry until that worker's next flush
+    workers = cache.get(WORKERS_KEY) or {}
+    workers[worker] = time.time()
+    cache.set(WORKERS_KEY, workers, timeout=SNAPSHOT_TTL)
+
+
+def live_workers():
+    """The workers seen within WORKER_TTL, after forgetting the others."""
+    cutoff = time.time() - WORKER_TTL
+    redis = _redis()
+    if redis is not None:
+        redis.zremrangebyscore(WORKERS_KEY, '-inf', cutoff)
+        return [worker.decode() for worker in redis.zrange(WORKERS_KEY, 0, -1)]
+    workers = cache.get(WORKERS_KEY) or {}
+    live = {worker: seen for worker, seen in workers.items() if seen > cutoff}
+    if len(live) < len(workers):
+        cache.set(WORKERS_KEY, live, timeout=SNAPSHOT_TTL)
+    return list(live)
+
+
+SHARED_SUMMARIES = ('booking_confirmation_batch_size', 'booking_confirmation_lag_ms', 'booking_expired')
+
+
+class Registry:
+    """Counters and histograms of this process, keyed by (name, sorted label pairs)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(float)
+            self.histograms = {}
+            self.flushed_at = time.monotonic()
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[name, tuple(sorted(labels.items()))] += amount
+
+    def observe(self, name, value, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self.lock:
+            buckets, total = self.histograms.get(key, ([0] * (len(LATENCY_BUCKETS) + 1), 0.0))
+            buckets[bisect_left(LATENCY_BUCKETS, value)] += 1
+            self.histograms[key] = buckets, total + value
+
+    def export(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {key: (list(buckets), total) for key, (buckets, total) in self.histograms.items()},
+            }
+
+    def maybe_flush(self, force=False):
+        if not force and time.monotonic() - self.flushed_at < FLUSH_INTERVAL:
+            return
+        self.flushed_at = time.monotonic()
+        cache.set(f'{METRIC_PREFIX}:worker:{self.worker}', self.export(), timeout=SNAPSHOT_TTL)
+        touch_worker(self.worker)
+
+
+registry = Registry()
+
+
+def record_cache(name, hit):
+    registry.inc('cache_requests_total', cache=name, result='hit' if hit else 'miss')
+
+
+def collect():
+    """Sums the published snapshots of every worker, this one included."""
+    registry.maybe_flush(force=True)
+    workers = live_workers()
+    snapshots = cache.get_many([f'{METRIC_PREFIX}:worker:{worker}' for worker in workers]).values()
+
+    counters, histograms = defaultdict(float), {}
+    for exported in snapshots:
+        for key, value in exported['counters'].items():
+            counters[key] += value
+        for key, (buckets, total) in exported['histograms'].items():
+            merged, merged_total = histograms.get(key, ([0] * len(buckets), 0.0))
+            histograms[key] = [a + b for a, b in zip(merged, buckets)], merged_total + total
+    return counters, histograms
+
+
+def _labels(pairs, **extra):
+    pairs = [*pairs, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value:g}')
+        else:
+            for (metric, labels), (buckets, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip([*LATENCY_BUCKETS, '+Inf'], buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines += [f'{name}_sum{_labels(labels)} {total:g}', f'{name}_count{_labels(labels)} {cumulative}']
+
+    for name, summary in snapshot(*SHARED_SUMMARIES).items():
+        lines += [f'# TYPE {name} summary', f"{name}_sum {summary['sum']}", f"{name}_count {summary['count']}"]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,66 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+# [queries, seconds] for the request being served; async views reach the ORM through
+# sync_to_async, which carries the context over to the worker thread
+_query_stats = ContextVar('query_stats', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def _record(request, response, started, stats):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else 'unmatched'
+    elapsed = time.perf_counter() - started
+    metrics.registry.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+    metrics.registry.observe('http_request_duration_seconds', elapsed, view=view, method=request.method)
+    if stats[0]:
+        metrics.registry.inc('db_queries_total', stats[0], view=view)
+        metrics.registry.inc('db_query_duration_seconds_total', stats[1], view=view)
+    metrics.registry.maybe_flush()
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    """Records latency, status and database work per view into the process metrics registry."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started, stats = time.perf_counter(), [0, 0.0]
+            token = _query_stats.set(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                _query_stats.reset(token)
+            _record(request, response, started, stats)
+            return response
+    else:
+        def middleware(request):
+            started, stats = time.perf_counter(), [0, 0.0]
+            token = _query_stats.set(stats)
+            try:
+                response = get_response(request)
+            finally:
+                _query_stats.reset(token)
+            _record(request, response, started, stats)
+            return response
+    return middleware
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0004_alter_hotel_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='mainapp.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'date'), name='unique_room_night')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0005_roomnight'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['hotel', 'room_type', 'price_per_night'], name='room_search_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:55
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_ratings(apps, schema_editor):
+    Hotel = apps.get_model('mainapp', 'Hotel')
+    Review = apps.get_model('mainapp', 'Review')
+    reviews = Review.objects.filter(hotel=OuterRef('pk')).order_by().values('hotel')
+    Hotel.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+    )
+    Hotel.objects.update(rating_avg=Case(
+        When(rating_count__gt=0, then=Cast('rating_sum', models.FloatField()) / F('rating_count')),
+        default=Value(0.0),
+        output_field=models.FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0007_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+        # built after the backfill, over the final values
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['rating_avg', 'id'], name='hotel_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# The search table as of this migration; mainapp.search keeps it up to date from here on.
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS mainapp_hotel_search (
+        hotel_id bigint PRIMARY KEY REFERENCES mainapp_hotel (id)
+            ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS mainapp_hotel_search_document_gin "
+    "ON mainapp_hotel_search USING gin (document)",
+    """
+    INSERT INTO mainapp_hotel_search (hotel_id, document)
+    SELECT h.id,
+           setweight(to_tsvector('english', coalesce(h.name, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(c.name, '')), 'B') ||
+           setweight(to_tsvector('english', coalesce(h.address, '')), 'C') ||
+           setweight(to_tsvector('english', coalesce(h.description, '')), 'D')
+    FROM mainapp_hotel h JOIN mainapp_city c ON c.id = h.city_id
+    ON CONFLICT (hotel_id) DO UPDATE SET document = EXCLUDED.document
+    """,
+]
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS mainapp_hotel_search USING fts5(name, city, address, description)",
+    """
+    INSERT INTO mainapp_hotel_search (rowid, name, city, address, description)
+    SELECT h.id, h.name, c.name, h.address, h.description
+    FROM mainapp_hotel h JOIN mainapp_city c ON c.id = h.city_id
+    """,
+]
+
+DROP = ["DROP TABLE IF EXISTS mainapp_hotel_search"]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_CREATE, 'sqlite': SQLITE_CREATE}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        for statement in DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0008_hotel_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
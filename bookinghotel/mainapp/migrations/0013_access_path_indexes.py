@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0012_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['city', 'id'], name='hotel_city_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['hotel', 'id'], name='room_hotel_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['hotel', 'price_per_night', 'id'], name='room_available_price_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0013_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='city',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='mainapp.city'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='hotel',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='mainapp.hotel'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='hotel',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='mainapp.hotel'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_histogram(apps, schema_editor):
+    Hotel = apps.get_model('mainapp', 'Hotel')
+    Review = apps.get_model('mainapp', 'Review')
+    reviews = Review.objects.filter(hotel=OuterRef('pk')).order_by().values('hotel')
+    Hotel.objects.update(**{
+        f'rating_{rating}_count': Coalesce(
+            Subquery(reviews.filter(rating=rating).annotate(total=Count('id')).values('total')), 0
+        )
+        for rating in range(1, 6)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0014_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['hotel', '-rating', '-created_at', '-id'], name='review_hotel_rating_idx'),
+        ),
+        migrations.RunPython(backfill_histogram, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,21 @@
+from collections import Counter
+from datetime import timedelta
+
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Exists, OuterRef, Subquery, Case, When, Value, Count, Sum, Func
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth.models import AbstractUser
 
 
+RATINGS = range(1, 6)
+
+
+def rating_count_field(rating):
+    """The Hotel counter of reviews with ``rating`` stars."""
+    return f'rating_{rating}_count'
+
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
 
@@ -16,17 +29,95 @@ class City(models.Model):
         return self.name
 
 
+class HotelQuerySet(models.QuerySet):
+    def with_cheapest_available_room(self, check_in, check_out, **room_filters):
+        rooms = (
+            Room.objects.available_for(check_in, check_out)
+            .filter(hotel=OuterRef('pk'), **room_filters)
+            .order_by('price_per_night', 'id')
+        )
+        return self.annotate(
+            cheapest_room_id=Subquery(rooms.values('id')[:1]),
+            cheapest_room_type=Subquery(rooms.values('room_type')[:1]),
+            cheapest_price=Subquery(rooms.values('price_per_night')[:1]),
+        ).filter(cheapest_room_id__isnull=False)
+
+    def add_rating(self, rating, count=1):
+        """Counts ``count`` more reviews of ``rating`` stars, or removes them when negative."""
+        field = rating_count_field(rating)
+        with transaction.atomic():
+            self.update(rating_sum=F('rating_sum') + rating * count, rating_count=F('rating_count') + count,
+                        **{field: F(field) + count})
+            return self.update(rating_avg=_rating_average())
+
+    def rebuild_ratings(self):
+        reviews = Review.objects.filter(hotel=OuterRef('pk')).order_by().values('hotel')
+        with transaction.atomic():
+            self.update(
+                rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+                rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+                **{
+                    rating_count_field(rating): Coalesce(
+                        Subquery(reviews.filter(rating=rating).annotate(total=Count('id')).values('total')), 0
+                    )
+                    for rating in RATINGS
+                },
+            )
+            return self.update(rating_avg=_rating_average())
+
+
+def _rating_average():
+    return Case(
+        When(rating_count__gt=0, then=Cast('rating_sum', models.FloatField()) / F('rating_count')),
+        default=Value(0.0),
+        output_field=models.FloatField(),
+    )
+
+
 class Hotel(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
-    city = models.ForeignKey(City, on_delete=models.CASCADE)
+    # indexed by hotel_city_id_idx
+    city = models.ForeignKey(City, on_delete=models.CASCADE, db_index=False)
     address = models.CharField(max_length=255)
     image = models.ImageField(upload_to='hotels/',null=True,blank=True)
+    # sizes and storage names of the renditions, filled in by tasks.generate_image_variants
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # indexed by hotel_rating_id_idx
+    rating_avg = models.FloatField(default=0)
+    # reviews by number of stars, kept next to the totals for the review summary
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    objects = HotelQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['city', 'id'], name='hotel_city_id_idx'),
+            # ?ordering=rating_avg pages on (rating_avg, id); ?min_rating= can range-scan its prefix
+            models.Index(fields=['rating_avg', 'id'], name='hotel_rating_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.city.name}"
 
 
+class RoomQuerySet(models.QuerySet):
+    def available_for(self, check_in, check_out):
+        full_nights = RoomNight.objects.filter(
+            room=OuterRef('pk'),
+            date__gte=check_in,
+            date__lt=check_out,
+            booked__gte=OuterRef('stock'),
+        )
+        return self.filter(stock__gt=0).exclude(Exists(full_nights))
+
+
 class Room(models.Model):
     class RoomChoices(models.TextChoices):
         SINGLE = 'Single'
@@ -34,12 +125,24 @@ class Room(models.Model):
         LARGE = 'Large'
         VIP = 'Vip'
 
-    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE)
+    # indexed by room_hotel_id_idx
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, db_index=False)
     room_type = models.CharField(max_length=100, choices=RoomChoices.choices)
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
     image = models.ImageField(upload_to='rooms/',null=True,blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = RoomQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hotel', 'id'], name='room_hotel_id_idx'),
+            models.Index(fields=['hotel', 'room_type', 'price_per_night'], name='room_search_idx'),
+            # the cheapest available room of a hotel when no room type is asked for
+            models.Index(fields=['hotel', 'price_per_night', 'id'], name='room_available_price_idx',
+                         condition=Q(stock__gt=0)),
+        ]
 
     def __str__(self):
         return f"{self.hotel.name} - {self.room_type}"
@@ -48,9 +151,109 @@ class Room(models.Model):
     def is_available(self):
         return self.stock > 0
 
+    def is_available_for(self, check_in, check_out):
+        if not self.is_available:
+            return False
+        return not self.nights.filter(
+            date__gte=check_in, date__lt=check_out, booked__gte=self.stock
+        ).exists()
+
+    def reserve_nights(self, check_in, check_out):
+        dates = stay_nights(check_in, check_out)
+        with transaction.atomic():
+            RoomNight.objects.bulk_create(
+                [RoomNight(room=self, date=day) for day in dates],
+                ignore_conflicts=True,
+            )
+            # lock in date order so overlapping stays cannot deadlock
+            list(self.nights.select_for_update().filter(date__in=dates).order_by('date').values_list('id', flat=True))
+            claimed = self.nights.filter(
+                date__in=dates, booked__lt=self.stock
+            ).update(booked=F('booked') + 1)
+            if claimed != len(dates):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    def reserve_stays(self, bookings):
+        """Claims nights for as many bookings as fit, in the given order, with one counter update.
+
+        Returns the bookings that fit. Must run inside the caller's transaction.
+        """
+        wanted = {booking.pk: stay_nights(booking.check_in, booking.check_out) for booking in bookings}
+        dates = sorted({day for days in wanted.values() for day in days})
+        if not dates or self.stock <= 0:
+            return []
+        RoomNight.objects.bulk_create(
+            [RoomNight(room=self, date=day) for day in dates],
+            ignore_conflicts=True,
+        )
+        booked = dict(
+            self.nights.select_for_update().filter(date__in=dates).order_by('date').values_list('date', 'booked')
+        )
+
+        demand, accepted = Counter(), []
+        for booking in bookings:
+            days = wanted[booking.pk]
+            if all(booked[day] + demand[day] < self.stock for day in days):
+                demand.update(days)
+                accepted.append(booking)
+
+        by_count = {}
+        for day, count in demand.items():
+            by_count.setdefault(count, []).append(day)
+        if by_count:
+            self.nights.filter(date__in=demand).update(booked=F('booked') + Case(
+                *(When(date__in=days, then=Value(count)) for count, days in by_count.items()),
+                default=Value(0),
+            ))
+        return accepted
+
+    def release_nights(self, check_in, check_out):
+        self.nights.filter(
+            date__gte=check_in, date__lt=check_out, booked__gt=0
+        ).update(booked=F('booked') - 1)
+
+
+def stay_nights(check_in, check_out):
+    return [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+
+
+class NightsBetween(Func):
+    """Whole days between two date expressions, computed by the database."""
+    template = '(%(expressions)s)'
+    arg_joiner = ' - '
+    output_field = models.IntegerField()
+
+    def __init__(self, check_in='check_in', check_out='check_out', **extra):
+        super().__init__(check_out, check_in, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+
+class RoomNight(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='nights')
+    date = models.DateField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='unique_room_night'),
+        ]
+
+    def __str__(self):
+        return f"{self.room} - {self.date} ({self.booked}/{self.room.stock})"
+
 
 class Booking(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # indexed by booking_user_created_idx
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     check_in = models.DateField()
     check_out = models.DateField()
@@ -67,19 +270,65 @@ class Booking(models.Model):
         default=BookingStatus.PENDING,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='booking_user_created_idx'),
+            models.Index(fields=['created_at'], name='booking_pending_created_idx',
+                         condition=Q(status='pending')),
+        ]
+
     def __str__(self):
         return f"Booking #{self.id} by {self.user.username}"
 
+    def _transition(self, source, target):
+        return Booking.objects.filter(pk=self.pk, status=source).update(status=target) == 1
+
+    def confirm(self):
+        with transaction.atomic():
+            if not self._transition(self.BookingStatus.PENDING, self.BookingStatus.CONFIRMED):
+                return False
+            if not self.room.reserve_nights(self.check_in, self.check_out):
+                transaction.set_rollback(True)
+                return False
+        self.status = self.BookingStatus.CONFIRMED
+        return True
+
+    def cancel(self):
+        with transaction.atomic():
+            if self._transition(self.BookingStatus.CONFIRMED, self.BookingStatus.CANCELLED):
+                self.room.release_nights(self.check_in, self.check_out)
+            elif not self._transition(self.BookingStatus.PENDING, self.BookingStatus.CANCELLED):
+                return False
+        self.status = self.BookingStatus.CANCELLED
+        return True
+
 
 class Review(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE)
+    # indexed by review_user_created_idx and review_hotel_created_idx
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, db_index=False)
     rating = models.IntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(5)]
     )
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hotel', '-created_at', '-id'], name='review_hotel_created_idx'),
+            models.Index(fields=['hotel', '-rating', '-created_at', '-id'], name='review_hotel_rating_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='review_user_created_idx'),
+        ]
+
     @property
     def is_positive(self):
         return self.rating >= 4
+
+
+class ImportCheckpoint(models.Model):
+    source = models.CharField(max_length=500, unique=True)
+    rows_done = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.rows_done} rows"
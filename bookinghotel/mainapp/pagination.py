@@ -0,0 +1,197 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor, PageNumberPagination, _reverse_ordering
+from rest_framework.utils.urls import remove_query_param
+
+STREAM_CHUNK_SIZE = 2000
+
+
+class KeysetCursorPagination(CursorPagination):
+    """CursorPagination whose cursor holds the values of every ordering field of the page's edge item.
+
+    DRF's cursor keeps only the first ordering field and skips ties on it with an offset capped at
+    ``offset_cutoff``, so an ordering with more ties than that loops on the same page. Here the
+    ordering always ends in ``id`` and the next page is the rows strictly after the whole key, so no
+    offset is needed however many rows share a value.
+    """
+    # the largest ``page_size`` a streamed page may ask for
+    stream_max_page_size = None
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset[:self.page_size + 1]))
+
+    def stream_queryset(self, queryset, request, view=None):
+        """paginate_queryset as an iterator over a server-side cursor, for pages too large to build in memory.
+
+        Invalid cursors raise here, before any row is read. Once the iterator is exhausted ``page``
+        holds the first and last items, which is all the links need. A backwards page is read in
+        reverse order, so it is built in memory as usual.
+        """
+        if self.stream_max_page_size is not None:
+            self.max_page_size = self.stream_max_page_size
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        if self.cursor is not None and self.cursor.reverse:
+            return iter(self.set_page(list(queryset[:self.page_size + 1])))
+        return self._stream_page(queryset[:self.page_size + 1].iterator(chunk_size=STREAM_CHUNK_SIZE))
+
+    def _stream_page(self, rows):
+        first = last = None
+        has_more = False
+        for count, item in enumerate(rows):
+            if count == self.page_size:
+                # the extra row only tells whether there is a next page
+                has_more = True
+                break
+            if count == 0:
+                first = item
+            last = item
+            yield item
+        self.page = [] if first is None else [first, last]
+        self.has_next, self.has_previous = has_more, self.position is not None
+
+    def page_queryset(self, queryset, request, view=None):
+        """The queryset ordered and filtered to the rows after the cursor, with the paginator's state set."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        self.position = None if self.cursor is None else self.cursor.position
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self.after(queryset, ordering, self.position))
+        return queryset
+
+    def after(self, queryset, ordering, position):
+        """Q for the rows after ``position`` in ``ordering``: (a, b, id) > (x, y, z) expanded field by field."""
+        try:
+            values = json.loads(position)
+            fields = [order.lstrip('-') for order in ordering]
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError(position)
+            values = [
+                queryset.query.resolve_ref(field).output_field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        lookups = [f"{field}__{'lt' if order.startswith('-') else 'gt'}" for field, order in zip(fields, ordering)]
+        condition, equal = Q(), {}
+        for field, lookup, value in zip(fields, lookups, values):
+            condition |= Q(**equal, **{lookup: value})
+            equal[field] = value
+        # the bound on the leading field alone lets the database range-scan an index on it
+        return Q(**{f'{lookups[0]}e': values[0]}) & condition
+
+    def set_page(self, results):
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # a backwards page came up empty: nothing precedes its cursor, so next is the first page
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.edge_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        # an empty forward page has nothing after its cursor, so previous is the last page
+        position = self.edge_position(self.page[0]) if self.page else None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def edge_position(self, item):
+        fields = [order.lstrip('-') for order in self.ordering]
+        values = [item[field] if isinstance(item, dict) else getattr(item, field) for field in fields]
+        return json.dumps([str(value) for value in values], separators=(',', ':'))
+
+
+class IdCursorPagination(KeysetCursorPagination):
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    stream_max_page_size = 10000
+
+
+class NewestFirstCursorPagination(IdCursorPagination):
+    ordering = ('-created_at', '-id')
+
+
+class CheapestFirstCursorPagination(IdCursorPagination):
+    ordering = ('cheapest_price', 'id')
+
+
+class ReviewCursorPagination(NewestFirstCursorPagination):
+    """Newest first, or highest rated first with ``?sort=rating``."""
+    sorts = {
+        'newest': ('-created_at', '-id'),
+        'rating': ('-rating', '-created_at', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        return self.sorts.get(request.query_params.get('sort'), self.ordering)
+
+
+class RankedPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class AsyncCursorPaginationMixin:
+    """KeysetCursorPagination.paginate_queryset for async views, reading the page through the async ORM.
+
+    Cursors are interchangeable with the sync paginator's.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([item async for item in queryset[:self.page_size + 1]])
+
+
+class AsyncIdCursorPagination(AsyncCursorPaginationMixin, IdCursorPagination):
+    pass
+
+
+class AsyncNewestFirstCursorPagination(AsyncCursorPaginationMixin, NewestFirstCursorPagination):
+    pass
+
+
+class AsyncCheapestFirstCursorPagination(AsyncCursorPaginationMixin, CheapestFirstCursorPagination):
+    pass
+
+
+class AsyncReviewCursorPagination(AsyncCursorPaginationMixin, ReviewCursorPagination):
+    pass
@@ -0,0 +1,78 @@
+"""On-demand request profiling through Silk.
+
+Silk records a request, its SQL and a cProfile run only when ``should_profile`` picks it: a random
+``PROFILING_SAMPLE_RATE`` share of traffic, paths matching ``PROFILING_PATHS``, or requests that carry
+an ``X-Profile`` header signed by the ``profile_token`` command. Every other request passes the Silk
+middleware without touching the database, so profiling can stay enabled in production.
+"""
+import os
+import random
+import re
+from functools import lru_cache
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from gprof2dot import TEMPERATURE_COLORMAP, DotWriter, PstatsParser
+
+HEADER = 'X-Profile'
+SALT = 'mainapp.profiling'
+
+
+def make_token(label='manual'):
+    return signing.TimestampSigner(salt=SALT).sign(label)
+
+
+def token_is_valid(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+@lru_cache
+def _path_pattern(patterns):
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+
+def should_profile(request):
+    token = request.headers.get(HEADER)
+    if token and token_is_valid(token):
+        return True
+    patterns = tuple(settings.PROFILING_PATHS)
+    if patterns and _path_pattern(patterns).search(request.path):
+        return True
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class ProfileStorage(FileSystemStorage):
+    """Keeps the binary cProfile dumps on local disk, whatever the default media storage is."""
+
+    def __init__(self):
+        super().__init__(location=settings.PROFILING_RESULT_PATH, base_url=None)
+
+    def deconstruct(self):
+        # silk's migrations record its own storage on Request.prof_file; which storage serves the
+        # dumps is deployment configuration, so ours deconstructs the same and needs no migration
+        return 'silk.storage.ProfilerResultStorage', (), {}
+
+    def open(self, name, mode='rb'):
+        # Silk opens the dump for writing directly, which FileSystemStorage.save() would do for us
+        if 'w' in mode:
+            os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        return super().open(name, mode)
+
+
+def write_call_graph(prof_path, cutoff=0.5):
+    """Renders a cProfile dump as a Graphviz call graph next to it and returns the .dot path."""
+    profile = PstatsParser(str(prof_path)).parse()
+    profile.prune(cutoff / 100.0, 0.1 / 100.0, [], False)
+    output = StringIO()
+    DotWriter(output).graph(profile, TEMPERATURE_COLORMAP)
+    dot_path = Path(prof_path).with_suffix('.dot')
+    dot_path.write_text(output.getvalue())
+    return dot_path
@@ -0,0 +1,109 @@
+"""JSON rendering and parsing through orjson, falling back to DRF's stdlib implementation.
+
+Output matches ``rest_framework.renderers.JSONRenderer`` byte for byte in its default, compact
+form: types orjson does not handle natively (Decimal, datetime, lazy strings, querysets, ...)
+go through DRF's ``JSONEncoder.default``. ``StreamingJSONRenderer`` (``?format=json-stream``)
+sends list pages as they are read from the database, through ``StreamingListMixin``.
+"""
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib renderer takes over
+    orjson = None
+
+STREAM_CHUNK_ITEMS = 100
+
+_drf_default = JSONEncoder().default
+
+
+def _default(obj):
+    if type(obj) is Decimal:
+        return float(obj)
+    return _drf_default(obj)
+
+
+if orjson is not None:
+    # datetimes are left to DRF's encoder, which writes UTC as "Z" like the stdlib renderer
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the stdlib still writes
+            return super().render(data, accepted_media_type, renderer_context)
+        # like JSONRenderer, keep the output a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # rejects NaN and Infinity, as the strict stdlib parser does
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    """Same JSON as FastJSONRenderer; views with StreamingListMixin send lists through ``stream``."""
+    format = 'json-stream'
+
+    def stream(self, items, tail, chunk_items=STREAM_CHUNK_ITEMS):
+        """Yields ``{"results": [...items], **tail()}``, encoding ``chunk_items`` items at a time.
+
+        ``tail`` is called once the items are exhausted, so it can report what only the end of the
+        iteration knows, such as the next page's cursor.
+        """
+        yield b'{"results":['
+        separator = b''
+        while chunk := list(islice(items, chunk_items)):
+            yield separator + self.render(chunk)[1:-1]
+            separator = b','
+        rest = self.render(tail())
+        yield b']' + (b',' + rest[1:] if rest != b'{}' else b'}')
+
+
+class StreamingListMixin:
+    """Serves ``?format=json-stream`` lists from a server-side cursor instead of a page built in memory.
+
+    The page may be as large as the paginator's ``stream_max_page_size``; ``next`` and ``previous``
+    follow the results because they are only known once the last row has been read. Streamed pages
+    are never cached.
+    """
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = self.paginator
+        items = paginator.stream_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(many=True)
+        represent = getattr(serializer, 'child', serializer).to_representation
+        chunks = renderer.stream(
+            map(represent, items),
+            lambda: {'next': paginator.get_next_link(), 'previous': paginator.get_previous_link()},
+        )
+        return StreamingHttpResponse(chunks, content_type=renderer.media_type)
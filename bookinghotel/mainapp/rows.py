@@ -0,0 +1,202 @@
+"""Read-only serialization straight from ``.values()`` rows.
+
+``HotelRows``, ``RoomRows`` and ``BookingRows`` return exactly what ``HotelSerializer``,
+``RoomSerializer`` and ``BookingSerializer`` return for the same objects and the same ``?fields=``
+and ``?expand=``, without building model instances or running DRF's per-field machinery. Only the
+columns of the selected fields and expanded relations are read. ``RowsReadMixin`` swaps them in for
+GET list and retrieve; writes keep the model serializers.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from .fieldsets import child_expand, is_expanded, selection
+from .images import variant_urls
+from .models import Hotel
+
+CENTS = Decimal('0.01')
+
+
+def decimal_string(value):
+    # DecimalField(decimal_places=2) output
+    return format(value.quantize(CENTS), 'f')
+
+
+def datetime_string(value):
+    # DateTimeField output: ISO 8601 in the current time zone, UTC as "Z"
+    if settings.USE_TZ:
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class RowSerializer:
+    """The part of the serializer interface the generic views use, over rows from ``rows()``.
+
+    Nested rows share the parent's row, their columns prefixed with the relation path.
+    """
+    field_names = ()
+    # output field -> columns it reads, relative to the prefix
+    columns = {}
+    # relation -> (foreign key column, row serializer of the expanded object)
+    expandable = {}
+    # always read: cache namespaces and cursor positions need them
+    key_columns = ('id',)
+
+    def __init__(self, instance=None, many=False, context=None, fields=None, expand=None, prefix=''):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.request = self.context.get('request')
+        self.prefix = prefix
+        # every Hotel and Room image lives in the default storage
+        self.storage = Hotel._meta.get_field('image').storage
+
+        if fields is None and expand is None:
+            fields, expand = selection(self.request)
+        expand = expand or frozenset()
+        self.output = [name for name in self.field_names if fields is None or name in fields]
+        self.children = {
+            name: serializer_class(context=context, expand=child_expand(expand, name), prefix=f'{prefix}{name}__')
+            for name, (_, serializer_class) in self.expandable.items()
+            if name in self.output and is_expanded(expand, name)
+        }
+        self.getters = [(name, self.getter(name)) for name in self.output]
+
+    def getter(self, name):
+        if name in self.children:
+            return self.children[name].to_representation
+        if name in self.expandable:
+            column = self.prefix + self.expandable[name][0]
+            return lambda row: row[column]
+        custom = getattr(self, f'get_{name}', None)
+        if custom is not None:
+            return custom
+        column = self.prefix + self.columns[name][0]
+        return lambda row: row[column]
+
+    def selected_columns(self):
+        columns = [self.prefix + column for column in self.key_columns]
+        for name in self.output:
+            if name in self.children:
+                columns += self.children[name].selected_columns()
+            elif name in self.expandable:
+                columns.append(self.prefix + self.expandable[name][0])
+            else:
+                columns += [self.prefix + column for column in self.columns[name]]
+        return list(dict.fromkeys(columns))
+
+    def rows(self, queryset):
+        return queryset.values(*self.selected_columns())
+
+    @property
+    def data(self):
+        if self.many:
+            return ReturnList([self.to_representation(row) for row in self.instance], serializer=self)
+        return ReturnDict(self.to_representation(self.instance), serializer=self)
+
+    def to_representation(self, row):
+        return {name: getter(row) for name, getter in self.getters}
+
+    def column(self, row, name):
+        return row[self.prefix + name]
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = self.storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def get_image(self, row):
+        return self.image_url(self.column(row, 'image'))
+
+    def get_image_variants(self, row):
+        name, variants = self.column(row, 'image'), self.column(row, 'image_variants')
+        if not name or not variants:
+            return {}
+        return variant_urls(self.storage, variants)
+
+
+class CityRows(RowSerializer):
+    field_names = ('id', 'name')
+    columns = {'id': ('id',), 'name': ('name',)}
+
+
+class HotelRows(RowSerializer):
+    field_names = ('id', 'name', 'description', 'city', 'address', 'image', 'image_variants', 'average_rating',
+                   'review_count')
+    columns = {
+        'id': ('id',), 'name': ('name',), 'description': ('description',), 'address': ('address',),
+        'image': ('image',), 'image_variants': ('image', 'image_variants'),
+        'average_rating': ('rating_avg',), 'review_count': ('rating_count',),
+    }
+    expandable = {'city': ('city_id', CityRows)}
+    key_columns = ('id', 'city_id', 'rating_avg')
+
+    def get_average_rating(self, row):
+        return float(self.column(row, 'rating_avg'))
+
+
+class RoomRows(RowSerializer):
+    field_names = ('id', 'hotel', 'room_type', 'price_per_night', 'stock', 'image', 'image_variants',
+                   'is_available')
+    columns = {
+        'id': ('id',), 'room_type': ('room_type',), 'price_per_night': ('price_per_night',), 'stock': ('stock',),
+        'image': ('image',), 'image_variants': ('image', 'image_variants'), 'is_available': ('stock',),
+    }
+    expandable = {'hotel': ('hotel_id', HotelRows)}
+    key_columns = ('id', 'hotel_id')
+
+    def get_price_per_night(self, row):
+        return decimal_string(self.column(row, 'price_per_night'))
+
+    def get_is_available(self, row):
+        return self.column(row, 'stock') > 0
+
+
+class BookingRows(RowSerializer):
+    field_names = ('id', 'room', 'check_in', 'check_out', 'created_at', 'status', 'total_price')
+    columns = {
+        'id': ('id',), 'check_in': ('check_in',), 'check_out': ('check_out',), 'created_at': ('created_at',),
+        'status': ('status',), 'total_price': ('check_in', 'check_out', 'room__price_per_night'),
+    }
+    expandable = {'room': ('room_id', RoomRows)}
+    key_columns = ('id', 'created_at', 'room_id')
+
+    def get_check_in(self, row):
+        return self.column(row, 'check_in').isoformat()
+
+    def get_check_out(self, row):
+        return self.column(row, 'check_out').isoformat()
+
+    def get_created_at(self, row):
+        return datetime_string(self.column(row, 'created_at'))
+
+    def get_total_price(self, row):
+        nights = (self.column(row, 'check_out') - self.column(row, 'check_in')).days
+        return self.column(row, 'room__price_per_night') * nights
+
+
+class RowsReadMixin:
+    """Serves GET list and retrieve through ``rows_class``; the object a retrieve sees is its row dict."""
+    rows_class = None
+
+    def reads_rows(self):
+        return (
+            self.request.method == 'GET'
+            and getattr(self, 'action', None) in (None, 'list', 'retrieve')
+            and not getattr(self, 'swagger_fake_view', False)
+        )
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.reads_rows():
+            return self.rows_class(context=self.get_serializer_context()).rows(queryset)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.reads_rows():
+            return self.rows_class(*args, context=self.get_serializer_context(), **kwargs)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,167 @@
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'mainapp_hotel_search'
+SEARCH_CONFIG = 'english'
+
+
+def _outer_id(queryset):
+    # the hotel id column of the query the rank subquery is correlated with
+    quote = connection.ops.quote_name
+    return f"{quote(queryset.model._meta.db_table)}.{quote(queryset.model._meta.pk.column)}"
+
+
+class PostgresHotelIndex:
+    """tsvector documents in a side table with a GIN index, ranked with ts_rank."""
+
+    def create(self, cursor):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+                hotel_id bigint PRIMARY KEY REFERENCES mainapp_hotel (id)
+                    ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+                document tsvector NOT NULL
+            )
+        """)
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_gin ON {SEARCH_TABLE} USING gin (document)"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, cursor, where, params):
+        cursor.execute(f"""
+            INSERT INTO {SEARCH_TABLE} (hotel_id, document)
+            SELECT h.id,
+                   setweight(to_tsvector(%s, coalesce(h.name, '')), 'A') ||
+                   setweight(to_tsvector(%s, coalesce(c.name, '')), 'B') ||
+                   setweight(to_tsvector(%s, coalesce(h.address, '')), 'C') ||
+                   setweight(to_tsvector(%s, coalesce(h.description, '')), 'D')
+            FROM mainapp_hotel h JOIN mainapp_city c ON c.id = h.city_id
+            WHERE {where}
+            ON CONFLICT (hotel_id) DO UPDATE SET document = EXCLUDED.document
+        """, [SEARCH_CONFIG] * 4 + params)
+
+    def remove(self, cursor, hotel_ids):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE hotel_id = ANY(%s)", [list(hotel_ids)])
+
+    def search(self, queryset, text):
+        query = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        # the id filter reads the GIN index; the rank is then looked up by primary key per match
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT hotel_id FROM {SEARCH_TABLE} WHERE document @@ {query}", [text])
+        ).annotate(
+            rank=RawSQL(
+                f"SELECT ts_rank(document, {query}) FROM {SEARCH_TABLE} "
+                f"WHERE hotel_id = {_outer_id(queryset)}",
+                [text],
+                output_field=FloatField(),
+            )
+        ).order_by('-rank', 'id')
+
+
+class SqliteHotelIndex:
+    """An FTS5 virtual table keyed by hotel id, ranked with weighted bm25."""
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(name, city, address, description)"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index(self, cursor, where, params):
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT h.id FROM mainapp_hotel h WHERE {where})", params
+        )
+        cursor.execute(f"""
+            INSERT INTO {SEARCH_TABLE} (rowid, name, city, address, description)
+            SELECT h.id, h.name, c.name, h.address, h.description
+            FROM mainapp_hotel h JOIN mainapp_city c ON c.id = h.city_id
+            WHERE {where}
+        """, params)
+
+    def remove(self, cursor, hotel_ids):
+        hotel_ids = list(hotel_ids)
+        placeholders = ', '.join(['%s'] * len(hotel_ids))
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", hotel_ids)
+
+    def search(self, queryset, text):
+        # quote every term so user input cannot use fts5 query syntax
+        match = ' '.join('"%s"' % term.replace('"', '""') for term in text.split())
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        ).annotate(
+            # bm25() is only defined inside a MATCH query, so the rank subquery repeats it
+            rank=RawSQL(
+                f"SELECT -bm25({SEARCH_TABLE}, 10.0, 5.0, 2.0, 1.0) FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {_outer_id(queryset)}",
+                [match],
+                output_field=FloatField(),
+            )
+        ).order_by('-rank', 'id')
+
+
+class FallbackHotelIndex:
+    """Unindexed substring matching for databases without a full-text backend."""
+
+    def create(self, cursor):
+        pass
+
+    drop = create
+
+    def index(self, cursor, where, params):
+        pass
+
+    def remove(self, cursor, hotel_ids):
+        pass
+
+    def search(self, queryset, text):
+        condition = Q()
+        for term in text.split():
+            condition &= (
+                Q(name__icontains=term) | Q(description__icontains=term)
+                | Q(address__icontains=term) | Q(city__name__icontains=term)
+            )
+        return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField())).order_by('id')
+
+
+def get_hotel_index(using=connection):
+    if using.vendor == 'postgresql':
+        return PostgresHotelIndex()
+    if using.vendor == 'sqlite':
+        return SqliteHotelIndex()
+    return FallbackHotelIndex()
+
+
+def _index_where(where, params):
+    with connection.cursor() as cursor:
+        get_hotel_index().index(cursor, where, params)
+
+
+def index_hotels(hotel_ids):
+    hotel_ids = list(hotel_ids)
+    if hotel_ids:
+        placeholders = ', '.join(['%s'] * len(hotel_ids))
+        _index_where(f"h.id IN ({placeholders})", hotel_ids)
+
+
+def index_city_hotels(city_id):
+    _index_where("h.city_id = %s", [city_id])
+
+
+def reindex_all_hotels():
+    _index_where("1 = 1", [])
+
+
+def remove_hotels(hotel_ids):
+    hotel_ids = list(hotel_ids)
+    if hotel_ids:
+        with connection.cursor() as cursor:
+            get_hotel_index().remove(cursor, hotel_ids)
+
+
+def search_hotels(queryset, text):
+    return get_hotel_index().search(queryset, text)
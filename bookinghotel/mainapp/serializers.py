@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core import signing
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from .exports import EXPORT_FORMATS
+from .fieldsets import child_expand, is_expanded, selection
+from .images import variant_urls
+from .uploads import CONTENT_TYPES, read_token
 from .models import City, Hotel, Room, Booking, Review
 
 User = get_user_model()
@@ -14,25 +20,63 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email']
 
 
-class CitySerializer(serializers.ModelSerializer):
+class SparseFieldsMixin(serializers.Serializer):
+    """Honours ``?fields=`` and ``?expand=``: relations in ``expandable`` are ids unless expanded.
+
+    The selection comes from the request in the context unless ``fields`` or ``expand`` are passed,
+    as they are to the nested serializers of expanded relations.
+    """
+    expandable = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            fields, expand = selection(self.context.get('request'))
+        expand = expand or frozenset()
+        for name, serializer_class in self.expandable.items():
+            if is_expanded(expand, name):
+                self.fields[name] = serializer_class(read_only=True, expand=child_expand(expand, name))
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+        if fields is not None:
+            for name, field in list(self.fields.items()):
+                if name not in fields and not field.write_only:
+                    self.fields.pop(name)
+
+
+class CitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = City
         fields = ['id', 'name']
 
 
-class HotelSerializer(serializers.ModelSerializer):
-    city = CitySerializer(read_only=True)
+class ImageVariantsMixin(serializers.Serializer):
+    image_variants = serializers.SerializerMethodField()
+
+    @extend_schema_field(serializers.DictField(child=serializers.DictField()))
+    def get_image_variants(self, obj):
+        """Renditions by name, each with its width, height and a ``webp`` and ``jpeg`` URL; empty until rendered."""
+        if not obj.image or not obj.image_variants:
+            return {}
+        return variant_urls(obj.image.storage, obj.image_variants)
+
+
+class HotelSerializer(SparseFieldsMixin, ImageVariantsMixin, serializers.ModelSerializer):
+    expandable = {'city': CitySerializer}
     city_id = serializers.PrimaryKeyRelatedField(
         queryset=City.objects.all(), source='city', write_only=True
     )
+    average_rating = serializers.FloatField(source='rating_avg', read_only=True)
+    review_count = serializers.IntegerField(source='rating_count', read_only=True)
 
     class Meta:
         model = Hotel
-        fields = ['id', 'name', 'description', 'city', 'city_id', 'address', 'image']
+        fields = ['id', 'name', 'description', 'city', 'city_id', 'address', 'image', 'image_variants',
+                  'average_rating', 'review_count']
 
 
-class RoomSerializer(serializers.ModelSerializer):
-    hotel = HotelSerializer(read_only=True)
+class RoomSerializer(SparseFieldsMixin, ImageVariantsMixin, serializers.ModelSerializer):
+    expandable = {'hotel': HotelSerializer}
     hotel_id = serializers.PrimaryKeyRelatedField(
         queryset=Hotel.objects.all(), source='hotel', write_only=True
     )
@@ -40,7 +84,8 @@ class RoomSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Room
-        fields = ['id', 'hotel', 'hotel_id', 'room_type', 'price_per_night', 'stock','image', 'is_available']
+        fields = ['id', 'hotel', 'hotel_id', 'room_type', 'price_per_night', 'stock','image', 'image_variants',
+                  'is_available']
 
     @extend_schema_field(serializers.BooleanField())
     def get_is_available(self, obj):
@@ -48,9 +93,9 @@ class RoomSerializer(serializers.ModelSerializer):
 
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable = {'room': RoomSerializer}
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    room = RoomSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
 
     class Meta:
@@ -81,6 +126,54 @@ class RoomReserveSerializer(serializers.Serializer):
         return data
 
 
+class AvailabilitySearchSerializer(RoomReserveSerializer):
+    city = serializers.IntegerField(required=False)
+    room_type = serializers.ChoiceField(choices=Room.RoomChoices.choices, required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+
+class HotelTextSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+
+
+class ReviewListQuerySerializer(serializers.Serializer):
+    sort = serializers.ChoiceField(choices=['newest', 'rating'], default='newest')
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=EXPORT_FORMATS, default='csv')
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    content_type = serializers.ChoiceField(choices=list(CONTENT_TYPES))
+
+
+class ImageUploadConfirmSerializer(serializers.Serializer):
+    upload_token = serializers.CharField()
+
+    def validate_upload_token(self, value):
+        try:
+            return read_token(value, settings.IMAGE_UPLOAD_CONFIRM_WINDOW)
+        except signing.BadSignature:
+            raise serializers.ValidationError("Invalid or expired upload token.")
+
+
+class CheapestRoomSerializer(serializers.Serializer):
+    id = serializers.IntegerField(source='cheapest_room_id')
+    room_type = serializers.CharField(source='cheapest_room_type')
+    price_per_night = serializers.DecimalField(max_digits=10, decimal_places=2, source='cheapest_price')
+
+
+class HotelSearchResultSerializer(HotelSerializer):
+    cheapest_room = CheapestRoomSerializer(source='*', read_only=True)
+
+    class Meta(HotelSerializer.Meta):
+        fields = HotelSerializer.Meta.fields + ['cheapest_room']
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     is_positive = serializers.ReadOnlyField()
@@ -0,0 +1,144 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_namespaces
+from .images import delete_variants
+from .models import City, Hotel, Room, Review
+from .search import index_city_hotels, index_hotels, remove_hotels
+
+
+def _remember_previous(instance, *fields):
+    if instance.pk is None:
+        return (None,) * len(fields)
+    return type(instance).objects.filter(pk=instance.pk).values_list(*fields).first() or (None,) * len(fields)
+
+
+def _remember_image(instance, previous_image, previous_variants):
+    instance._previous_image = previous_image
+    instance._replaced_variants = {}
+    if (instance.image.name or None) != (previous_image or None):
+        # renditions of the replaced file must not be served for the new one
+        instance.image_variants = {}
+        instance._replaced_variants = previous_variants or {}
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_city(sender, instance, **kwargs):
+    bump_namespaces('cities', f'city:{instance.pk}', f'city:{instance.pk}:hotels')
+
+
+@receiver(pre_save, sender=Hotel)
+def remember_hotel_city(sender, instance, **kwargs):
+    instance._previous_city_id, previous_image, previous_variants = _remember_previous(
+        instance, 'city_id', 'image', 'image_variants'
+    )
+    _remember_image(instance, previous_image, previous_variants)
+
+
+def bump_hotel(hotel_id, *city_ids):
+    bump_namespaces(
+        'hotels',
+        f'hotel:{hotel_id}',
+        f'hotel:{hotel_id}:rooms',
+        *(f'city:{city_id}:hotels' for city_id in set(city_ids) - {None}),
+    )
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_delete, sender=Hotel)
+def invalidate_hotel(sender, instance, **kwargs):
+    bump_hotel(instance.pk, instance.city_id, getattr(instance, '_previous_city_id', None))
+
+
+@receiver(post_save, sender=Hotel)
+def index_hotel(sender, instance, **kwargs):
+    index_hotels([instance.pk])
+
+
+@receiver(post_delete, sender=Hotel)
+def unindex_hotel(sender, instance, **kwargs):
+    remove_hotels([instance.pk])
+
+
+@receiver(post_save, sender=City)
+def index_city(sender, instance, created, **kwargs):
+    if not created:
+        index_city_hotels(instance.pk)
+
+
+@receiver(pre_save, sender=Room)
+def remember_room_hotel(sender, instance, **kwargs):
+    instance._previous_hotel_id, previous_image, previous_variants = _remember_previous(
+        instance, 'hotel_id', 'image', 'image_variants'
+    )
+    _remember_image(instance, previous_image, previous_variants)
+
+
+def bump_room(room_id, *hotel_ids):
+    hotel_ids = set(hotel_ids) - {None}
+    bump_namespaces('rooms', f'room:{room_id}', *(f'hotel:{hotel_id}:rooms' for hotel_id in hotel_ids))
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room(sender, instance, **kwargs):
+    bump_room(instance.pk, instance.hotel_id, getattr(instance, '_previous_hotel_id', None))
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_save, sender=Room)
+def schedule_image_variants(sender, instance, **kwargs):
+    if instance.image and instance.image.name != getattr(instance, '_previous_image', None):
+        from .tasks import generate_image_variants
+
+        label, pk = sender._meta.label_lower, instance.pk
+        transaction.on_commit(lambda: generate_image_variants.delay(label, pk))
+
+
+def _delete_variants_on_commit(instance, variants):
+    if variants:
+        storage = instance.image.storage
+        # a rolled back save or delete still points at them
+        transaction.on_commit(lambda: delete_variants(storage, variants))
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_save, sender=Room)
+def delete_replaced_variants(sender, instance, **kwargs):
+    _delete_variants_on_commit(instance, getattr(instance, '_replaced_variants', None))
+
+
+@receiver(post_delete, sender=Hotel)
+@receiver(post_delete, sender=Room)
+def delete_deleted_variants(sender, instance, **kwargs):
+    _delete_variants_on_commit(instance, instance.image_variants)
+
+
+def _apply_rating(hotel_id, rating, count):
+    if Hotel.objects.filter(pk=hotel_id).add_rating(rating, count):
+        bump_hotel(hotel_id, Hotel.objects.filter(pk=hotel_id).values_list('city_id', flat=True).first())
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    previous = None
+    if instance.pk is not None:
+        previous = Review.objects.filter(pk=instance.pk).values_list('hotel_id', 'rating').first()
+    instance._previous_rating = previous
+
+
+@receiver(post_save, sender=Review)
+def add_review_rating(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if not created and previous == (instance.hotel_id, instance.rating):
+        return
+    if previous:
+        _apply_rating(previous[0], previous[1], -1)
+    _apply_rating(instance.hotel_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    _apply_rating(instance.hotel_id, instance.rating, -1)
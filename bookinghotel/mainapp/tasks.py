@@ -1,16 +1,123 @@
+from collections import defaultdict
+
 from celery import shared_task
-from .models import Booking
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from PIL import UnidentifiedImageError
+
+from . import metrics
+from .images import delete_variants, render_variants
+from .models import Booking, Hotel, Room
+from .signals import bump_hotel, bump_room
+
 
 @shared_task
 def confirm_booking(booking_id):
     try:
         booking = Booking.objects.select_related('room').get(id=booking_id)
-        if booking.status == Booking.BookingStatus.PENDING and booking.room.stock > 0:
-            booking.status = Booking.BookingStatus.CONFIRMED
-            booking.room.stock -= 1
-            booking.room.save()
-            booking.save()
+        if booking.status == Booking.BookingStatus.PENDING and booking.confirm():
             return f"Booking {booking_id} confirmed."
         return f"Booking {booking_id} skipped due to invalid status or no stock."
     except Booking.DoesNotExist:
-        return f"Booking {booking_id} does not exist."
\ No newline at end of file
+        return f"Booking {booking_id} does not exist."
+
+
+def _pending_before(cutoff, limit):
+    # oldest first, served by the partial booking_pending_created_idx
+    return list(
+        Booking.objects.filter(status=Booking.BookingStatus.PENDING, created_at__lte=cutoff)
+        .order_by('created_at', 'id')
+        .values_list('id', 'room_id')[:limit]
+    )
+
+
+def _confirm_by_room(pending):
+    by_room = defaultdict(list)
+    for booking_id, room_id in pending:
+        by_room[room_id].append(booking_id)
+    rooms = Room.objects.in_bulk(by_room)
+
+    confirmed = 0
+    for room_id, booking_ids in by_room.items():
+        if room_id not in rooms:
+            continue
+        with transaction.atomic():
+            bookings = list(
+                Booking.objects.select_for_update()
+                .filter(id__in=booking_ids, status=Booking.BookingStatus.PENDING)
+                .order_by('created_at', 'id')
+            )
+            accepted = rooms[room_id].reserve_stays(bookings)
+            Booking.objects.filter(id__in=[booking.id for booking in accepted]).update(
+                status=Booking.BookingStatus.CONFIRMED
+            )
+        now = timezone.now()
+        metrics.observe('booking_confirmation_batch_size', len(accepted))
+        metrics.observe(
+            'booking_confirmation_lag_ms',
+            *(int((now - booking.created_at).total_seconds() * 1000) for booking in accepted),
+        )
+        confirmed += len(accepted)
+    return confirmed
+
+
+@shared_task
+def confirm_pending_bookings(batch_size=None):
+    """Confirms pending bookings older than the confirmation delay, one transaction per room.
+
+    Bookings that no longer fit stay pending, exactly as a failed confirm_booking leaves them.
+    """
+    pending = _pending_before(
+        timezone.now() - settings.BOOKING_CONFIRMATION_DELAY,
+        batch_size or settings.BOOKING_CONFIRMATION_BATCH_SIZE,
+    )
+    confirmed = _confirm_by_room(pending)
+    return f"Confirmed {confirmed} of {len(pending)} pending bookings."
+
+
+@shared_task
+def expire_stale_bookings(batch_size=None):
+    """Settles bookings pending for longer than BOOKING_PENDING_MAX_AGE.
+
+    Each batch gets one last confirmation attempt; whatever still does not fit is cancelled,
+    so nothing stays pending after a lost message or a crashed worker.
+    """
+    cutoff = timezone.now() - settings.BOOKING_PENDING_MAX_AGE
+    confirmed = cancelled = 0
+    while stale := _pending_before(cutoff, batch_size or settings.BOOKING_CONFIRMATION_BATCH_SIZE):
+        confirmed += _confirm_by_room(stale)
+        expired = Booking.objects.filter(
+            id__in=[booking_id for booking_id, _ in stale], status=Booking.BookingStatus.PENDING
+        ).update(status=Booking.BookingStatus.CANCELLED)
+        metrics.observe('booking_expired', expired)
+        cancelled += expired
+    return f"Confirmed {confirmed} and cancelled {cancelled} stale pending bookings."
+
+
+@shared_task
+def generate_image_variants(model_label, pk):
+    """Renders the IMAGE_VARIANTS of a hotel or room image and records them on the row.
+
+    The row is only updated while it still points at the rendered file, so a replacement uploaded
+    meanwhile keeps its own, later task and the renditions of the replaced file are deleted again.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not instance.image:
+        return f"{model_label} {pk} has no image."
+    try:
+        variants = render_variants(instance.image)
+    except UnidentifiedImageError:
+        # direct uploads skip ImageField validation, so the bytes may not be an image at all
+        return f"{model_label} {pk} image is not a readable image."
+    if not model.objects.filter(pk=pk, image=instance.image.name).update(image_variants=variants):
+        delete_variants(instance.image.storage, variants)
+        return f"{model_label} {pk} image changed while rendering."
+    # update() skips the signals, so drop the cached representations here
+    if model is Hotel:
+        bump_hotel(pk, instance.city_id)
+    else:
+        bump_room(pk, instance.hotel_id)
+    return f"Rendered {len(variants)} variants for {model_label} {pk}."
@@ -1,16 +1,72 @@
+import asyncio
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import addModuleCleanup, mock, skipUnless
+
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.urls import reverse
+from django.core.management import call_command, CommandError
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, OperationalError, transaction
+from django.test import TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, URLPattern, URLResolver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
-
-from .models import City, Hotel, Room, Booking, Review
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from rest_framework.utils.encoders import JSONEncoder
+from storages.backends.s3boto3 import S3Boto3Storage
+from silk.collector import DataCollector
+from silk.models import Request as SilkRequest
+
+from . import api_urls, api_views, async_views, loadtest, metrics, profiling, renderers, throttling, uploads
+from .caching import bump_namespaces, namespace_versions
+from .models import City, Hotel, Room, RoomNight, Booking, Review, ImportCheckpoint
+from .pagination import CheapestFirstCursorPagination, IdCursorPagination, ReviewCursorPagination
+from .rows import BookingRows, HotelRows, RoomRows
+from .search import search_hotels
+from .serializers import BookingSerializer, HotelSearchResultSerializer, HotelSerializer, RoomSerializer
+from .tasks import confirm_booking, confirm_pending_bookings, expire_stale_bookings, generate_image_variants
 
 User = get_user_model()
 
 
+def setUpModule():
+    # keep the buckets in this process, away from the shared Redis ones and earlier runs
+    limiter = override_settings(RATE_LIMITER='mainapp.throttling.MemoryRateLimiter')
+    limiter.enable()
+    addModuleCleanup(limiter.disable)
+
+
+def use_fresh_rate_limiter(test):
+    """Gives ``test`` empty token buckets of its own and returns their limiter."""
+    limiter = test.settings(RATE_LIMITER='mainapp.throttling.MemoryRateLimiter')
+    limiter.enable()
+    test.addCleanup(limiter.disable)
+    return throttling.get_rate_limiter()
+
+
 class AuthTests(APITestCase):
 
     def setUp(self):
+        use_fresh_rate_limiter(self)
         self.register_url = reverse('register')
         self.login_url = reverse('login')
         self.token_refresh_url = reverse('token_refresh')
@@ -100,7 +156,7 @@ class CityAPITestCase(APITestCase):
     def test_list_cities(self):
         response = self.client.get('/api/cities/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
 
     def test_create_city_as_admin(self):
         self.client.force_authenticate(user=self.admin_user)
@@ -133,7 +189,7 @@ class CityAPITestCase(APITestCase):
         Hotel.objects.create(name="Grand Hotel", description="Nice", city=self.city, address="123 St")
         response = self.client.get(f'/api/cities/{self.city.id}/hotels/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
 
 
 class HotelAPITestCase(APITestCase):
@@ -285,7 +341,7 @@ class ReviewAPITestCase(APITestCase):
         url = '/api/user/reviews/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_user_can_get_own_review_detail(self):
         self.authenticate(self.user)
@@ -438,7 +494,7 @@ class RoomAPITestCase(APITestCase):
         url = '/api/rooms/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_user_can_get_room_detail(self):
         self.authenticate(self.user)
@@ -452,7 +508,7 @@ class RoomAPITestCase(APITestCase):
         url = f'/api/hotels/{self.hotel.id}/rooms/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_user_can_reserve_room(self):
         self.authenticate(self.user)
@@ -529,8 +585,8 @@ class UserAPITestCase(APITestCase):
         url = '/api/user/reserves/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['id'], booking.id)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], booking.id)
 
     def test_user_can_get_booking_details(self):
         self.authenticate(self.user)
@@ -573,3 +629,1759 @@ class UserAPITestCase(APITestCase):
         url = f'/api/user/reserves/{other_user_booking.id}/cancel/'
         response = self.client.patch(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RoomNightInventoryTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user',
+            password='userpass',
+            email='user@example.com'
+        )
+        self.city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(
+            name="Test Hotel",
+            description="Nice hotel",
+            city=self.city,
+            address="123 Main St"
+        )
+        self.room = Room.objects.create(
+            hotel=self.hotel,
+            room_type='Single',
+            price_per_night=100,
+            stock=1,
+            image=""
+        )
+
+    def book(self, check_in, check_out):
+        booking = Booking.objects.create(
+            user=self.user,
+            room=self.room,
+            check_in=check_in,
+            check_out=check_out,
+            status=Booking.BookingStatus.PENDING
+        )
+        confirm_booking(booking.id)
+        booking.refresh_from_db()
+        return booking
+
+    def test_confirm_claims_only_booked_nights(self):
+        booking = self.book(date(2025, 3, 1), date(2025, 3, 4))
+        self.assertEqual(booking.status, Booking.BookingStatus.CONFIRMED)
+        self.assertEqual(
+            list(RoomNight.objects.filter(room=self.room).order_by('date').values_list('date', 'booked')),
+            [(date(2025, 3, 1), 1), (date(2025, 3, 2), 1), (date(2025, 3, 3), 1)]
+        )
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.stock, 1)
+
+    def test_other_dates_stay_available(self):
+        self.book(date(2025, 3, 1), date(2025, 3, 4))
+        self.assertFalse(self.room.is_available_for(date(2025, 3, 3), date(2025, 3, 5)))
+        self.assertTrue(self.room.is_available_for(date(2025, 3, 4), date(2025, 3, 6)))
+        self.assertTrue(self.room.is_available_for(date(2025, 7, 1), date(2025, 7, 10)))
+
+    def test_overlapping_booking_is_not_confirmed(self):
+        self.book(date(2025, 3, 1), date(2025, 3, 4))
+        booking = self.book(date(2025, 3, 2), date(2025, 3, 3))
+        self.assertEqual(booking.status, Booking.BookingStatus.PENDING)
+
+    def test_reserve_rejects_fully_booked_range(self):
+        self.book(date(2025, 3, 1), date(2025, 3, 4))
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/rooms/{self.room.id}/reserve/'
+        response = self.client.post(url, {"check_in": "2025-03-03", "check_out": "2025-03-05"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {"check_in": "2025-07-01", "check_out": "2025-07-05"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_cancel_releases_nights(self):
+        booking = self.book(date(2025, 3, 1), date(2025, 3, 4))
+        self.client.force_authenticate(user=self.user)
+        response = self.client.patch(f'/api/user/reserves/{booking.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.room.is_available_for(date(2025, 3, 1), date(2025, 3, 4)))
+
+
+class HotelSearchAPITestCase(APITestCase):
+    def setUp(self):
+        self.city = City.objects.create(name="Test City")
+        other_city = City.objects.create(name="Other City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=self.city, address="1 St")
+        self.budget_hotel = Hotel.objects.create(name="Budget", description="Cheap", city=self.city, address="2 St")
+        self.far_hotel = Hotel.objects.create(name="Far", description="Far", city=other_city, address="3 St")
+        self.double = Room.objects.create(hotel=self.hotel, room_type='Double', price_per_night=90, stock=1)
+        Room.objects.create(hotel=self.hotel, room_type='Double', price_per_night=95, stock=1)
+        self.budget_double = Room.objects.create(
+            hotel=self.budget_hotel, room_type='Double', price_per_night=60, stock=1
+        )
+        Room.objects.create(hotel=self.far_hotel, room_type='Double', price_per_night=50, stock=1)
+        self.params = {'city': self.city.id, 'check_in': '2025-05-12', 'check_out': '2025-05-15',
+                       'room_type': 'Double', 'max_price': 100}
+
+    def test_search_returns_cheapest_available_room_per_hotel(self):
+        response = self.client.get('/api/search/', self.params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.budget_hotel.id, self.hotel.id])
+        self.assertEqual(response.data['results'][1]['cheapest_room']['id'], self.double.id)
+        self.assertEqual(response.data['results'][1]['cheapest_room']['price_per_night'], '90.00')
+
+    def test_search_skips_rooms_booked_on_any_night(self):
+        RoomNight.objects.create(room=self.budget_double, date=date(2025, 5, 14), booked=1)
+        RoomNight.objects.create(room=self.double, date=date(2025, 5, 15), booked=1)
+        response = self.client.get('/api/search/', self.params)
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.hotel.id])
+        self.assertEqual(response.data['results'][0]['cheapest_room']['id'], self.double.id)
+
+    def test_search_applies_price_band(self):
+        response = self.client.get('/api/search/', dict(self.params, min_price=70, max_price=92))
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.hotel.id])
+
+    def test_search_is_a_single_query(self):
+        # silk keeps the last request in a thread local and would add EXPLAIN queries
+        DataCollector().clear()
+        queryset = Hotel.objects.select_related('city').with_cheapest_available_room(
+            date(2025, 5, 12), date(2025, 5, 15), room_type='Double'
+        )
+        with self.assertNumQueries(1):
+            HotelSearchResultSerializer(queryset, many=True).data
+
+    def test_search_requires_valid_dates(self):
+        response = self.client.get('/api/search/', dict(self.params, check_out='2025-05-12'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pages_through_more_ties_than_offset_cutoff(self):
+        tied = Hotel.objects.bulk_create(
+            Hotel(name=f"Tied {i}", description="Same", city=self.city, address=f"{i} St")
+            for i in range(CheapestFirstCursorPagination.offset_cutoff * 2)
+        )
+        Room.objects.bulk_create(
+            Room(hotel=hotel, room_type='Double', price_per_night=80, stock=1) for hotel in tied
+        )
+        expected = [self.budget_hotel.id, *(hotel.id for hotel in tied), self.hotel.id]
+        for url in ('/api/search/', '/api/async/search/'):
+            with self.subTest(url=url):
+                ids, data = [], dict(self.params, page_size=200)
+                for _ in range(len(expected) // 200 + 1):
+                    body = self.client.get(url, data).json()
+                    ids += [hotel['id'] for hotel in body['results']]
+                    url, data = body['next'], None
+                    if url is None:
+                        break
+                self.assertEqual(ids, expected)
+
+
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='userpass', email='user@example.com')
+        self.city = City.objects.create(name="Test City")
+        self.hotels = [
+            Hotel.objects.create(name=f"Hotel {i}", description="Nice", city=self.city, address=f"{i} St")
+            for i in range(5)
+        ]
+        room = Room.objects.create(hotel=self.hotels[0], room_type='Single', price_per_night=100, stock=5)
+        self.bookings = [
+            Booking.objects.create(user=self.user, room=room, check_in="2025-06-01", check_out="2025-06-05")
+            for _ in range(5)
+        ]
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_hotel_pages_follow_cursor(self):
+        self.assertEqual(self.collect('/api/hotels/?page_size=2'), [hotel.id for hotel in self.hotels])
+
+    def test_rating_order_pages_through_more_ties_than_offset_cutoff(self):
+        tied = Hotel.objects.bulk_create(
+            Hotel(name=f"Tied {i}", description="Same", city=self.city, address=f"{i} St", rating_avg=4.5)
+            for i in range(IdCursorPagination.offset_cutoff * 2)
+        )
+        expected = [hotel.id for hotel in reversed(tied)] + [hotel.id for hotel in reversed(self.hotels)]
+        for url in ('/api/hotels/', '/api/async/hotels/'):
+            with self.subTest(url=url):
+                ids, url = [], f'{url}?ordering=-rating_avg&page_size=200'
+                for _ in range(len(expected) // 200 + 1):
+                    body = self.client.get(url).json()
+                    ids += [hotel['id'] for hotel in body['results']]
+                    url = body['next']
+                    if url is None:
+                        break
+                self.assertEqual(ids, expected)
+
+    def test_bookings_are_paged_newest_first(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(
+            self.collect('/api/user/reserves/?page_size=2'),
+            [booking.id for booking in reversed(self.bookings)]
+        )
+
+    def test_hotel_reviews_are_paged(self):
+        for i in range(3):
+            Review.objects.create(user=self.user, hotel=self.hotels[0], rating=i + 3, comment="ok")
+        response = self.client.get(f'/api/hotels/{self.hotels[0].id}/reviews/?page_size=2')
+        self.assertEqual(len(response.data['reviews']), 2)
+        self.assertEqual(response.data['average_rating'], 4)
+        self.assertIsNotNone(response.data['next'])
+
+
+class ListCacheInvalidationTestCase(APITestCase):
+    def setUp(self):
+        self.city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=self.city, address="1 St")
+        self.room = Room.objects.create(hotel=self.hotel, room_type='Single', price_per_night=100, stock=1)
+
+    def first_result(self, url):
+        return self.client.get(url).data['results'][0]
+
+    def test_hotel_edit_refreshes_hotel_lists(self):
+        self.first_result('/api/hotels/')
+        self.first_result(f'/api/cities/{self.city.id}/hotels/')
+        self.first_result(f'/api/hotels/{self.hotel.id}/rooms/?expand=hotel')
+        self.hotel.name = "Renamed"
+        self.hotel.save()
+        self.assertEqual(self.first_result('/api/hotels/')['name'], "Renamed")
+        self.assertEqual(self.first_result(f'/api/cities/{self.city.id}/hotels/')['name'], "Renamed")
+        self.assertEqual(self.first_result(f'/api/hotels/{self.hotel.id}/rooms/?expand=hotel')['hotel']['name'],
+                         "Renamed")
+
+    def test_city_edit_refreshes_nested_city(self):
+        self.first_result('/api/hotels/?expand=city')
+        self.first_result('/api/rooms/?expand=hotel.city')
+        self.city.name = "New Name"
+        self.city.save()
+        self.assertEqual(self.first_result('/api/hotels/?expand=city')['city']['name'], "New Name")
+        self.assertEqual(self.first_result('/api/rooms/?expand=hotel.city')['hotel']['city']['name'], "New Name")
+
+    def test_hotel_moving_city_leaves_old_city_list(self):
+        other_city = City.objects.create(name="Other City")
+        self.assertEqual(len(self.client.get(f'/api/cities/{self.city.id}/hotels/').data['results']), 1)
+        self.hotel.city = other_city
+        self.hotel.save()
+        self.assertEqual(len(self.client.get(f'/api/cities/{self.city.id}/hotels/').data['results']), 0)
+        self.assertEqual(len(self.client.get(f'/api/cities/{other_city.id}/hotels/').data['results']), 1)
+
+    def test_room_changes_refresh_room_lists(self):
+        self.first_result(f'/api/hotels/{self.hotel.id}/rooms/')
+        self.room.price_per_night = 120
+        self.room.save()
+        self.assertEqual(self.first_result(f'/api/hotels/{self.hotel.id}/rooms/')['price_per_night'], '120.00')
+        self.room.delete()
+        self.assertEqual(self.client.get('/api/rooms/').data['results'], [])
+
+    def test_list_is_served_from_cache(self):
+        self.client.get('/api/hotels/')
+        Hotel.objects.filter(pk=self.hotel.pk).update(name="Bypassed signals")
+        self.assertEqual(self.first_result('/api/hotels/')['name'], "Test Hotel")
+
+
+class HotelRatingAggregateTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='userpass', email='user@example.com')
+        self.city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=self.city, address="1 St")
+        self.other = Hotel.objects.create(name="Other Hotel", description="Meh", city=self.city, address="2 St")
+
+    def assertRating(self, hotel, rating_sum, rating_count, rating_avg):
+        hotel.refresh_from_db()
+        self.assertEqual((hotel.rating_sum, hotel.rating_count), (rating_sum, rating_count))
+        self.assertAlmostEqual(hotel.rating_avg, rating_avg)
+
+    def test_create_and_delete_review_update_aggregates(self):
+        first = Review.objects.create(user=self.user, hotel=self.hotel, rating=5, comment="Great")
+        Review.objects.create(user=self.user, hotel=self.hotel, rating=2, comment="Bad")
+        self.assertRating(self.hotel, 7, 2, 3.5)
+        first.delete()
+        self.assertRating(self.hotel, 2, 1, 2.0)
+        Review.objects.filter(hotel=self.hotel).delete()
+        self.assertRating(self.hotel, 0, 0, 0.0)
+
+    def test_editing_review_moves_rating(self):
+        review = Review.objects.create(user=self.user, hotel=self.hotel, rating=5, comment="Great")
+        review.rating = 3
+        review.save()
+        self.assertRating(self.hotel, 3, 1, 3.0)
+        review.hotel = self.other
+        review.save()
+        self.assertRating(self.hotel, 0, 0, 0.0)
+        self.assertRating(self.other, 3, 1, 3.0)
+
+    def test_hotel_list_filters_and_sorts_by_rating(self):
+        Review.objects.create(user=self.user, hotel=self.hotel, rating=5, comment="Great")
+        Review.objects.create(user=self.user, hotel=self.other, rating=3, comment="Ok")
+        response = self.client.get('/api/hotels/', {'min_rating': 4})
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.hotel.id])
+        self.assertEqual(response.data['results'][0]['average_rating'], 5.0)
+        self.assertEqual(response.data['results'][0]['review_count'], 1)
+        response = self.client.get('/api/hotels/', {'ordering': '-rating_avg'})
+        self.assertEqual([hotel['id'] for hotel in response.data['results']], [self.hotel.id, self.other.id])
+        self.assertEqual(self.client.get('/api/hotels/', {'min_rating': 'x'}).status_code, 400)
+
+    def test_rebuild_command_recomputes_from_reviews(self):
+        Review.objects.create(user=self.user, hotel=self.hotel, rating=4, comment="Good")
+        Hotel.objects.update(rating_sum=0, rating_count=0, rating_avg=0, rating_4_count=0)
+        call_command('rebuild_hotel_ratings', stdout=StringIO())
+        self.assertRating(self.hotel, 4, 1, 4.0)
+        self.assertRating(self.other, 0, 0, 0.0)
+        self.assertEqual(self.client.get(f'/api/hotels/{self.hotel.id}/reviews/').data['rating_histogram'],
+                         {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0})
+
+
+class ReviewListTestCase(APITestCase):
+    def setUp(self):
+        self.city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=self.city, address="1 St")
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='userpass', email=f'user{i}@example.com')
+            for i in range(5)
+        ]
+        self.reviews = [
+            Review.objects.create(user=user, hotel=self.hotel, rating=rating, comment="ok")
+            for user, rating in zip(self.users, [4, 5, 2, 5, 4])
+        ]
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [review['id'] for review in response.json()['reviews']]
+            url = response.json()['next']
+        return ids
+
+    def test_summary_covers_every_review(self):
+        response = self.client.get(f'/api/hotels/{self.hotel.id}/reviews/?page_size=2')
+        self.assertEqual(len(response.data['reviews']), 2)
+        self.assertEqual(response.data['review_count'], 5)
+        self.assertAlmostEqual(response.data['average_rating'], 4.0)
+        self.assertEqual(response.data['rating_histogram'], {'1': 0, '2': 1, '3': 0, '4': 2, '5': 2})
+        self.assertEqual(response.data['reviews'][0]['user']['username'], 'user4')
+        async_data = self.client.get(f'/api/async/hotels/{self.hotel.id}/reviews/?page_size=2').json()
+        self.assertEqual({**async_data, 'next': None}, {**json.loads(response.content), 'next': None})
+
+    def test_histogram_follows_edits_and_deletes(self):
+        self.reviews[2].rating = 3
+        self.reviews[2].save()
+        self.reviews[0].delete()
+        response = self.client.get(f'/api/hotels/{self.hotel.id}/reviews/')
+        self.assertEqual(response.data['rating_histogram'], {'1': 0, '2': 0, '3': 1, '4': 1, '5': 2})
+        self.assertEqual(response.data['review_count'], 4)
+
+    def test_sorts_by_newest_or_rating(self):
+        url = f'/api/hotels/{self.hotel.id}/reviews/?page_size=2'
+        newest = [review.id for review in reversed(self.reviews)]
+        self.assertEqual(self.collect(url), newest)
+        self.assertEqual(self.collect(f'{url}&sort=newest'), newest)
+        by_rating = [self.reviews[i].id for i in (3, 1, 4, 0, 2)]
+        self.assertEqual(self.collect(f'{url}&sort=rating'), by_rating)
+        self.assertEqual(self.collect(f'/api/async/hotels/{self.hotel.id}/reviews/?page_size=2&sort=rating'),
+                         by_rating)
+        self.assertEqual(self.client.get(f'{url}&sort=oldest').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rating_sort_pages_through_more_ties_than_offset_cutoff(self):
+        tied = Review.objects.bulk_create(
+            Review(user=self.users[0], hotel=self.hotel, rating=5, comment="same")
+            for _ in range(ReviewCursorPagination.offset_cutoff * 2)
+        )
+        Review.objects.filter(id__in=[review.id for review in tied]).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        expected = [self.reviews[i].id for i in (3, 1)] + [review.id for review in reversed(tied)] + [
+            self.reviews[i].id for i in (4, 0, 2)
+        ]
+        for url in (f'/api/hotels/{self.hotel.id}/reviews/', f'/api/async/hotels/{self.hotel.id}/reviews/'):
+            with self.subTest(url=url):
+                ids, url = [], f'{url}?sort=rating&page_size=200'
+                for _ in range(len(expected) // 200 + 1):
+                    body = self.client.get(url).json()
+                    ids += [review['id'] for review in body['reviews']]
+                    url = body['next']
+                    if url is None:
+                        break
+                self.assertEqual(ids, expected)
+
+    def test_page_reads_summary_and_reviewers_in_fixed_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(f'/api/hotels/{self.hotel.id}/reviews/')
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertNotIn('COUNT(', ' '.join(query['sql'] for query in context.captured_queries).upper())
+
+
+class HotelTextSearchTestCase(APITestCase):
+    def setUp(self):
+        self.paris = City.objects.create(name="Paris")
+        self.rome = City.objects.create(name="Rome")
+        self.riverside = Hotel.objects.create(
+            name="Riverside Inn", description="Quiet rooms with a garden", city=self.paris, address="1 Seine Quay"
+        )
+        self.garden = Hotel.objects.create(
+            name="Garden Palace", description="Rooftop pool", city=self.rome, address="5 Via Roma"
+        )
+
+    def search(self, q, **params):
+        response = self.client.get('/api/hotels/search/', dict(params, q=q))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [hotel['id'] for hotel in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('garden'), [self.garden.id, self.riverside.id])
+
+    def test_city_name_and_multiple_terms(self):
+        self.assertEqual(self.search('paris'), [self.riverside.id])
+        self.assertEqual(self.search('garden rome'), [self.garden.id])
+
+    def test_index_follows_hotel_and_city_changes(self):
+        self.garden.name = "Colosseum View"
+        self.garden.save()
+        self.assertEqual(self.search('colosseum'), [self.garden.id])
+        self.assertEqual(self.search('garden'), [self.riverside.id])
+        self.rome.name = "Roma"
+        self.rome.save()
+        self.assertEqual(self.search('roma'), [self.garden.id])
+        self.garden.delete()
+        self.assertEqual(self.search('colosseum'), [])
+
+    def test_results_are_paginated(self):
+        response = self.client.get('/api/hotels/search/', {'q': 'garden', 'page_size': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_query_syntax_is_treated_as_text(self):
+        self.search('"garden* AND (')
+        self.assertEqual(self.search('garden*'), self.search('garden'))
+        self.assertEqual(self.client.get('/api/hotels/search/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_text_search_and_availability_search_have_their_own_url_names(self):
+        self.assertEqual(reverse('hotel-text-search'), '/api/hotels/search/')
+        self.assertEqual(reverse('hotel-search'), '/api/search/')
+
+    def test_search_composes_with_other_filters_and_reads_the_rank(self):
+        queryset = search_hotels(Hotel.objects.filter(city=self.paris), 'garden')
+        self.assertEqual([(hotel.id, hotel.rank > 0) for hotel in queryset], [(self.riverside.id, True)])
+
+
+class ImportCatalogCommandTestCase(APITestCase):
+    def write(self, suffix, content):
+        source = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8')
+        source.write(content)
+        source.close()
+        self.addCleanup(os.remove, source.name)
+        return source.name
+
+    def run_import(self, *args, **options):
+        call_command('import_catalog', *args, stdout=StringIO(), **options)
+
+    def test_imports_hotels_rooms_and_bookings(self):
+        City.objects.create(name="Paris")
+        hotels = self.write('.csv', "name,description,city,address\n"
+                                    "Riverside,Quiet,Paris,1 Quay\n"
+                                    "Palace,Pool,Rome,5 Via\n"
+                                    "Tower,View,Paris,9 Rue\n")
+        self.run_import('hotels', hotels, batch_size=2)
+        self.assertEqual(City.objects.count(), 2)
+        self.assertEqual(Hotel.objects.filter(city__name="Paris").count(), 2)
+        self.assertEqual(len(self.client.get('/api/hotels/search/', {'q': 'palace'}).data['results']), 1)
+
+        rooms = self.write('.jsonl', '{"hotel": "Palace", "city": "Rome", "room_type": "Double", '
+                                     '"price_per_night": "80.50", "stock": 1}\n')
+        self.run_import('rooms', rooms)
+        room = Room.objects.get(hotel__name="Palace")
+        self.assertEqual(room.price_per_night, Decimal('80.50'))
+
+        User.objects.create_user(username='guest', password='guestpass', email='guest@example.com')
+        bookings = self.write('.csv', "username,room_id,check_in,check_out,status\n"
+                                      f"guest,{room.id},2025-06-01,2025-06-03,confirmed\n"
+                                      f"guest,{room.id},2025-06-02,2025-06-04,pending\n")
+        self.run_import('bookings', bookings)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertEqual(
+            list(RoomNight.objects.order_by('date').values_list('date', 'booked')),
+            [(date(2025, 6, 1), 1), (date(2025, 6, 2), 1)]
+        )
+
+    def test_confirmed_bookings_never_oversell_a_room(self):
+        hotel = Hotel.objects.create(name="Palace", description="Pool", city=City.objects.create(name="Rome"),
+                                     address="5 Via")
+        room = Room.objects.create(hotel=hotel, room_type='Double', price_per_night=80, stock=1)
+        User.objects.create_user(username='guest', password='guestpass', email='guest@example.com')
+        RoomNight.objects.create(room=room, date=date(2025, 6, 5), booked=1)
+        bookings = self.write('.csv', "username,room_id,check_in,check_out,status\n"
+                                      f"guest,{room.id},2025-06-01,2025-06-03,confirmed\n"
+                                      f"guest,{room.id},2025-06-02,2025-06-04,confirmed\n"
+                                      f"guest,{room.id},2025-06-04,2025-06-06,confirmed\n"
+                                      f"guest,{room.id},2025-06-02,2025-06-04,pending\n")
+        out = StringIO()
+        call_command('import_catalog', 'bookings', bookings, stdout=out)
+        self.assertIn("Skipped 2 confirmed bookings", out.getvalue())
+        self.assertIn("rows 2, 3.", out.getvalue())
+        self.assertEqual(sorted(Booking.objects.values_list('check_in', 'status')), [
+            (date(2025, 6, 1), Booking.BookingStatus.CONFIRMED), (date(2025, 6, 2), Booking.BookingStatus.PENDING),
+        ])
+        self.assertFalse(RoomNight.objects.filter(booked__gt=1).exists())
+
+    def test_rooms_need_a_hotel_id_when_the_hotel_name_is_ambiguous(self):
+        paris = City.objects.create(name="Paris")
+        Hotel.objects.create(name="Riverside", description="Quiet", city=paris, address="1 Quay")
+        second = Hotel.objects.create(name="Riverside", description="Quiet", city=paris, address="9 Quay")
+        by_name = self.write('.csv', "hotel,city,room_type,price_per_night,stock\nRiverside,Paris,Single,50,1\n")
+        with self.assertRaisesMessage(CommandError, "2 hotels are named 'Riverside' in 'Paris'"):
+            self.run_import('rooms', by_name)
+        self.assertFalse(Room.objects.exists())
+
+        by_id = self.write('.csv', f"hotel_id,room_type,price_per_night,stock\n{second.id},Single,50,1\n"
+                                   f"{second.id + 100},Single,50,1\n")
+        with self.assertRaisesMessage(CommandError, "unknown hotel_id"):
+            self.run_import('rooms', by_id, batch_size=1)
+        self.assertEqual(list(Room.objects.values_list('hotel_id', flat=True)), [second.id])
+
+    def test_resume_continues_after_failed_batch(self):
+        rows = ["Hotel A,Desc,Paris,1 St", "Hotel B,Desc,Paris,2 St", "Hotel C,Desc,Paris,3 St"]
+        path = self.write('.csv', "name,description,city,address\n" + "\n".join(rows[:2]) + "\nHotel C,Desc,Paris\n")
+        with self.assertRaises(CommandError):
+            self.run_import('hotels', path, batch_size=2)
+        self.assertEqual(list(Hotel.objects.values_list('name', flat=True)), ["Hotel A", "Hotel B"])
+
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write("name,description,city,address\n" + "\n".join(rows) + "\n")
+        self.run_import('hotels', path, batch_size=2, resume=True)
+        self.assertEqual(sorted(Hotel.objects.values_list('name', flat=True)), ["Hotel A", "Hotel B", "Hotel C"])
+        self.assertEqual(ImportCheckpoint.objects.get().rows_done, 3)
+
+    def test_failed_import_still_invalidates_committed_batches(self):
+        self.assertEqual(self.client.get('/api/hotels/').data['results'], [])
+        path = self.write('.csv', "name,description,city,address\nHotel A,Desc,Paris,1 St\nHotel B,Desc,Paris\n")
+        with self.assertRaises(CommandError):
+            self.run_import('hotels', path, batch_size=1)
+        self.assertEqual([hotel['name'] for hotel in self.client.get('/api/hotels/').data['results']], ["Hotel A"])
+
+    def test_bumps_again_when_the_transaction_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                bump_namespaces('hotels')
+                version = namespace_versions(['hotels'])
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotEqual(namespace_versions(['hotels']), version)
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass', email='admin@example.com')
+        self.guest = User.objects.create_user(username='guest', password='guestpass', email='guest@example.com')
+        city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=city, address="1 St")
+        room = Room.objects.create(hotel=self.hotel, room_type='Single', price_per_night=Decimal('120.50'), stock=1)
+        self.booking = Booking.objects.create(user=self.guest, room=room, check_in="2025-06-01", check_out="2025-06-04")
+        Review.objects.create(user=self.guest, hotel=self.hotel, rating=4, comment='Tidy, "quiet"\nwould return')
+
+    def fetch(self, kind, **params):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(f'/api/admin/exports/{kind}/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_bookings_csv_totals_price_in_sql(self):
+        response, body = self.fetch('bookings')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('bookings.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['nights'], '3')
+        self.assertEqual(Decimal(rows[0]['total_price']), Decimal('361.50'))
+        self.assertEqual(rows[0]['user_username'], 'guest')
+
+    def test_csv_cells_cannot_start_formulas(self):
+        for index, comment in enumerate(['=HYPERLINK("http://evil.example")', '+1', '-2+3', '@SUM(A1)', 'fine']):
+            user = User.objects.create_user(username=f'user{index}', password='userpass',
+                                            email=f'user{index}@example.com')
+            Review.objects.create(user=user, hotel=self.hotel, rating=3, comment=comment)
+        _, body = self.fetch('reviews')
+        comments = [row['comment'] for row in csv.DictReader(StringIO(body))][1:]
+        self.assertEqual(comments, ["'=HYPERLINK(\"http://evil.example\")", "'+1", "'-2+3", "'@SUM(A1)", 'fine'])
+        _, body = self.fetch('reviews', output='ndjson')
+        self.assertEqual(json.loads(body.splitlines()[1])['comment'], '=HYPERLINK("http://evil.example")')
+
+    def test_reviews_ndjson(self):
+        response, body = self.fetch('reviews', output='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['hotel_name'], "Test Hotel")
+        self.assertEqual(row['comment'], 'Tidy, "quiet"\nwould return')
+
+    def test_date_window(self):
+        today = timezone.localdate()
+        _, body = self.fetch('bookings', since=today.isoformat())
+        self.assertEqual(len(list(csv.DictReader(StringIO(body)))), 1)
+        _, body = self.fetch('bookings', until=today.isoformat())
+        self.assertEqual(list(csv.DictReader(StringIO(body))), [])
+
+    def test_admin_only_and_known_kinds(self):
+        self.client.force_authenticate(user=self.guest)
+        self.assertEqual(self.client.get('/api/admin/exports/bookings/').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.get('/api/admin/exports/payments/').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/api/admin/exports/bookings/', {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_command_writes_file(self):
+        target = tempfile.NamedTemporaryFile(suffix='.ndjson', delete=False)
+        target.close()
+        self.addCleanup(os.remove, target.name)
+        call_command('export_data', 'bookings', output='ndjson', file=target.name)
+        with open(target.name, encoding='utf-8') as source:
+            rows = [json.loads(line) for line in source]
+        self.assertEqual([row['id'] for row in rows], [self.booking.id])
+        self.assertEqual(Decimal(rows[0]['total_price']), Decimal('361.50'))
+
+        out = StringIO()
+        call_command('export_data', 'reviews', stdout=out)
+        self.assertIn('hotel_name', out.getvalue().splitlines()[0])
+
+
+class PendingBookingsMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', password='userpass', email='user@example.com')
+        city = City.objects.create(name="Test City")
+        hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=city, address="1 St")
+        self.room = Room.objects.create(hotel=hotel, room_type='Double', price_per_night=100, stock=2)
+        self.other_room = Room.objects.create(hotel=hotel, room_type='Single', price_per_night=80, stock=1)
+
+    def pending(self, room, check_in, check_out, age=timedelta(minutes=1)):
+        booking = Booking.objects.create(user=self.user, room=room, check_in=check_in, check_out=check_out)
+        Booking.objects.filter(id=booking.id).update(created_at=timezone.now() - age)
+        return booking.id
+
+    def statuses(self, *booking_ids):
+        return [Booking.objects.get(id=booking_id).status for booking_id in booking_ids]
+
+
+class BatchConfirmationTestCase(PendingBookingsMixin, APITestCase):
+    def test_reserve_no_longer_schedules_a_task_per_booking(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/api/rooms/{self.room.id}/reserve/',
+                                    {"check_in": "2025-06-01", "check_out": "2025-06-03"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.statuses(response.data['id']), [Booking.BookingStatus.PENDING])
+
+    def test_confirms_oldest_first_up_to_capacity(self):
+        first = self.pending(self.room, date(2025, 6, 1), date(2025, 6, 4), age=timedelta(minutes=3))
+        second = self.pending(self.room, date(2025, 6, 2), date(2025, 6, 3), age=timedelta(minutes=2))
+        third = self.pending(self.room, date(2025, 6, 2), date(2025, 6, 5))
+        fourth = self.pending(self.room, date(2025, 6, 4), date(2025, 6, 5))
+        elsewhere = self.pending(self.other_room, date(2025, 6, 2), date(2025, 6, 3))
+        too_new = self.pending(self.other_room, date(2025, 7, 1), date(2025, 7, 2), age=timedelta(0))
+
+        confirm_pending_bookings()
+
+        confirmed, pending = Booking.BookingStatus.CONFIRMED, Booking.BookingStatus.PENDING
+        self.assertEqual(self.statuses(first, second, third, fourth, elsewhere, too_new),
+                         [confirmed, confirmed, pending, confirmed, confirmed, pending])
+        self.assertEqual(
+            list(self.room.nights.order_by('date').values_list('date', 'booked')),
+            [(date(2025, 6, 1), 1), (date(2025, 6, 2), 2), (date(2025, 6, 3), 1), (date(2025, 6, 4), 1)],
+        )
+        self.assertEqual(self.other_room.nights.get().booked, 1)
+
+    def test_one_night_update_per_room(self):
+        for i in range(6):
+            self.pending(self.room, date(2025, 6, 1 + i), date(2025, 6, 3 + i))
+        with CaptureQueriesContext(connection) as context:
+            confirm_pending_bookings()
+        updates = [query for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE "mainapp_roomnight"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Booking.objects.filter(status=Booking.BookingStatus.CONFIRMED).count(), 6)
+
+    def test_skips_cancelled_and_respects_existing_nights(self):
+        cancelled = self.pending(self.other_room, date(2025, 6, 1), date(2025, 6, 2))
+        Booking.objects.filter(id=cancelled).update(status=Booking.BookingStatus.CANCELLED)
+        held = self.pending(self.other_room, date(2025, 6, 1), date(2025, 6, 2))
+        RoomNight.objects.create(room=self.other_room, date=date(2025, 6, 1), booked=1)
+
+        confirm_pending_bookings()
+
+        self.assertEqual(self.statuses(cancelled, held),
+                         [Booking.BookingStatus.CANCELLED, Booking.BookingStatus.PENDING])
+        self.assertEqual(self.other_room.nights.get().booked, 1)
+
+    def test_records_batch_size_and_lag(self):
+        self.pending(self.room, date(2025, 6, 1), date(2025, 6, 2), age=timedelta(seconds=40))
+        self.pending(self.room, date(2025, 6, 1), date(2025, 6, 2), age=timedelta(seconds=60))
+        self.pending(self.other_room, date(2025, 6, 1), date(2025, 6, 2), age=timedelta(seconds=50))
+
+        confirm_pending_bookings()
+
+        stats = metrics.snapshot('booking_confirmation_batch_size', 'booking_confirmation_lag_ms')
+        self.assertEqual(stats['booking_confirmation_batch_size'], {'count': 2, 'sum': 3, 'mean': 1.5})
+        lag = stats['booking_confirmation_lag_ms']
+        self.assertEqual(lag['count'], 3)
+        self.assertGreaterEqual(lag['mean'], 50000)
+
+
+class StaleBookingSweepTestCase(PendingBookingsMixin, APITestCase):
+    stale = timedelta(hours=1)
+
+    def test_confirms_what_fits_and_cancels_the_rest(self):
+        first = self.pending(self.other_room, date(2025, 6, 1), date(2025, 6, 3), age=self.stale)
+        clash = self.pending(self.other_room, date(2025, 6, 2), date(2025, 6, 4), age=self.stale)
+        recent = self.pending(self.other_room, date(2025, 6, 2), date(2025, 6, 4), age=timedelta(minutes=1))
+
+        expire_stale_bookings(batch_size=1)
+
+        self.assertEqual(self.statuses(first, clash, recent), [
+            Booking.BookingStatus.CONFIRMED, Booking.BookingStatus.CANCELLED, Booking.BookingStatus.PENDING,
+        ])
+        self.assertEqual(list(self.other_room.nights.order_by('date').values_list('booked', flat=True)), [1, 1, 0])
+        self.assertEqual(metrics.snapshot('booking_expired')['booking_expired']['sum'], 1)
+
+    def test_leaves_settled_bookings_alone(self):
+        confirmed = self.pending(self.room, date(2025, 6, 1), date(2025, 6, 2), age=self.stale)
+        Booking.objects.filter(id=confirmed).update(status=Booking.BookingStatus.CONFIRMED)
+        expire_stale_bookings()
+        self.assertEqual(self.statuses(confirmed), [Booking.BookingStatus.CONFIRMED])
+
+    @skipUnless(connection.vendor == 'sqlite', "checks sqlite's query plan")
+    def test_sweep_reads_the_partial_index(self):
+        DataCollector().clear()
+        plan = Booking.objects.filter(
+            status=Booking.BookingStatus.PENDING, created_at__lte=timezone.now()
+        ).order_by('created_at', 'id').explain()
+        self.assertIn('booking_pending_created_idx', plan)
+
+
+class ImageVariantsTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass', email='a@example.com')
+        self.city = City.objects.create(name="Test City")
+
+    def upload(self, name, size=(2400, 1600), mode='RGB', image_format='JPEG'):
+        buffer = BytesIO()
+        Image.new(mode, size, (255, 0, 0, 128)).save(buffer, image_format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def create_hotel(self, image):
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/hotels/', {
+                'name': 'New Hotel', 'description': 'Nice', 'city_id': self.city.id, 'address': '1 St',
+                'image': image,
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Hotel.objects.get(pk=response.data['id'])
+
+    def test_upload_renders_thumbnails_and_webp_next_to_the_original(self):
+        hotel = self.create_hotel(self.upload('facade.jpg'))
+        self.assertEqual(set(hotel.image_variants), {'thumb', 'medium', 'large'})
+        self.assertEqual(hotel.image_variants['thumb'], {
+            'width': 320, 'height': 240,
+            'webp': 'hotels/facade_thumb.webp', 'jpeg': 'hotels/facade_thumb.jpg',
+        })
+        self.assertEqual((hotel.image_variants['medium']['width'], hotel.image_variants['medium']['height']),
+                         (960, 640))
+        with default_storage.open(hotel.image_variants['thumb']['webp']) as stored:
+            rendition = Image.open(stored)
+            self.assertEqual((rendition.format, rendition.size), ('WEBP', (320, 240)))
+
+        response = self.client.get(f'/api/hotels/{hotel.id}/')
+        thumb = response.data['image_variants']['thumb']
+        self.assertEqual(thumb['webp'], default_storage.url('hotels/facade_thumb.webp'))
+        self.assertEqual(thumb['width'], 320)
+
+    def test_transparent_images_keep_alpha_in_webp_only(self):
+        room_hotel = Hotel.objects.create(name="H", description="D", city=self.city, address="A")
+        room = Room.objects.create(hotel=room_hotel, room_type='Single', price_per_night=100, stock=1)
+        room.image = self.upload('plan.png', size=(800, 600), mode='RGBA', image_format='PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            room.save()
+        room.refresh_from_db()
+        with default_storage.open(room.image_variants['medium']['webp']) as stored:
+            self.assertEqual(Image.open(stored).mode, 'RGBA')
+        with default_storage.open(room.image_variants['medium']['jpeg']) as stored:
+            self.assertEqual(Image.open(stored).mode, 'RGB')
+        # smaller than the box: never upscaled
+        self.assertEqual(room.image_variants['large']['width'], 800)
+
+    def test_replacing_the_image_drops_stale_variants_until_rerendered(self):
+        hotel = self.create_hotel(self.upload('old.jpg'))
+        hotel.image = self.upload('new.jpg')
+        with self.captureOnCommitCallbacks() as callbacks:
+            hotel.save()
+        self.assertEqual(Hotel.objects.get(pk=hotel.pk).image_variants, {})
+        self.assertEqual(self.client.get(f'/api/hotels/{hotel.id}/').data['image_variants'], {})
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Hotel.objects.get(pk=hotel.pk).image_variants['thumb']['webp'], 'hotels/new_thumb.webp')
+        # the detail cache was invalidated by the task's bump
+        self.assertIn('thumb', self.client.get(f'/api/hotels/{hotel.id}/').data['image_variants'])
+
+    def test_replaced_and_deleted_images_lose_their_renditions_on_commit(self):
+        hotel = self.create_hotel(self.upload('before.jpg'))
+        old = [rendition['webp'] for rendition in hotel.image_variants.values()]
+        hotel.image = self.upload('after.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel.save()
+            self.assertTrue(all(default_storage.exists(name) for name in old))
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+
+        hotel.refresh_from_db()
+        new = [rendition['jpeg'] for rendition in hotel.image_variants.values()]
+        self.assertTrue(all(default_storage.exists(name) for name in new))
+        with self.captureOnCommitCallbacks(execute=True):
+            hotel.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in new))
+
+    def test_renditions_of_an_image_replaced_while_rendering_are_deleted(self):
+        hotel = self.create_hotel(self.upload('racing.jpg'))
+
+        def render_then_replace(field_file):
+            Hotel.objects.filter(pk=hotel.pk).update(image='hotels/other.jpg')
+            return {'thumb': {'webp': 'hotels/stale.webp'}}
+
+        with mock.patch('mainapp.tasks.render_variants', render_then_replace), \
+                mock.patch.object(default_storage, 'delete') as delete:
+            self.assertEqual(generate_image_variants(hotel._meta.label_lower, hotel.pk),
+                             f"mainapp.hotel {hotel.pk} image changed while rendering.")
+        delete.assert_called_once_with('hotels/stale.webp')
+
+    def test_saves_without_a_new_image_do_not_rerender(self):
+        hotel = self.create_hotel(self.upload('lobby.jpg'))
+        hotel.name = "Renamed"
+        with mock.patch.object(generate_image_variants, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            hotel.save()
+        delay.assert_not_called()
+        self.assertEqual(generate_image_variants(hotel._meta.label_lower, 0), "mainapp.hotel 0 has no image.")
+
+
+class ImageUploadTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass', email='a@example.com')
+        self.client.force_authenticate(user=self.admin)
+        city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=city, address="1 St")
+        self.room = Room.objects.create(hotel=self.hotel, room_type='Single', price_per_night=100, stock=1)
+
+    def jpeg(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'blue').save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def presign(self, target='hotels', pk=None, content_type='image/jpeg'):
+        return self.client.post(f'/api/uploads/{target}/{pk or self.hotel.id}/', {'content_type': content_type})
+
+    def put(self, upload, body, content_type=None):
+        content_type = content_type or upload['headers']['Content-Type']
+        return self.client.generic('PUT', upload['url'], body, content_type=content_type)
+
+    def confirm(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/uploads/confirm/', {'upload_token': upload['upload_token']})
+
+    def test_presign_put_confirm_attaches_the_key_and_renders_variants(self):
+        response = self.presign('rooms', self.room.id, 'image/png')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload = response.data
+        self.assertEqual(upload['method'], 'PUT')
+        self.assertRegex(upload['key'], r'^uploads/rooms/[0-9a-f]{32}\.png$')
+        self.assertTrue(upload['url'].startswith('http://testserver/upload-stand-in/'))
+
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'blue').save(buffer, 'PNG')
+        self.assertEqual(self.put(upload, buffer.getvalue()).status_code, status.HTTP_200_OK)
+        response = self.confirm(upload)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.room.id)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.image.name, upload['key'].removeprefix('uploads/'))
+        self.assertIn('thumb', self.room.image_variants)
+        # moved out of the prefix the bucket expires; confirming again changes nothing
+        self.assertFalse(default_storage.exists(upload['key']))
+        self.assertTrue(default_storage.exists(self.room.image.name))
+        self.assertEqual(self.confirm(upload).status_code, status.HTTP_200_OK)
+
+    def test_confirm_needs_the_upload_and_a_genuine_token(self):
+        upload = self.presign().data
+        self.assertEqual(self.confirm(upload).status_code, status.HTTP_400_BAD_REQUEST)
+        forged = dict(upload, upload_token=upload['upload_token'][:-1] + 'x')
+        self.assertEqual(self.confirm(forged).status_code, status.HTTP_400_BAD_REQUEST)
+        self.hotel.refresh_from_db()
+        self.assertFalse(self.hotel.image)
+
+    def test_stand_in_enforces_the_signed_content_type_and_size(self):
+        upload = self.presign().data
+        self.assertEqual(self.put(upload, self.jpeg(), 'image/png').status_code, status.HTTP_403_FORBIDDEN)
+        with self.settings(IMAGE_UPLOAD_MAX_BYTES=100):
+            self.assertEqual(self.put(upload, self.jpeg()).status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            self.assertEqual(self.put(upload, b'x' * 100).status_code, status.HTTP_200_OK)
+        with self.settings(IMAGE_UPLOAD_MAX_BYTES=10):
+            self.assertEqual(self.confirm(upload).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(default_storage.exists(upload['key']))
+
+    def test_s3_storage_gets_a_presigned_bucket_url(self):
+        storage = S3Boto3Storage(bucket_name='media', access_key='key', secret_key='secret',
+                                 endpoint_url='http://minio:9000')
+        uploads._presigning_client.cache_clear()
+        self.addCleanup(uploads._presigning_client.cache_clear)
+        with mock.patch.object(Hotel._meta.get_field('image'), 'storage', storage), \
+                self.settings(MINIO_PUBLIC_ENDPOINT='http://files.example.com'):
+            upload = self.presign().data
+        self.assertTrue(upload['url'].startswith(f"http://files.example.com/media/{upload['key']}?"))
+        self.assertIn('X-Amz-Signature=', upload['url'])
+        self.assertIn('X-Amz-Expires=900', upload['url'])
+        self.assertIn('content-type', upload['url'].split('X-Amz-SignedHeaders=')[1].split('&')[0])
+
+    def test_s3_confirm_copies_inside_the_bucket(self):
+        storage = S3Boto3Storage(bucket_name='media', access_key='key', secret_key='secret',
+                                 endpoint_url='http://minio:9000')
+        with mock.patch.object(S3Boto3Storage, 'bucket', new_callable=mock.PropertyMock) as bucket, \
+                mock.patch.object(storage, 'delete') as delete:
+            self.assertEqual(uploads.attach(storage, 'uploads/hotels/a.jpg'), 'hotels/a.jpg')
+        bucket.return_value.copy.assert_called_once_with({'Bucket': 'media', 'Key': 'uploads/hotels/a.jpg'},
+                                                         'hotels/a.jpg')
+        delete.assert_called_once_with('uploads/hotels/a.jpg')
+
+    def test_presign_is_admin_only_and_validates_the_target(self):
+        self.assertEqual(self.presign('cities').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.presign(content_type='image/gif').status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=User.objects.create_user(username='u', password='p'))
+        self.assertEqual(self.presign().status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RowSerializerParityTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='userpass', email='u@example.com')
+        city = City.objects.create(name="Test City")
+        plain = Hotel.objects.create(name="Plain", description="No image", city=city, address="1 St")
+        pictured = Hotel.objects.create(
+            name="Pictured", description="With image", city=city, address="2 St", image='hotels/front.jpg',
+            image_variants={'thumb': {'width': 320, 'height': 240, 'webp': 'hotels/front_thumb.webp',
+                                      'jpeg': 'hotels/front_thumb.jpg'}},
+        )
+        Hotel.objects.filter(pk=pictured.pk).add_rating(5)
+        Hotel.objects.filter(pk=pictured.pk).add_rating(4)
+        Room.objects.create(hotel=plain, room_type='Single', price_per_night=Decimal('80'), stock=0)
+        room = Room.objects.create(hotel=pictured, room_type='Vip', price_per_night=Decimal('149.99'), stock=3,
+                                   image='rooms/suite.png')
+        Booking.objects.create(user=self.user, room=room, check_in=date(2030, 5, 1), check_out=date(2030, 5, 4))
+        self.context = {'request': Request(APIRequestFactory().get('/api/hotels/'))}
+
+    def assertParity(self, queryset, serializer_class, rows_class, query=None):
+        context = {'request': Request(APIRequestFactory().get('/api/hotels/', query))} if query else self.context
+        expected = serializer_class(queryset, many=True, context=context).data
+        actual = rows_class(rows_class(context=context).rows(queryset), many=True, context=context).data
+        self.assertEqual(json.dumps(actual, cls=JSONEncoder), json.dumps(expected, cls=JSONEncoder))
+        self.assertEqual(actual, expected)
+
+    def test_rows_match_the_model_serializers(self):
+        self.assertParity(Hotel.objects.select_related('city').order_by('id'), HotelSerializer, HotelRows)
+        self.assertParity(Room.objects.select_related('hotel__city').order_by('id'), RoomSerializer, RoomRows)
+        self.assertParity(Booking.objects.select_related('room__hotel__city').order_by('id'), BookingSerializer,
+                          BookingRows)
+
+    def test_rows_match_for_every_selection(self):
+        queryset = Booking.objects.select_related('room__hotel__city').order_by('id')
+        for query in [{'expand': 'room'}, {'expand': 'room.hotel'}, {'expand': 'room.hotel.city'},
+                      {'fields': 'id,total_price'}, {'fields': 'room,status', 'expand': 'room.hotel'}]:
+            with self.subTest(**query):
+                self.assertParity(queryset, BookingSerializer, BookingRows, query)
+        self.assertParity(Room.objects.select_related('hotel__city').order_by('id'), RoomSerializer, RoomRows,
+                          {'fields': 'id,image_variants,is_available', 'expand': 'hotel'})
+
+    def test_endpoints_serve_the_model_serializer_shape(self):
+        hotel = Hotel.objects.get(name="Pictured")
+        request_context = {'request': Request(APIRequestFactory().get(f'/api/hotels/{hotel.id}/'))}
+        detail = self.client.get(f'/api/hotels/{hotel.id}/').json()
+        self.assertEqual(detail, json.loads(json.dumps(HotelSerializer(hotel, context=request_context).data)))
+        self.assertEqual(self.client.get(f'/api/async/hotels/{hotel.id}/').json(), detail)
+
+        self.client.force_authenticate(user=self.user)
+        booking = Booking.objects.get()
+        listed = self.client.get('/api/user/reserves/').json()['results']
+        self.assertEqual(listed[0]['total_price'], 449.97)
+        self.assertEqual(self.client.get(f'/api/user/reserves/{booking.id}/').json(), listed[0])
+
+
+class SparseFieldsetTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass', email='a@example.com')
+        self.city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=self.city, address="1 St")
+        self.room = Room.objects.create(hotel=self.hotel, room_type='Single', price_per_night=100, stock=1)
+
+    def get_sql(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), ' '.join(query['sql'] for query in context.captured_queries)
+
+    def test_relations_are_ids_unless_expanded(self):
+        room = self.client.get(f'/api/rooms/{self.room.id}/').json()
+        self.assertEqual(room['hotel'], self.hotel.id)
+        room = self.client.get(f'/api/rooms/{self.room.id}/?expand=hotel').json()
+        self.assertEqual(room['hotel']['name'], "Test Hotel")
+        self.assertEqual(room['hotel']['city'], self.city.id)
+        room = self.client.get(f'/api/rooms/{self.room.id}/?expand=hotel.city').json()
+        self.assertEqual(room['hotel']['city'], {'id': self.city.id, 'name': "Test City"})
+        self.assertEqual(self.client.get('/api/hotels/?expand=city').json()['results'][0]['city']['name'],
+                         "Test City")
+
+    def test_pages_expand_the_relations_they_render(self):
+        Booking.objects.create(user=self.admin, room=self.room, check_in="2025-06-01", check_out="2025-06-03")
+        self.client.force_authenticate(user=self.admin)
+        for url, path in [
+            ('/api/hotels/?expand=city', ('results', 0, 'city', 'name')),
+            (f'/api/cities/{self.city.id}/hotels/?expand=city', ('results', 0, 'city', 'name')),
+            (f'/api/hotels/{self.hotel.id}/?expand=city', ('city', 'name')),
+            (f'/api/rooms/{self.room.id}/?expand=hotel.city', ('hotel', 'city', 'name')),
+            ('/api/user/reserves/?expand=room.hotel', ('results', 0, 'room', 'hotel', 'name')),
+        ]:
+            with self.subTest(url=url):
+                value = self.client.get(url).json()
+                for key in path:
+                    value = value[key]
+                self.assertIn(value, ("Test City", "Test Hotel"))
+
+    def test_fields_limit_the_keys_and_columns(self):
+        data, sql = self.get_sql('/api/hotels/?fields=id,name')
+        self.assertEqual(data['results'], [{'id': self.hotel.id, 'name': "Test Hotel"}])
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"mainapp_city"', sql)
+
+        data, sql = self.get_sql('/api/rooms/?fields=id,hotel&expand=hotel.city')
+        self.assertEqual(set(data['results'][0]), {'id', 'hotel'})
+        self.assertEqual(data['results'][0]['hotel']['city']['name'], "Test City")
+        self.assertIn('"mainapp_city"', sql)
+
+        _, sql = self.get_sql('/api/rooms/')
+        self.assertNotIn('"mainapp_hotel"', sql.split('FROM', 1)[1])
+
+    def test_detail_cache_is_kept_per_selection(self):
+        url = f'/api/hotels/{self.hotel.id}/'
+        self.assertEqual(self.client.get(url).json()['city'], self.city.id)
+        self.assertEqual(self.client.get(f'{url}?expand=city').json()['city']['name'], "Test City")
+        self.assertEqual(self.client.get(f'{url}?fields=name').json(), {'name': "Test Hotel"})
+        self.assertEqual(self.client.get(f'/api/async/hotels/{self.hotel.id}/?fields=name').json(),
+                         {'name': "Test Hotel"})
+
+    def test_writes_honour_the_selection(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post('/api/hotels/?expand=city', {
+            'name': "New Hotel", 'description': "Fresh", 'city_id': self.city.id, 'address': "2 St",
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['city']['name'], "Test City")
+        response = self.client.post(f'/api/rooms/{self.room.id}/reserve/',
+                                    {'check_in': '2030-05-01', 'check_out': '2030-05-03'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['room'], self.room.id)
+        self.assertEqual(response.data['total_price'], 200)
+
+
+class FastJSONTestCase(APITestCase):
+    payload = {
+        'price': Decimal('149.99'),
+        'created_at': timezone.make_aware(timezone.datetime(2030, 5, 1, 12, 30, 15, 123456), timezone.get_fixed_timezone(0)),
+        'local': timezone.make_aware(timezone.datetime(2030, 5, 1, 12, 30), timezone.get_fixed_timezone(120)),
+        'day': date(2030, 5, 1),
+        'lazy': gettext_lazy("Hotel"),
+        'text': "caf\u00e9 \u2028 line",
+        'nested': [{'id': 1, 'ratio': 0.5, 'ok': True, 'none': None}],
+        1: 'int key',
+    }
+
+    def test_matches_the_stdlib_renderer_byte_for_byte(self):
+        expected = JSONRenderer().render(self.payload)
+        self.assertEqual(renderers.FastJSONRenderer().render(self.payload), expected)
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(self.payload), expected)
+        self.assertEqual(renderers.FastJSONRenderer().render(self.payload, 'application/json; indent=2'),
+                         JSONRenderer().render(self.payload, 'application/json; indent=2'))
+
+    def test_parser_reads_utf8_and_rejects_invalid_json(self):
+        parser = renderers.FastJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"name": "caf\u00e9"}'.encode())), {'name': "caf\u00e9"})
+        for body in [b'{"a": NaN}', b'{"a": 1']:
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
+
+    def test_stream_renders_the_same_json_in_chunks(self):
+        renderer = renderers.StreamingJSONRenderer()
+        results = [{'id': i, 'price': Decimal(i)} for i in range(5)]
+        tail = {'next': 'http://testserver/?cursor=x', 'previous': None}
+        chunks = list(renderer.stream(iter(results), lambda: tail, chunk_items=2))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b''.join(chunks)), json.loads(renderer.render({'results': results, **tail})))
+        self.assertEqual(b''.join(renderer.stream(iter([]), dict)), b'{"results":[]}')
+
+    def read_stream(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_list_streams_pages_larger_than_the_page_size_cap(self):
+        city = City.objects.create(name="Test City")
+        Hotel.objects.bulk_create([
+            Hotel(name=f"Hotel {i}", description="Nice", city=city, address="1 St") for i in range(260)
+        ])
+        expected = list(Hotel.objects.order_by('id').values_list('id', flat=True))
+
+        with CaptureQueriesContext(connection) as context:
+            streamed = self.client.get('/api/hotels/', {'format': 'json-stream', 'page_size': 250})
+            # nothing is read until the body is
+            self.assertEqual(len(context.captured_queries), 0)
+            body = json.loads(b''.join(streamed.streaming_content))
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual([hotel['id'] for hotel in body['results']], expected[:250])
+        self.assertEqual(body['results'][0], self.client.get('/api/hotels/', {'page_size': 1}).data['results'][0])
+        self.assertIsNone(body['previous'])
+
+        rest = self.read_stream(body['next'])
+        self.assertEqual([hotel['id'] for hotel in rest['results']], expected[250:])
+        self.assertIsNone(rest['next'])
+        # backwards pages are built in memory, with the same links
+        back = self.read_stream(rest['previous'])
+        self.assertEqual([hotel['id'] for hotel in back['results']], expected[:250])
+        self.assertIsNone(back['previous'])
+        self.assertEqual(len(self.read_stream('/api/hotels/', {'format': 'json-stream', 'page_size': 50000})
+                             ['results']), 260)
+
+    def test_invalid_cursor_is_rejected_before_streaming(self):
+        response = self.client.get('/api/hotels/', {'format': 'json-stream', 'cursor': 'bogus'})
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class IndexUsageTestCase(APITestCase):
+    """EXPLAINs the main query of each hot read over a seeded catalogue and checks it searches the expected index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        loadtest.seed(hotels=60, rooms_per_hotel=4, users=20, bookings=1200, reviews=1200, hotels_per_city=10)
+        Booking.objects.filter(id__in=Booking.objects.order_by('id').values('id')[:50]).update(
+            status=Booking.BookingStatus.PENDING
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = User.objects.filter(username__startswith='loaduser').first()
+        cls.hotel = Hotel.objects.order_by('id')[10]
+
+    def explain(self, sql):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def assertIndexScan(self, run, table, index):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            run()
+        queries = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']]
+        self.assertTrue(queries, f"no query on {table}")
+        plan = self.explain(queries[0])
+        self.assertIn(index, plan, plan)
+
+    def get(self, url):
+        return lambda: self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_catalogue_reads_use_their_indexes(self):
+        stay = 'check_in=2030-05-01&check_out=2030-05-03'
+        for url, table, index in [
+            (f'/api/cities/{self.hotel.city_id}/hotels/', 'mainapp_hotel', 'hotel_city_id_idx'),
+            (f'/api/hotels/{self.hotel.id}/rooms/', 'mainapp_room', 'room_hotel_id_idx'),
+            ('/api/hotels/?ordering=-rating_avg', 'mainapp_hotel', 'hotel_rating_id_idx'),
+            (f'/api/hotels/{self.hotel.id}/reviews/', 'mainapp_review', 'review_hotel_created_idx'),
+            (f'/api/hotels/{self.hotel.id}/reviews/?sort=rating', 'mainapp_review', 'review_hotel_rating_idx'),
+            (f'/api/search/?{stay}', 'mainapp_hotel', 'room_available_price_idx'),
+            (f'/api/search/?{stay}&room_type=Vip', 'mainapp_hotel', 'room_search_idx'),
+        ]:
+            with self.subTest(url=url):
+                self.assertIndexScan(self.get(url), table, index)
+
+    def test_user_reads_use_their_indexes(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertIndexScan(self.get('/api/user/reserves/'), 'mainapp_booking', 'booking_user_created_idx')
+        self.assertIndexScan(self.get('/api/user/reviews/'), 'mainapp_review', 'review_user_created_idx')
+
+    def test_booking_maintenance_uses_its_indexes(self):
+        self.assertIndexScan(confirm_pending_bookings, 'mainapp_booking', 'booking_pending_created_idx')
+
+    def test_every_foreign_key_leads_an_index(self):
+        # foreign keys declared with db_index=False rely on a composite index starting with their column
+        with connection.cursor() as cursor:
+            for model in apps.get_app_config('mainapp').get_models():
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                leading = {constraint['columns'][0] for constraint in constraints.values()
+                           if (constraint['index'] or constraint['unique']) and constraint['columns']}
+                for field in model._meta.concrete_fields:
+                    if field.is_relation:
+                        self.assertIn(field.column, leading, f'{model.__name__}.{field.name}')
+
+
+class RateLimitTestCase(APITestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.limiter = use_fresh_rate_limiter(self)
+        self.limiter.timer = lambda: self.now
+        tiers = [throttling.BurstRateThrottle, throttling.SustainedRateThrottle]
+        for patcher in [
+            mock.patch.object(view, 'throttle_classes', tiers)
+            for view in [api_views.HotelViewSet, api_views.RoomReserveAPIView, api_views.RegisterAPIView,
+                         async_views.AsyncAPIView]
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='user', password='userpass', email='u@example.com')
+        city = City.objects.create(name="Test City")
+        hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=city, address="1 St")
+        self.room = Room.objects.create(hotel=hotel, room_type='Single', price_per_night=100, stock=50)
+        self.registered = 0
+
+    def register(self):
+        self.registered += 1
+        name = f'new{self.registered}'
+        return self.client.post(reverse('register'), {
+            'username': name, 'email': f'{name}@example.com', 'password': 'password123',
+            'password_confirm': 'password123',
+        })
+
+    def test_overriding_the_limiter_starts_from_empty_buckets(self):
+        self.assertIs(throttling.get_rate_limiter(), self.limiter)
+        self.assertEqual(self.limiter.buckets, {})
+        self.register()
+        self.assertIsNot(use_fresh_rate_limiter(self), self.limiter)
+        self.assertEqual(throttling.get_rate_limiter().buckets, {})
+
+    def test_bucket_allows_a_burst_then_refills(self):
+        self.assertEqual([self.limiter.hit('key', 3, 60)[0] for _ in range(4)], [True, True, True, False])
+        self.assertAlmostEqual(self.limiter.hit('key', 3, 60)[1], 20)
+        self.now += 20
+        self.assertEqual([self.limiter.hit('key', 3, 60)[0] for _ in range(2)], [True, False])
+        self.assertTrue(self.limiter.hit('other', 3, 60)[0])
+
+    def test_register_has_strict_burst_and_sustained_tiers(self):
+        responses = [self.register() for _ in range(4)]
+        self.assertEqual([response.status_code for response in responses], [201, 201, 201, 429])
+        self.assertEqual(responses[-1]['Retry-After'], '20')
+        # the burst bucket refills every minute; the rejected request still counted against the hour
+        for _ in range(2):
+            self.now += 60
+            self.assertEqual([self.register().status_code for _ in range(3)], [201, 201, 201])
+        self.now += 60
+        self.assertEqual(self.register().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(User.objects.filter(username__startswith='new').count(), 9)
+        self.assertIn('throttle_rejections_total{scope="register.sustained"}', metrics.render())
+
+    def test_reserve_is_limited_per_user(self):
+        url = f'/api/rooms/{self.room.id}/reserve/'
+        stay = {'check_in': '2030-05-01', 'check_out': '2030-05-02'}
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual([self.client.post(url, stay).status_code for _ in range(6)], [201] * 5 + [429])
+        other = User.objects.create_user(username='other', password='userpass', email='o@example.com')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.post(url, stay).status_code, status.HTTP_201_CREATED)
+
+    def test_catalogue_reads_use_the_loose_scope(self):
+        for url in ['/api/hotels/', '/api/async/hotels/'] * 10:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.limiter.buckets['throttle:catalogue.burst:ip:127.0.0.1'][0], 100)
+        self.assertIn('throttle:catalogue.sustained:ip:127.0.0.1', self.limiter.buckets)
+
+
+@skipUnless(settings.CACHES['default']['BACKEND'] == 'django_redis.cache.RedisCache', "needs the Redis cache")
+class RedisRateLimiterTestCase(APITestCase):
+    def test_concurrent_hits_never_overdraw_the_bucket(self):
+        limiter = throttling.RedisRateLimiter()
+        key = f'throttle:test:{time.time_ns()}'
+        results = []
+        threads = [threading.Thread(target=lambda: results.extend(limiter.hit(key, 5, 60) for _ in range(5)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed for allowed, _ in results), 5)
+        self.assertTrue(all(0 < wait <= 12 for allowed, wait in results if not allowed))
+
+
+class ConcurrentConfirmationTestCase(TransactionTestCase):
+    workers = 8
+    bookings_per_worker = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user',
+            password='userpass',
+            email='user@example.com'
+        )
+        city = City.objects.create(name="Test City")
+        hotel = Hotel.objects.create(name="Test Hotel", description="Nice hotel", city=city, address="123 Main St")
+        self.room = Room.objects.create(hotel=hotel, room_type='Double', price_per_night=100, stock=3)
+
+    attempts = 50
+
+    def confirm_all(self, booking_ids):
+        try:
+            for booking_id in booking_ids:
+                for _ in range(self.attempts):
+                    try:
+                        Booking.objects.select_related('room').get(id=booking_id).confirm()
+                        break
+                    except OperationalError:
+                        # sqlite reports lock contention instead of waiting like postgres
+                        time.sleep(0.005)
+                else:
+                    self.unconfirmed.append(booking_id)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_confirmations_never_oversell(self):
+        booking_ids = [
+            Booking.objects.create(
+                user=self.user,
+                room=self.room,
+                check_in=date(2025, 6, 1 + i % 3),
+                check_out=date(2025, 6, 4 + i % 3),
+            ).id
+            for i in range(self.workers * self.bookings_per_worker)
+        ]
+        self.unconfirmed = []
+        threads = [
+            threading.Thread(target=self.confirm_all, args=(booking_ids[i::self.workers],))
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+            self.assertFalse(thread.is_alive(), "a confirming thread hung")
+        self.assertEqual(self.unconfirmed, [], f"still locked after {self.attempts} attempts")
+
+        nights = RoomNight.objects.filter(room=self.room)
+        self.assertTrue(nights.exists())
+        for night in nights:
+            self.assertLessEqual(night.booked, self.room.stock)
+            overlapping = Booking.objects.filter(
+                room=self.room,
+                status=Booking.BookingStatus.CONFIRMED,
+                check_in__lte=night.date,
+                check_out__gt=night.date,
+            ).count()
+            self.assertEqual(overlapping, night.booked)
+        self.assertEqual(nights.get(date=date(2025, 6, 3)).booked, self.room.stock)
+
+    def test_booking_confirmed_only_once(self):
+        booking = Booking.objects.create(
+            user=self.user, room=self.room, check_in=date(2025, 6, 1), check_out=date(2025, 6, 2)
+        )
+        self.assertTrue(Booking.objects.get(id=booking.id).confirm())
+        self.assertFalse(Booking.objects.get(id=booking.id).confirm())
+        self.assertEqual(RoomNight.objects.get(room=self.room).booked, 1)
+
+
+class QueryBudgetMixin:
+    """Counts the queries an API GET runs, ignoring silk's own bookkeeping."""
+    query_budget = 6
+    ignored_statements = ('EXPLAIN', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+    def get_counting_queries(self, url, data=None, clear_cache=True, **extra):
+        if clear_cache:
+            cache.clear()
+        DataCollector().clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data, **extra)
+            if response.streaming:
+                response.body = b''.join(response.streaming_content)
+        queries = [
+            query for query in context.captured_queries
+            if 'silk_' not in query['sql'] and not query['sql'].startswith(self.ignored_statements)
+        ]
+        return response, len(queries)
+
+    def assertWithinQueryBudget(self, url, data=None, budget=None):
+        response, count = self.get_counting_queries(url, data)
+        self.assertLessEqual(count, budget or self.query_budget, f"{url} ran {count} queries")
+        return response, count
+
+
+def api_url_patterns(patterns=api_urls.urlpatterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from api_url_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern
+
+
+class EndpointQueryBudgetTestCase(QueryBudgetMixin, APITestCase):
+    pk_sources = {
+        'city-detail': 'city',
+        'hotel-detail': 'hotel',
+        'async-hotel-detail': 'hotel',
+        'room-detail': 'room',
+        'review-delete': 'review',
+        'user-review-delete': 'review',
+        'user-booking-detail': 'booking',
+        'image-upload': 'hotel',
+    }
+    query_params = {
+        'hotel-search': {'check_in': '2025-06-01', 'check_out': '2025-06-05'},
+        'async-hotel-search': {'check_in': '2025-06-01', 'check_out': '2025-06-05'},
+        'hotel-text-search': {'q': 'hotel'},
+    }
+    url_values = {'kind': 'bookings', 'target': 'hotels'}
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='adminpass', email='admin@example.com')
+        self.client.force_authenticate(user=self.user)
+        self.city = City.objects.create(name="Test City")
+
+    def seed(self, count):
+        for i in range(count):
+            self.hotel = Hotel.objects.create(name=f"Hotel {i}", description="Nice", city=self.city, address="1 St")
+            self.room = Room.objects.create(hotel=self.hotel, room_type='Single', price_per_night=100, stock=2)
+            self.booking = Booking.objects.create(
+                user=self.user, room=self.room, check_in="2025-07-01", check_out="2025-07-03"
+            )
+            self.review = Review.objects.create(user=self.user, hotel=self.hotel, rating=5, comment="Great")
+
+    def url_kwargs(self, pattern):
+        kwargs = {}
+        for name in pattern.pattern.regex.groupindex:
+            if name == 'pk':
+                kwargs[name] = getattr(self, self.pk_sources[pattern.name]).pk
+            elif name in self.url_values:
+                kwargs[name] = self.url_values[name]
+            else:
+                kwargs[name] = getattr(self, name.removesuffix('_id')).pk
+        return kwargs
+
+    def measure_all(self):
+        counts = {}
+        for pattern in api_url_patterns():
+            if 'format' in pattern.pattern.regex.groupindex:
+                continue
+            url = reverse(pattern.name, kwargs=self.url_kwargs(pattern))
+            if not url.startswith('/api/'):
+                # 'login' and 'register' also name the html pages, which win the reverse
+                continue
+            response, count = self.assertWithinQueryBudget(url, self.query_params.get(pattern.name))
+            if response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED:
+                continue
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            counts[pattern.name] = count
+        return counts
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.seed(2)
+        small = self.measure_all()
+        self.seed(20)
+        large = self.measure_all()
+        self.assertIn('user-reserves', small)
+        self.assertEqual(small, large)
+
+
+class ConditionalRetrieveTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=self.city, address="1 St")
+        self.room = Room.objects.create(hotel=self.hotel, room_type='Single', price_per_night=100, stock=1)
+
+    def test_matching_etag_returns_304_without_database(self):
+        for url in [f'/api/cities/{self.city.id}/', f'/api/hotels/{self.hotel.id}/', f'/api/rooms/{self.room.id}/']:
+            etag = self.client.get(url)['ETag']
+            response, count = self.get_counting_queries(url, clear_cache=False, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(count, 0)
+
+    def test_stale_etag_returns_body(self):
+        url = f'/api/hotels/{self.hotel.id}/'
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], "Test Hotel")
+
+    def test_nested_city_change_invalidates_room(self):
+        url = f'/api/rooms/{self.room.id}/?expand=hotel.city'
+        etag = self.client.get(url)['ETag']
+        self.city.name = "Renamed"
+        self.city.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['hotel']['city']['name'], "Renamed")
+
+    def test_deleted_object_is_not_served_from_cache(self):
+        url = f'/api/hotels/{self.hotel.id}/'
+        self.client.get(url)
+        self.hotel.delete()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncReadPathTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', password='userpass', email='user@example.com')
+        city = City.objects.create(name="Test City")
+        self.hotels = [
+            Hotel.objects.create(name=f"Hotel {i}", description="Nice", city=city, address=f"{i} St")
+            for i in range(5)
+        ]
+        self.hotel = self.hotels[0]
+        for i in range(3):
+            Room.objects.create(hotel=self.hotel, room_type='Double', price_per_night=100 + i, stock=1)
+            Review.objects.create(user=self.user, hotel=self.hotel, rating=3 + i, comment=f"Stay {i}")
+
+    def get_json(self, url, data=None, **extra):
+        response = self.client.get(url, data, **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        return response, json.loads(response.content)
+
+    def collect(self, url, data, key='results'):
+        items = []
+        while url:
+            _, body = self.get_json(url, data)
+            items.extend(body[key])
+            url, data = body['next'], None
+        return items
+
+    def test_bodies_match_the_sync_endpoints(self):
+        search = {'check_in': '2025-06-01', 'check_out': '2025-06-03', 'page_size': 1}
+        pairs = [
+            ('/api/hotels/', '/api/async/hotels/', {'page_size': 2, 'ordering': '-id'}, 'results'),
+            (f'/api/hotels/{self.hotel.id}/rooms/', f'/api/async/hotels/{self.hotel.id}/rooms/',
+             {'page_size': 2}, 'results'),
+            (f'/api/hotels/{self.hotel.id}/reviews/', f'/api/async/hotels/{self.hotel.id}/reviews/',
+             {'page_size': 2}, 'reviews'),
+            ('/api/search/', '/api/async/search/', search, 'results'),
+        ]
+        for sync_url, async_url, params, key in pairs:
+            with self.subTest(url=async_url):
+                expected = self.collect(sync_url, params, key)
+                self.assertTrue(expected)
+                self.assertEqual(self.collect(async_url, params, key), expected)
+
+    def test_cursors_are_interchangeable(self):
+        _, body = self.get_json('/api/hotels/', {'page_size': 2})
+        cursor = body['next'].split('cursor=')[1].split('&')[0]
+        _, async_body = self.get_json('/api/async/hotels/', {'page_size': 2, 'cursor': cursor})
+        self.assertEqual([hotel['id'] for hotel in async_body['results']], [hotel.id for hotel in self.hotels[2:4]])
+
+    def test_detail_shares_cache_and_etag(self):
+        response, body = self.get_json(f'/api/async/hotels/{self.hotel.id}/')
+        self.assertEqual(body['name'], self.hotel.name)
+        sync_response = self.client.get(f'/api/hotels/{self.hotel.id}/')
+        self.assertEqual(sync_response['ETag'], response['ETag'])
+
+        DataCollector().clear()
+        with CaptureQueriesContext(connection) as context:
+            not_modified = self.client.get(f'/api/async/hotels/{self.hotel.id}/',
+                                           HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([query for query in context.captured_queries if 'mainapp_' in query['sql']])
+
+        Hotel.objects.filter(pk=self.hotel.pk).update(name="Renamed")
+        self.hotel.refresh_from_db()
+        self.hotel.save()
+        _, body = self.get_json(f'/api/async/hotels/{self.hotel.id}/')
+        self.assertEqual(body['name'], "Renamed")
+
+    def test_errors_use_drf_shapes(self):
+        response = self.client.get('/api/async/search/', {'check_in': '2025-06-03', 'check_out': '2025-06-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', json.loads(response.content))
+        response = self.client.get('/api/async/hotels/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        missing = self.client.get('/api/async/hotels/999999/')
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(missing['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(missing.content), json.loads(self.client.get('/api/hotels/999999/').content))
+        self.assertEqual(self.client.post('/api/async/hotels/').status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_views_are_coroutines(self):
+        for pattern in api_url_patterns():
+            if pattern.name.startswith('async-'):
+                self.assertTrue(asyncio.iscoroutinefunction(pattern.callback), pattern.name)
+
+
+class LoadTestSuiteTestCase(APITestCase):
+    def test_every_api_url_has_a_scenario(self):
+        routes = dict(loadtest.api_endpoints())
+        self.assertEqual(set(routes) - loadtest.SCENARIOS.keys(), set())
+        self.assertIn('/api/hotels/{hotel_id}/rooms/', routes.values())
+        self.assertEqual(routes['city-detail'], '/api/cities/{pk}/')
+
+    def test_small_run_succeeds(self):
+        loadtest.seed(hotels=6, rooms_per_hotel=2, users=3, bookings=12, reviews=12)
+        self.assertEqual(Hotel.objects.count(), 6)
+        self.assertEqual(Hotel.objects.filter(rating_count__gt=0).count(),
+                         Review.objects.values('hotel').distinct().count())
+        pools = loadtest.Pools()
+        pools.load()
+
+        results = loadtest.run(pools, requests=2, concurrency=1)
+
+        self.assertEqual(len(results), len(list(loadtest.api_endpoints())))
+        self.assertEqual([(result.route, result.errors) for result in results if result.errors], [])
+        for result in results:
+            self.assertGreater(result.requests, 0, result.route)
+            self.assertGreaterEqual(result.p99, result.p50)
+
+        loadtest.seed(hotels=6, rooms_per_hotel=2, users=3, bookings=12, reviews=12)
+        self.assertEqual(Hotel.objects.count(), 6)
+
+    def test_regressions_flag_latency_and_query_growth(self):
+        result = loadtest.Result('hotel-list', '/api/hotels/', 10, [], 5.0, 13.0, 20.0, 100.0, 2)
+        baseline = {'/api/hotels/': {'p95': 10.0, 'queries': 1}}
+        self.assertEqual(len(loadtest.regressions([result], baseline, threshold=0.25)), 2)
+        self.assertEqual(loadtest.regressions([result], {'/api/hotels/': {'p95': 11.0, 'queries': 2}}, 0.25), [])
+
+
+@override_settings(METRICS_TOKEN='s3cret')
+class MetricsEndpointTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        city = City.objects.create(name="Test City")
+        self.hotel = Hotel.objects.create(name="Test Hotel", description="Nice", city=city, address="1 St")
+
+    def scrape(self, **extra):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret', **extra)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode().splitlines()
+
+    def test_records_requests_latency_queries_and_cache(self):
+        self.client.get('/api/hotels/')
+        self.client.get('/api/hotels/')
+        lines = self.scrape()
+        self.assertIn('http_requests_total{method="GET",status="200",view="hotel-list"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{method="GET",view="hotel-list"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",view="hotel-list",le="+Inf"} 2', lines)
+        self.assertIn('cache_requests_total{cache="hotels_list",result="miss"} 1', lines)
+        self.assertIn('cache_requests_total{cache="hotels_list",result="hit"} 1', lines)
+        self.assertTrue(any(line.startswith('db_queries_total{view="hotel-list"}') for line in lines))
+
+    def test_counts_queries_of_async_views(self):
+        self.client.get(f'/api/async/hotels/{self.hotel.id}/')
+        lines = self.scrape()
+        self.assertTrue(any(line.startswith('db_queries_total{view="async-hotel-detail"}') for line in lines))
+        self.assertIn('cache_requests_total{cache="hotel_detail",result="miss"} 1', lines)
+
+    def test_counts_throttle_rejections(self):
+        class OnePerMinute(throttling.BurstRateThrottle):
+            THROTTLE_RATES = {'burst': '1/min'}
+
+        request = Request(APIRequestFactory().get('/api/hotels/'))
+        throttle = OnePerMinute()
+        with mock.patch.object(throttling, 'get_rate_limiter', return_value=throttling.MemoryRateLimiter()):
+            self.assertTrue(throttle.allow_request(request, None))
+            self.assertFalse(throttle.allow_request(request, None))
+        self.assertIn('throttle_rejections_total{scope="burst"} 1', self.scrape())
+
+    def test_sums_snapshots_of_every_worker(self):
+        self.client.get('/api/hotels/')
+        other = {
+            'counters': {('http_requests_total', (('method', 'GET'), ('status', 200), ('view', 'hotel-list'))): 5},
+            'histograms': {},
+        }
+        cache.set(f'{metrics.METRIC_PREFIX}:worker:other:1', other)
+        cache.set(f'{metrics.METRIC_PREFIX}:worker:exited:1', other)
+        metrics.touch_worker('other:1')
+        with mock.patch.object(metrics.time, 'time', return_value=time.time() - metrics.WORKER_TTL - 1):
+            metrics.touch_worker('exited:1')
+        metrics.observe('booking_expired', 3)
+        lines = self.scrape()
+        self.assertIn('http_requests_total{method="GET",status="200",view="hotel-list"} 6', lines)
+        self.assertIn('booking_expired_sum 3', lines)
+        self.assertEqual(sorted(metrics.live_workers()), sorted(['other:1', metrics.registry.worker]))
+
+    def test_token_protects_the_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.scrape()
+
+    def test_without_a_token_only_debug_serves_the_endpoint(self):
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_200_OK)
+
+
+@modify_settings(MIDDLEWARE={'append': 'silk.middleware.SilkyMiddleware'})
+class ProfilingTestCase(APITestCase):
+    """Runs with the Silk middleware installed, also under settings that leave it out, like settings_bench."""
+
+    def setUp(self):
+        City.objects.create(name="Test City")
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        storage = SilkRequest._meta.get_field('prof_file').storage
+        patcher = mock.patch.object(storage, 'location', profiles.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # the last recorded request stays in silk's thread local and would EXPLAIN later tests' queries
+        self.addCleanup(DataCollector().clear)
+        self.profiles = profiles.name
+
+    def test_profile_storage_needs_no_silk_migration(self):
+        call_command('makemigrations', 'silk', check=True, dry_run=True, stdout=StringIO())
+
+    def test_settings_load_without_the_app(self):
+        # the intercept function imports mainapp.profiling when silk first calls it
+        script = "import sys, bookinghotel.settings; print('mainapp' in sys.modules)"
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                cwd=settings.BASE_DIR, check=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+    def test_requests_are_not_recorded_by_default(self):
+        self.assertEqual(self.client.get('/api/cities/').status_code, status.HTTP_200_OK)
+        self.assertFalse(SilkRequest.objects.exists())
+
+    def test_signed_header_records_sql_profile_and_call_graph(self):
+        response = self.client.get('/api/cities/', HTTP_X_PROFILE=profiling.make_token())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recorded = SilkRequest.objects.get(path='/api/cities/')
+        self.assertTrue(recorded.queries.filter(query__icontains='mainapp_city').exists())
+        self.assertTrue(recorded.pyprofile)
+        self.assertTrue(os.path.exists(os.path.join(self.profiles, recorded.prof_file.name)))
+
+        out = StringIO()
+        call_command('profile_graphs', stdout=out)
+        self.assertIn('Wrote 1 call graphs', out.getvalue())
+        dot_files = [name for name in os.listdir(self.profiles) if name.endswith('.dot')]
+        self.assertEqual(len(dot_files), 1)
+        with open(os.path.join(self.profiles, dot_files[0])) as graph:
+            self.assertTrue(graph.read().startswith('digraph'))
+
+    def test_forged_or_expired_token_is_ignored(self):
+        self.client.get('/api/cities/', HTTP_X_PROFILE=profiling.make_token() + 'x')
+        with self.settings(PROFILING_TOKEN_MAX_AGE=-1):
+            self.client.get('/api/cities/', HTTP_X_PROFILE=profiling.make_token())
+        self.assertFalse(SilkRequest.objects.exists())
+
+    def test_path_patterns_and_sample_rate(self):
+        with self.settings(PROFILING_PATHS=[r'^/api/cities/']):
+            self.client.get('/api/cities/')
+            self.client.get('/api/hotels/')
+        self.assertEqual(list(SilkRequest.objects.values_list('path', flat=True)), ['/api/cities/'])
+
+        with self.settings(PROFILING_SAMPLE_RATE=1.0):
+            self.client.get('/api/hotels/')
+        self.assertTrue(SilkRequest.objects.filter(path='/api/hotels/').exists())
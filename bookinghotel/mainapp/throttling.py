@@ -0,0 +1,143 @@
+"""Token bucket throttles with a burst and a sustained tier.
+
+Each tier is a bucket holding as many requests as its rate allows per period and refilling
+continuously, so ``5/minute`` allows 5 requests at once and then one every 12 seconds. Views pick
+their rates with ``throttle_scope``: ``<throttle_scope>.burst`` and ``<throttle_scope>.sustained``
+when configured, the plain ``burst`` and ``sustained`` rates otherwise.
+
+Buckets live in the ``RATE_LIMITER`` backend: ``RedisRateLimiter`` updates a bucket with a single
+Lua script call, so concurrent workers never lose a hit; ``MemoryRateLimiter`` is the in-process
+stand-in for tests and single-process runs.
+"""
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+from . import metrics
+
+# KEYS[1] the bucket, ARGV[1] its capacity, ARGV[2] the milliseconds it takes to refill from empty.
+# Returns {1, 0} when a token was taken, {0, milliseconds until the next one} otherwise.
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = capacity
+if bucket[1] then
+    tokens = math.min(capacity, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * capacity / period)
+end
+local allowed, wait = 0, 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = math.ceil((1 - tokens) * period / capacity)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(period))
+return {allowed, wait}
+"""
+
+
+class RedisRateLimiter:
+    """Token buckets in the Redis of the default cache, timed by the Redis clock."""
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+
+        self.script = get_redis_connection('default').register_script(TOKEN_BUCKET)
+
+    def hit(self, key, limit, period):
+        """Takes a token from the bucket; returns whether there was one and the seconds until the next."""
+        allowed, wait = self.script(keys=[key], args=[limit, int(period * 1000)])
+        return bool(allowed), wait / 1000
+
+
+class MemoryRateLimiter:
+    """The same token buckets in process memory; buckets are never evicted."""
+    timer = time.monotonic
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        with self.lock:
+            now = self.timer()
+            tokens, at = self.buckets.get(key, (limit, now))
+            tokens = min(limit, tokens + max(0, now - at) * limit / period)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return True, 0
+            self.buckets[key] = (tokens, now)
+            return False, (1 - tokens) * period / limit
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+@lru_cache
+def get_rate_limiter():
+    return import_string(settings.RATE_LIMITER)()
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(*, setting, **kwargs):
+    # a changed RATE_LIMITER, e.g. under override_settings, starts from fresh buckets
+    if setting == 'RATE_LIMITER':
+        get_rate_limiter.cache_clear()
+
+
+class MeteredThrottleMixin:
+    def allow_request(self, request, view):
+        allowed = super().allow_request(request, view)
+        if not allowed:
+            metrics.registry.inc('throttle_rejections_total', scope=self.scope)
+        return allowed
+
+
+class TokenBucketThrottle(throttling.SimpleRateThrottle):
+    """One tier of the view's rate limit, per user, or per client IP for anonymous requests."""
+    tier = None
+
+    def __init__(self):
+        # the rate depends on the view, so it is looked up in allow_request
+        pass
+
+    def allow_request(self, request, view):
+        scoped = f"{getattr(view, 'throttle_scope', None)}.{self.tier}"
+        self.scope = scoped if scoped in self.THROTTLE_RATES else self.tier
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        allowed, self.retry_after = get_rate_limiter().hit(
+            self.get_cache_key(request, view), self.num_requests, self.duration
+        )
+        return allowed
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{self.scope}:{ident}'
+
+    def wait(self):
+        return self.retry_after
+
+
+class BurstRateThrottle(MeteredThrottleMixin, TokenBucketThrottle):
+    tier = 'burst'
+
+
+class SustainedRateThrottle(MeteredThrottleMixin, TokenBucketThrottle):
+    tier = 'sustained'
@@ -0,0 +1,92 @@
+"""Direct-to-storage uploads of hotel and room images.
+
+An admin asks for a presigned PUT URL, sends the file straight to the MinIO bucket and then confirms
+the upload, which moves it out of ``UPLOAD_PREFIX`` and attaches it to the image field. Uploads
+that are never confirmed, or are too large to be, are left under the prefix, where the bucket's
+lifecycle rule expires them. With the S3 backend the bytes never reach the app servers; any other
+default storage (tests, local runs without MinIO) is served by a stand-in PUT endpoint that
+honours the same contract.
+"""
+import posixpath
+import uuid
+from functools import lru_cache
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .models import Hotel, Room
+
+UPLOAD_TARGETS = {'hotels': Hotel, 'rooms': Room}
+CONTENT_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
+SALT = 'mainapp.uploads'
+# minio-init/init.sh expires objects under it after a day
+UPLOAD_PREFIX = 'uploads/'
+
+
+@lru_cache
+def _presigning_client():
+    # signing is local, so the client can point at the address browsers use rather than the internal one
+    return boto3.client(
+        's3',
+        endpoint_url=settings.MINIO_PUBLIC_ENDPOINT,
+        aws_access_key_id=settings.MINIO_ACCESS_KEY,
+        aws_secret_access_key=settings.MINIO_SECRET_KEY,
+        region_name='us-east-1',
+        config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}),
+    )
+
+
+def image_storage(target):
+    return UPLOAD_TARGETS[target]._meta.get_field('image').storage
+
+
+def issue(request, target, pk, content_type):
+    """A one-off key under the field's upload_to, with the URL to PUT it to and the token to confirm it."""
+    field = UPLOAD_TARGETS[target]._meta.get_field('image')
+    key = UPLOAD_PREFIX + posixpath.join(field.upload_to, f'{uuid.uuid4().hex}{CONTENT_TYPES[content_type]}')
+    token = signing.dumps({'target': target, 'pk': pk, 'key': key, 'content_type': content_type}, salt=SALT)
+    expires_in = settings.IMAGE_UPLOAD_URL_EXPIRY
+    if isinstance(field.storage, S3Boto3Storage):
+        url = _presigning_client().generate_presigned_url(
+            'put_object',
+            Params={'Bucket': field.storage.bucket_name, 'Key': key, 'ContentType': content_type},
+            ExpiresIn=expires_in,
+            HttpMethod='PUT',
+        )
+    else:
+        url = request.build_absolute_uri(reverse('image-upload-stand-in', kwargs={'token': token}))
+    return {
+        'method': 'PUT',
+        'url': url,
+        'headers': {'Content-Type': content_type},
+        'key': key,
+        'upload_token': token,
+        'expires_in': expires_in,
+    }
+
+
+def attached_name(key):
+    """The storage name a confirmed upload is moved to."""
+    return key[len(UPLOAD_PREFIX):]
+
+
+def attach(storage, key):
+    """Moves an upload out of UPLOAD_PREFIX and returns its storage name."""
+    name = attached_name(key)
+    if isinstance(storage, S3Boto3Storage):
+        # a server-side copy: the bytes stay in the bucket
+        storage.bucket.copy({'Bucket': storage.bucket_name, 'Key': key}, name)
+    else:
+        with storage.open(key) as upload:
+            name = storage.save(name, upload)
+    storage.delete(key)
+    return name
+
+
+def read_token(token, max_age):
+    """The upload a token was issued for; raises signing.BadSignature when forged or too old."""
+    return signing.loads(token, salt=SALT, max_age=max_age)
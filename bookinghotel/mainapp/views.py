@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from . import metrics
+from .uploads import image_storage, read_token
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        # per-view traffic and query counts are not public; without a token only local development sees them
+        allowed = settings.DEBUG
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+def upload_stand_in_view(request, token):
+    """Plays the bucket for presigned uploads when the default storage is not S3, e.g. in tests."""
+    try:
+        upload = read_token(token, settings.IMAGE_UPLOAD_URL_EXPIRY)
+    except signing.BadSignature:
+        return HttpResponseForbidden()
+    storage = image_storage(upload['target'])
+    if isinstance(storage, S3Boto3Storage):
+        raise Http404
+    # a presigned URL is signed for one content type, so S3 would refuse any other too
+    if request.content_type != upload['content_type']:
+        return HttpResponseForbidden()
+    body = request.read(settings.IMAGE_UPLOAD_MAX_BYTES + 1)
+    if len(body) > settings.IMAGE_UPLOAD_MAX_BYTES:
+        return HttpResponse(status=413)
+    storage.delete(upload['key'])
+    storage.save(upload['key'], ContentFile(body))
+    return HttpResponse()
@@ -6,3 +6,6 @@ sleep 10
 mc alias set myminio http://minio:9000 "$MINIO_ROOT_USER" "$MINIO_ROOT_PASSWORD"
 mc mb myminio/media || true
 mc anonymous set download myminio/media
+# direct uploads that were never confirmed, or were too large to be (mainapp.uploads.UPLOAD_PREFIX)
+mc ilm rule ls myminio/media 2>/dev/null | grep -q 'uploads/' \
+  || mc ilm rule add --prefix uploads/ --expire-days 1 myminio/media